@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+批量字段提取 - 对已保存的OCR拼接文本（【行1】【行2】…）整列提取字段，用于重新处理归档语料
+每条规则对整列执行一次 pandas 字符串操作（str.extract / str.findall），只作用于尚未取到该字段、
+且含有规则关键词的行；规则、优先级、取值与校验和 FieldExtractor 的逐页提取一致（没有每页时间预算）。
+语料按块处理，百万条文本不会同时展开全部匹配结果。
+
+用法：
+  python BulkExtractor.py <语料文件> [--output 结果.csv|结果.parquet] [--chunk-rows 100000] [--workers N]
+      语料为 corpus_file 采集的 JSON 行或每行一条纯文本；不指定 --output 时只输出各字段的取到率
+      单进程约 2 万条/秒（百万条约一分钟），--workers 按块分给多个进程
+"""
+
+import sys
+import time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from FieldExtractor import (AMOUNT_FALLBACK, AMOUNT_FALLBACK_KEYWORDS, AMOUNT_PRIORITY_RULES, AMOUNT_SECONDARY_RULES,
+                            COMPANY_LOOSE, COMPANY_LOOSE_KEYWORDS, COMPANY_LOOSE_REJECT, COMPANY_PREFIX, COMPANY_REJECT,
+                            COMPANY_RULES, DATE_RULES, FIELD_AMOUNT, FIELD_COMPANY, FIELD_DATE, FIELD_NUMBER,
+                            FIELD_PROJECT, MAX_AMOUNT, MIN_AMOUNT, NUMBER_RULES, PROJECT_NOISE, PROJECT_RULES,
+                            read_corpus)
+
+# 结果列（与逐页提取结果 [文件路径, ...] 去掉文件路径后的顺序一致）
+BULK_COLUMNS = [FIELD_COMPANY, FIELD_NUMBER, FIELD_DATE, FIELD_AMOUNT, FIELD_PROJECT]
+DEFAULT_CHUNK_ROWS = 100000
+
+
+def _as_text_series(texts):
+    """Series / pyarrow 数组 / 字符串列表 -> object 列（缺失值为空串）
+    统一转成 Python 字符串，保证 str.extract 使用内置 re，与逐页提取的正则语义相同
+    """
+    import pandas as pd  # 延迟导入
+    if hasattr(texts, "to_pandas"):  # pyarrow Array / ChunkedArray
+        texts = texts.to_pandas()
+    if not isinstance(texts, pd.Series):
+        texts = pd.Series(list(texts), dtype=object)
+    return texts.fillna("").astype(str).astype(object)
+
+
+class _Chunk:
+    """一块文本（行号连续）：正则提取用的文本列，以及筛选候选行用的字符串列表"""
+
+    def __init__(self, texts):
+        self.texts = texts
+        self._values = texts.tolist()
+
+    def candidates(self, found, *keywords):
+        """尚未取到字段、且含任一规则关键词（不给关键词时不限）的行
+        关键词只在尚未取到字段的行上判断（子串判断比 str.contains 的逐行回调快一倍）
+        """
+        import numpy as np  # 延迟导入
+        remaining = np.flatnonzero(~found)
+        if keywords and len(remaining):
+            values = self._values
+            if len(keywords) == 1:
+                keyword = keywords[0]
+                hits = [keyword in values[row] for row in remaining]
+            else:
+                hits = [any(keyword in values[row] for keyword in keywords) for row in remaining]
+            remaining = remaining[np.asarray(hits, dtype=bool)]
+        return self.texts.iloc[remaining]
+
+
+def _all_matches(rows, source):
+    """每行的全部匹配（同 findall，按出现顺序；正则只有一个分组），索引为行号，同一行有多项"""
+    return rows.str.findall(source).explode().dropna()
+
+
+def _store(result, found, values):
+    if len(values):
+        result[values.index] = values
+        found[values.index] = True
+
+
+def _first_valid(rows, source, clean):
+    """每行第一个通过校验的匹配：先只取第一个匹配，校验不通过的行再展开全部匹配"""
+    first = rows.str.extract(source, expand=False).dropna()
+    values, valid = clean(first)
+    retry = first.index[~valid]
+    if not len(retry):
+        return values[valid]
+    others, others_valid = clean(_all_matches(rows[retry], source))
+    return values[valid].combine_first(others[others_valid].groupby(level=0).first())
+
+
+def _clean_company(values):
+    values = values.str.strip().str.replace(COMPANY_PREFIX.pattern, "", regex=True).str.strip()
+    return values, ((values.str.len() >= 2) & ~values.str[:1].str.isdigit()
+                    & ~values.str.contains(COMPANY_REJECT.pattern)).to_numpy(dtype=bool)
+
+
+def _clean_loose_company(values):
+    values = values.str.strip()
+    return values, ((values.str.len() >= 3) & ~values.str[:1].str.isdigit()
+                    & ~values.str.contains(COMPANY_LOOSE_REJECT.pattern)).to_numpy(dtype=bool)
+
+
+def _new_field(chunk, fill=""):
+    import numpy as np  # 延迟导入
+    import pandas as pd  # 延迟导入
+    size = len(chunk.texts)
+    return pd.Series([fill] * size, dtype=object if fill == "" else float), np.zeros(size, dtype=bool)
+
+
+def extract_company(chunk):
+    result, found = _new_field(chunk)
+    for keyword, source in COMPANY_RULES:
+        rows = chunk.candidates(found, keyword)
+        if len(rows):
+            _store(result, found, _first_valid(rows, source, _clean_company))
+    # 兜底：包含“公司”“厂”“店”等字样的文本
+    rows = chunk.candidates(found, *COMPANY_LOOSE_KEYWORDS)
+    if len(rows):
+        _store(result, found, _first_valid(rows, COMPANY_LOOSE, _clean_loose_company))
+    prefixed = result.str.startswith("名称：")
+    result[prefixed] = result[prefixed].str[3:].str.strip()
+    return result
+
+
+def extract_number(chunk):
+    result, found = _new_field(chunk)
+    for keyword, source in NUMBER_RULES:
+        rows = chunk.candidates(found, *([keyword] if keyword else []))
+        if len(rows):
+            _store(result, found, rows.str.extract(source, expand=False).dropna())
+    return result
+
+
+def extract_date(chunk):
+    """每条规则只看第一个匹配，不是有效日期时换下一条规则"""
+    result, found = _new_field(chunk)
+    for keyword, source in DATE_RULES:
+        rows = chunk.candidates(found, *([keyword] if keyword else []))
+        if not len(rows):
+            continue
+        parts = rows.str.extract(source).dropna()
+        if parts.empty:
+            continue
+        year, month, day = (parts[column].astype(int) for column in range(3))
+        valid = (year >= 2000) & (year <= 2030) & (month >= 1) & (month <= 12) & (day >= 1) & (day <= 31)
+        values = (year[valid].astype(str) + month[valid].astype(str).str.zfill(2)
+                  + day[valid].astype(str).str.zfill(2))
+        _store(result, found, values)
+    return result
+
+
+def extract_amount(chunk):
+    """按优先级取该规则所有匹配中的最大金额；都落空时取最后一个 ¥ 金额。未取到为 NaN"""
+    result, found = _new_field(chunk, float("nan"))
+    for keyword, source in AMOUNT_PRIORITY_RULES + AMOUNT_SECONDARY_RULES:
+        rows = chunk.candidates(found, keyword)
+        if not len(rows):
+            continue
+        amounts = _all_matches(rows, source).astype(float)
+        amounts = amounts[(amounts >= MIN_AMOUNT) & (amounts <= MAX_AMOUNT)]
+        _store(result, found, amounts.groupby(level=0).max())
+    rows = chunk.candidates(found, *AMOUNT_FALLBACK_KEYWORDS)
+    if len(rows):
+        last = _all_matches(rows, AMOUNT_FALLBACK).groupby(level=0).last().astype(float)
+        _store(result, found, last[(last >= MIN_AMOUNT) & (last <= MAX_AMOUNT)])
+    return result
+
+
+def extract_project(chunk):
+    """每条规则只看第一个匹配；【*分类*名称】格式取名称部分"""
+    result, found = _new_field(chunk)
+    for keyword, source in PROJECT_RULES:
+        rows = chunk.candidates(found, keyword)
+        if not len(rows):
+            continue
+        parts = rows.str.extract(source).dropna()
+        if parts.empty:
+            continue
+        values = parts[parts.columns[-1]].str.strip().str.replace(PROJECT_NOISE.pattern, "", regex=True).str.strip()
+        _store(result, found, values[values.str.len() > 1])
+    return result
+
+
+def _extract_chunk(texts):
+    import pandas as pd  # 延迟导入
+    chunk = _Chunk(texts)
+    return pd.DataFrame({
+        FIELD_COMPANY: extract_company(chunk),
+        FIELD_NUMBER: extract_number(chunk),
+        FIELD_DATE: extract_date(chunk),
+        FIELD_AMOUNT: extract_amount(chunk),
+        FIELD_PROJECT: extract_project(chunk),
+    }, columns=BULK_COLUMNS)
+
+
+def extract_bulk(texts, chunk_rows=DEFAULT_CHUNK_ROWS, progress=None, workers=1):
+    """整列提取字段，返回 DataFrame（列为 BULK_COLUMNS，索引与输入一致）
+    texts: OCR拼接文本列（pandas Series、pyarrow 数组或字符串列表）
+    未取到的文本字段为空串，金额为 NaN；progress(已处理条数, 总条数) 在每块完成后调用
+    workers > 1 时各块分给多个进程提取（spawn 方式启动，结果按块顺序合并）
+    """
+    import pandas as pd  # 延迟导入
+    texts = _as_text_series(texts)
+    total = len(texts)
+    chunk_rows = max(1, int(chunk_rows))
+    # 块内使用连续的行号（输入索引可能重复）
+    chunks = [texts.iloc[start:start + chunk_rows].reset_index(drop=True) for start in range(0, total, chunk_rows)]
+    if not chunks:
+        return _extract_chunk(texts.iloc[:0].reset_index(drop=True)).set_axis(texts.index)
+
+    frames = []
+    executor = None
+    if workers > 1 and len(chunks) > 1:
+        executor = ProcessPoolExecutor(max_workers=min(int(workers), len(chunks)),
+                                       mp_context=multiprocessing.get_context("spawn"))
+    try:
+        done = 0
+        for frame in (executor.map(_extract_chunk, chunks) if executor else map(_extract_chunk, chunks)):
+            frames.append(frame.set_axis(range(done, done + len(frame))))
+            done += len(frame)
+            if progress is not None:
+                progress(done, total)
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+    return pd.concat(frames).set_axis(texts.index)
+
+
+def bulk_results(frame, paths):
+    """批量结果 -> 逐页提取的结果行格式 [文件路径, 开票公司名称, 发票号码, 发票日期, 金额, 项目名称]（未取到的金额为空串）"""
+    rows = []
+    for path, values in zip(paths, frame.itertuples(index=False, name=None)):
+        row = [path] + list(values)
+        if row[4] != row[4]:  # NaN
+            row[4] = ''
+        rows.append(row)
+    return rows
+
+
+def main(argv=None):
+    argv = list(sys.argv[1:] if argv is None else argv)
+    if not argv:
+        print(__doc__)
+        return 1
+    options = {name.lstrip("-"): value for name, value in zip(argv[1::2], argv[2::2])}
+
+    texts = read_corpus(argv[0])
+    started = time.perf_counter()
+    frame = extract_bulk(texts, int(options.get("chunk-rows", DEFAULT_CHUNK_ROWS)),
+                         progress=lambda done, total: print(f"已提取 {done}/{total}"),
+                         workers=int(options.get("workers", 1)))
+    elapsed = time.perf_counter() - started
+    print(f"语料: {len(texts)} 条，耗时 {elapsed:.1f} 秒（{len(texts) / max(elapsed, 1e-9):.0f} 条/秒）")
+    for column in BULK_COLUMNS:
+        values = frame[column]
+        hits = values.notna().sum() if column == FIELD_AMOUNT else (values != "").sum()
+        print(f"  {column}: {hits / max(1, len(frame)):.1%}")
+
+    output = options.get("output")
+    if output:
+        if output.lower().endswith(".parquet"):
+            frame.to_parquet(output, index=False)
+        else:
+            frame.to_csv(output, index=False, encoding="utf-8-sig")
+        print(f"结果已写入: {output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+协作式取消 - 取消令牌在 PDF 转换、OCR 批处理与任务调度之间传递
+各处理循环在每页（或每个识别批次）之前检查令牌，取消后尽快停止并保留已完成的结果。
+"""
+
+import threading
+
+
+class OperationCancelled(Exception):
+    """操作已被取消"""
+
+
+class CancellationToken:
+    """取消令牌：cancel() 可在任意线程调用；父令牌取消时子令牌一并取消"""
+
+    def __init__(self, parent=None):
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._callbacks = []
+        if parent is not None:
+            parent.on_cancel(self.cancel)
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    def cancel(self):
+        """请求取消，并调用已注册的回调（只执行一次）"""
+        with self._lock:
+            if self._event.is_set():
+                return
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                print(f"取消回调出错: {e}")
+
+    def raise_if_cancelled(self):
+        """已取消时抛出 OperationCancelled"""
+        if self._event.is_set():
+            raise OperationCancelled()
+
+    def on_cancel(self, callback):
+        """注册取消回调（已取消时立即调用），返回注销函数"""
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return lambda: self._remove_callback(callback)
+        callback()
+        return lambda: None
+
+    def wait(self, timeout=None):
+        """等待取消，返回是否已取消"""
+        return self._event.wait(timeout)
+
+    def _remove_callback(self, callback):
+        with self._lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
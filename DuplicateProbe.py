@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+重复发票预检 - 在 PDF 转图片与整页OCR之前去重
+1) 文件内容哈希：与本次会话或发票库中已处理过的文件逐字节相同时，整个文件跳过；
+2) 发票号码探测：读取 PDF 文本层（电子发票）或页面左上角二维码得到发票号码，
+   号码已识别过的页面不再渲染和OCR。探测不到号码的页面照常识别。
+"""
+
+import os
+import re
+import hashlib
+import threading
+
+from resource_utils import load_config_section
+from StructuredLog import get_logger
+
+log = get_logger("DuplicateProbe")
+
+# 预检默认参数（可在 offline_config.json 的 "dedup" 节覆盖）
+DEFAULT_DEDUP_CONFIG = {
+    "skip_identical_files": True,   # 跳过内容完全相同的文件
+    "probe_numbers": True,          # 读取文本层/二维码中的发票号码，跳过已识别过的页面
+    "probe_qr": True,               # 文本层没有号码时解码二维码（需要 OpenCV）
+    "qr_zoom": 2.0,                 # 二维码区域的渲染缩放
+}
+
+# 文本层中的发票号码（与OCR结果的号码规则一致：6~20位数字）
+_NUMBER_PATTERNS = [
+    re.compile(r'发票号码\s*[：:]?\s*([0-9]{6,20})'),
+    re.compile(r'No\s*[：:.]?\s*([0-9]{8,20})'),
+]
+
+_HASH_CHUNK = 1 << 20
+
+
+def load_dedup_config():
+    """读取预检配置"""
+    return load_config_section("dedup", DEFAULT_DEDUP_CONFIG)
+
+
+def file_digest(path):
+    """文件内容的 SHA-256"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(_HASH_CHUNK), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def number_from_text(text):
+    """从页面文本层中提取发票号码，没有时返回空字符串"""
+    for pattern in _NUMBER_PATTERNS:
+        match = pattern.search(text or "")
+        if match:
+            return match.group(1)
+    return ""
+
+
+def number_from_qr_payload(payload):
+    """增值税发票二维码内容：版本,类型,发票代码,发票号码,金额,日期,校验码,...（全电发票代码为空）"""
+    parts = (payload or "").split(",")
+    if len(parts) > 3 and re.fullmatch(r"[0-9]{8,20}", parts[3].strip()):
+        return parts[3].strip()
+    return ""
+
+
+def _number_from_qr(page, zoom):
+    """渲染页面左上四分之一（发票二维码所在位置）并解码"""
+    import cv2  # 延迟导入
+    import fitz  # 延迟导入
+    import numpy as np  # 延迟导入
+
+    rect = page.rect
+    clip = fitz.Rect(rect.x0, rect.y0, rect.x0 + rect.width / 2, rect.y0 + rect.height / 2)
+    pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), clip=clip, colorspace=fitz.csGRAY, alpha=False)
+    image = np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.height, pix.stride)[:, :pix.width]
+    payload, _, _ = cv2.QRCodeDetector().detectAndDecode(np.ascontiguousarray(image))
+    return number_from_qr_payload(payload)
+
+
+def probe_pdf_numbers(pdf_path, use_qr=True, qr_zoom=2.0):
+    """逐页探测发票号码 {页下标: 发票号码}（只包含探测到号码的页面）"""
+    import fitz  # 延迟导入
+
+    numbers = {}
+    qr_available = use_qr
+    with fitz.open(pdf_path) as document:
+        for page_index, page in enumerate(document):
+            number = number_from_text(page.get_text())
+            if not number and qr_available:
+                try:
+                    number = _number_from_qr(page, qr_zoom)
+                except ImportError:
+                    qr_available = False  # 没有 OpenCV 时只读文本层
+                except Exception as e:
+                    log.debug("二维码探测失败: %s 第%d页 - %s", pdf_path, page_index + 1, e)
+            if number:
+                numbers[page_index] = number
+    return numbers
+
+
+class DuplicateClaim:
+    """一个子任务的预检结果；子任务结束后交回 DuplicateFilter.finish"""
+
+    def __init__(self):
+        self.digests = {}           # 本子任务首次出现的文件哈希 -> 文件路径
+        self.numbers = set()        # 本子任务首次出现的发票号码
+        self.duplicate_files = {}   # 跳过的文件 -> 内容相同的已处理文件
+        self.skipped_pages = {}     # 跳过的页下标 -> 发票号码
+
+    def as_result(self):
+        """写入子任务结果的去重信息（无跳过时为空dict）"""
+        info = {}
+        if self.duplicate_files:
+            info["duplicate_files"] = dict(self.duplicate_files)
+        if self.skipped_pages:
+            info["skipped_pages"] = dict(self.skipped_pages)
+        return info
+
+
+class DuplicateFilter:
+    """会话内的去重状态（工作线程并发调用，内部加锁）
+
+    文件哈希与发票号码在预检时即占用，后到的相同文件/号码直接跳过；
+    子任务失败或取消时释放占用，成功时把文件哈希写入发票库，供之后的会话跳过。
+    首个文件仍在处理时跳过的相同文件先记下，首个文件失败或取消时通过 on_readmit(文件路径, owner) 重新放行。
+    """
+
+    def __init__(self, config=None, store=None, session="", on_readmit=None):
+        self.config = config or load_dedup_config()
+        self.store = store
+        self.session = session
+        self.on_readmit = on_readmit
+        self._lock = threading.Lock()
+        self._files = {}      # 文件哈希 -> 首次出现的文件路径
+        self._waiting = {}    # 处理中的文件哈希 -> 因与其相同而跳过的 [(文件路径, owner)]
+        self._numbers = set()
+
+    def _claim_file(self, path, claim, owner=None):
+        """占用文件哈希；已处理过时返回首次出现的文件路径"""
+        if not self.config.get("skip_identical_files", True):
+            return None
+        try:
+            digest = file_digest(path)
+        except OSError as e:
+            log.warning("文件哈希计算失败，不做去重: %s - %s", path, e)
+            return None
+        with self._lock:
+            first = self._files.get(digest)
+            if first is None:
+                self._files[digest] = path
+                self._waiting[digest] = []
+            elif digest in self._waiting:
+                self._waiting[digest].append((path, owner))
+        if first is None and self.store is not None:
+            record = self.store.find_file(digest)
+            if record is not None:
+                first = record["path"]
+                with self._lock:
+                    self._waiting.pop(digest, None)  # 之前的会话已识别过，之后的相同文件不必等待
+        if first is not None:
+            claim.duplicate_files[path] = first
+            return first
+        claim.digests[digest] = path
+        return None
+
+    def check_pdf(self, pdf_path, owner=None):
+        """PDF预检：文件相同时整份跳过，否则探测各页发票号码，返回 DuplicateClaim
+        owner: 调用方的任务对象，跳过的文件重新放行时原样传给 on_readmit
+        """
+        claim = DuplicateClaim()
+        if self._claim_file(pdf_path, claim, owner) is not None or not self.config.get("probe_numbers", True):
+            return claim
+        try:
+            numbers = probe_pdf_numbers(pdf_path, self.config.get("probe_qr", True),
+                                        float(self.config.get("qr_zoom", 2.0)))
+        except Exception as e:
+            log.warning("发票号码探测失败，整份识别: %s - %s", pdf_path, e)
+            return claim
+        if not numbers:
+            return claim
+
+        known = self.store.find_numbers(numbers.values()) if self.store is not None else {}
+        with self._lock:
+            for page_index, number in sorted(numbers.items()):
+                # 同一份PDF的续页与首页号码相同，只与其他文件及发票库中的号码比较
+                if number in known or (number in self._numbers and number not in claim.numbers):
+                    claim.skipped_pages[page_index] = number
+                else:
+                    self._numbers.add(number)
+                    claim.numbers.add(number)
+        return claim
+
+    def check_images(self, folder_path, image_files, owner=None):
+        """图片预检：返回 (需要识别的图片, DuplicateClaim)；图片只按文件内容去重，owner 同 check_pdf"""
+        claim = DuplicateClaim()
+        kept = [name for name in image_files
+                if self._claim_file(os.path.join(folder_path, name), claim, owner) is None]
+        return kept, claim
+
+    def finish(self, claim, ok):
+        """子任务结束：成功时记录文件哈希，失败或取消时释放占用，允许之后重新识别，
+        并把等待这些文件结果而跳过的相同文件交给 on_readmit 重新识别
+        """
+        with self._lock:
+            waiting = [item for digest in claim.digests for item in self._waiting.pop(digest, ())]
+            if not ok:
+                for digest in claim.digests:
+                    self._files.pop(digest, None)
+                self._numbers.difference_update(claim.numbers)
+        if ok:
+            if self.store is not None and claim.digests:
+                try:
+                    self.store.add_files(claim.digests, self.session)
+                except Exception as e:
+                    log.warning("文件哈希写入发票库失败: %s", e)
+            return
+        if waiting:
+            log.info("%d 个相同文件的首个文件未识别成功，重新放行", len(waiting))
+        for path, owner in waiting:
+            if self.on_readmit is not None:
+                self.on_readmit(path, owner)
+
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+字段置信度 - 为每页提取出的字段打分，并挑出需要用高精引擎复核的页面
+置信度 = 识别置信度（取值所在文本行的 rec_score）× 规则/标签优先级权重 × 格式校验系数，范围 0~1。
+配置了已知销售方名录时，开票公司名称校正为名录中最接近的名称，置信度不低于匹配的相似度。
+快速模式下，关键字段置信度低于阈值的发票页面自动用高精引擎重新识别（必要时放大图片），
+逐字段保留置信度较高的一次结果。
+"""
+
+import re
+from datetime import date
+
+from FieldExtractor import (FIELD_AMOUNT, FIELD_COMPANY, FIELD_DATE, FIELD_INDEX, FIELD_NUMBER,
+                            COMPANY_LOOSE_KEYWORDS, extract_invoice_details)
+from resource_utils import load_config_section
+from StructuredLog import get_logger
+
+log = get_logger("FieldConfidence")
+
+# 复核默认参数（可在 offline_config.json 的 "refine" 节覆盖）
+DEFAULT_REFINE_CONFIG = {
+    "enabled": True,                                      # 低置信度页面自动用高精引擎复核
+    "min_confidence": 0.6,                                # 低于该值的字段视为低置信度
+    "fields": [FIELD_NUMBER, FIELD_DATE, FIELD_AMOUNT],   # 参与判断的字段（为空也算低置信度）
+    "zoom": 1.5,                                          # 复核时图片放大倍数（1 表示不放大）
+    "max_side": 4000,                                     # 放大后最长边不超过该值（像素）
+}
+
+_COMPANY_SUFFIX = re.compile('(?:' + '|'.join(COMPANY_LOOSE_KEYWORDS) + '|院|所|局|部|行|社|馆|站|学校|医院)')
+
+
+def load_refine_config():
+    """读取复核配置"""
+    return load_config_section("refine", DEFAULT_REFINE_CONFIG)
+
+
+def validation_factor(field, value):
+    """格式校验系数：格式完全符合时为 1，可疑时降低，为空时为 0"""
+    if value in (None, ''):
+        return 0.0
+    text = str(value)
+    if field == FIELD_NUMBER:
+        # 全电发票 20 位，旧版发票 8 位
+        return 1.0 if len(text) in (8, 20) else 0.7
+    if field == FIELD_DATE:
+        try:
+            parsed = date(int(text[:4]), int(text[4:6]), int(text[6:8]))
+        except ValueError:
+            return 0.3  # 如 2月30日
+        return 1.0 if parsed <= date.today() else 0.5  # 未来日期多为识别错误
+    if field == FIELD_AMOUNT:
+        try:
+            cents = float(value) * 100
+        except ValueError:
+            return 0.3
+        return 1.0 if abs(cents - round(cents)) < 1e-6 else 0.7  # 超过两位小数多为识别错误
+    if field == FIELD_COMPANY:
+        return 1.0 if _COMPANY_SUFFIX.search(text) else 0.7
+    return 1.0 if len(text) >= 2 else 0.6
+
+
+def _line_score(layout, first, last):
+    """文本行 first..last 的最低识别置信度"""
+    first, last = max(0, first), min(len(layout) - 1, max(first, last))
+    if last < first:
+        return 0.0
+    return float(layout.scores[first:last + 1].min())
+
+
+def field_confidences(result, layout, located, sources):
+    """各字段置信度 {字段名称: 0~1}
+    located: 模板/版面字段 {字段: (取值, 标签行, 取值行, 权重)}，行下标为 -1 表示票据类型的固定取值；
+    sources: 正则取值来源 {字段: (权重, 起点, 终点)}
+    """
+    confidences = {}
+    for field, index in FIELD_INDEX.items():
+        value = result[index] if index < len(result) else ''
+        if value in (None, ''):
+            confidences[field] = 0.0
+            continue
+        if field in located:
+            _, label_line, value_line, weight = located[field]
+            if value_line < 0:
+                score = 1.0
+            else:
+                score = _line_score(layout, min(label_line, value_line), max(label_line, value_line))
+        elif field in sources:
+            weight, start, end = sources[field]
+            score = _line_score(layout, layout.line_at(start), layout.line_at(max(start, end - 1)))
+        else:
+            weight, score = 0.5, 0.5
+        confidences[field] = round(score * weight * validation_factor(field, value), 2)
+    return confidences
+
+
+def extract_page_fields(layout, image_path):
+    """票据类型模板 + 版面配对 + 正则规则提取一页的字段
+    返回 (结果行（末尾追加票据类型）, {字段名称: 置信度})；前面的步骤取到的字段不再交给后面的步骤
+    """
+    # 延迟导入（版面配对、票据模板与销售方名录依赖 numpy；界面启动时只用到配置与阈值判断）
+    from PageLayout import extract_layout_fields, known_fields
+    from InvoiceTemplates import TYPE_OTHER, extract_template_fields
+    invoice_type, located = TYPE_OTHER, {}
+    try:
+        invoice_type, located = extract_template_fields(layout)
+    except Exception as e:
+        log.warning("票据模板提取失败，使用通用规则: %s", e)
+    if len(located) < len(FIELD_INDEX):
+        try:
+            for field, found in extract_layout_fields(layout).items():
+                located.setdefault(field, found)
+        except Exception as e:
+            log.warning("版面字段提取失败，使用正则规则: %s", e)
+    result, sources = extract_invoice_details(layout.text, image_path, known_fields(located))
+    confidences = field_confidences(result, layout, located, sources)
+    _correct_company(result, layout, confidences)
+    return result + [invoice_type], confidences
+
+
+def _correct_company(result, layout, confidences):
+    """开票公司名称校正为已知销售方名录中最接近的名称（未配置名录或没有足够接近的名称时不变）"""
+    from SellerIndex import correct_seller  # 延迟导入
+    index = FIELD_INDEX[FIELD_COMPANY]
+    value = result[index]
+    try:
+        match = correct_seller(value, layout.texts)
+    except Exception as e:
+        log.warning("销售方名录校正失败: %s", e)
+        return
+    if match is None:
+        return
+    name, similarity = match
+    if name != value:
+        log.debug("开票公司名称按名录校正: %s -> %s（相似度 %.2f）", value or '(空)', name, similarity)
+        result[index] = name
+    confidences[FIELD_COMPANY] = max(confidences.get(FIELD_COMPANY, 0.0), round(similarity, 2))
+
+
+def low_confidence_fields(confidences, config):
+    """低于阈值的字段（按配置中的字段列表）"""
+    threshold = float(config.get("min_confidence", 0.6))
+    return [field for field in config.get("fields") or ()
+            if confidences.get(field, 0.0) < threshold]
+
+
+def merge_fields(first, second):
+    """两次识别的结果逐字段取置信度较高者，返回 (结果行, 置信度)"""
+    from InvoiceTemplates import TYPE_INDEX, TYPE_OTHER  # 延迟导入
+    (result, confidences), (other, other_confidences) = first, second
+    merged, merged_confidences = list(result), dict(confidences)
+    for field, index in FIELD_INDEX.items():
+        if other_confidences.get(field, 0.0) > confidences.get(field, 0.0):
+            merged[index] = other[index]
+            merged_confidences[field] = other_confidences[field]
+    if merged[TYPE_INDEX] == TYPE_OTHER:
+        merged[TYPE_INDEX] = other[TYPE_INDEX]
+    return merged, merged_confidences
+
@@ -0,0 +1,684 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+发票字段提取引擎 - 从OCR拼接文本（【行1】【行2】…）中提取开票公司、发票号码、日期、金额、项目名称
+全部正则在创建提取器时预编译；先用一个关键词交替正则扫描全文，记录各关键词出现的位置，
+以关键词开头的规则只在这些位置上锚定匹配，不再对全文逐条 findall。
+没有关键词的兜底规则（宽松公司名、裸日期、¥金额等）仅在前面的规则都落空时才执行。
+各规则的优先级与取值方式与原逐条匹配的实现一致。
+
+正则引擎可选 RE2（google-re2，线性时间，不会因回溯卡住；逐次调用开销比内置 re 大，默认不用）；
+每页提取有时间预算，超时后放弃剩余规则。调试日志默认关闭（"extract" 节 debug，或 "logging" 节
+modules 中 FieldExtractor 设为 DEBUG）；关闭时不格式化任何调试消息。
+
+用法：
+  python FieldExtractor.py profile <语料文件> [--engine re|re2|auto] [--budget-ms 毫秒]
+      逐条提取语料（每行一条OCR拼接文本，或 corpus_file 采集的 JSON 行），输出每条规则的耗时与命中率
+"""
+
+import re
+import sys
+import json
+import time
+import logging
+import threading
+
+from resource_utils import load_config_section
+from StructuredLog import get_logger, set_module_level
+
+log = get_logger("FieldExtractor")
+
+# 字段提取默认参数（可在 offline_config.json 的 "extract" 节覆盖）
+DEFAULT_EXTRACT_CONFIG = {
+    "debug": False,          # 输出每个字段的提取过程（DEBUG 级别；大批量识别时会显著拖慢速度）
+    "engine": "re",          # 正则引擎：re / re2（google-re2，线性时间，但逐次调用开销较大）/ auto（已安装 RE2 时使用）
+    "time_budget_ms": 200,   # 每页提取的时间预算，超出后剩余字段留空；0 表示不限
+    "corpus_file": "",       # 非空时把每页的OCR拼接文本追加到该文件（JSON 行），用于 profile 分析
+    "spatial": True,         # 按文本框位置配对标签与取值（PageLayout），找不到的字段再用正则规则
+    "templates": True,       # 先识别票据类型，用该类型的模板规则取值（InvoiceTemplates）
+}
+
+# 规则: (关键词, 正则)；关键词为 None 的规则在全文上查找。
+# 正则只使用 RE2 也支持的语法（不用环视、反向引用），两种引擎结果一致。
+# 取值后到“【”或文本末尾为止（原实现用先行断言，这里直接匹配“【”，取值部分相同）
+_SEGMENT_END = r'(?:\s*【|$)'
+# RE2 的 $ 只匹配文本末尾，内置 re 的 $ 还匹配末尾换行之前；用 RE2 编译时换成等价写法
+_SEGMENT_END_RE2 = r'(?:\s*【|\n?$)'
+
+COMPANY_RULES = [
+    (keyword, keyword + r'[：:]\s*([^\n\r【】]{2,100}?)' + _SEGMENT_END)
+    for keyword in ('销售方名称', '销售方', '开票方名称', '开票方', '销售单位', '收款单位')
+]
+COMPANY_LOOSE_KEYWORDS = ('公司', '厂', '店', '中心', '集团', '企业')
+COMPANY_LOOSE = r'([^\n\r【】]{1,50}(?:' + '|'.join(COMPANY_LOOSE_KEYWORDS) + r')[^\n\r【】]{0,30})'
+SEGMENT_SEPARATORS = ('\n', '\r', '【', '】')
+COMPANY_PREFIX = re.compile(r'^[销售开票收款]方[名称单位]*[：:]')
+COMPANY_REJECT = re.compile('发票|号码|日期|金额|项目')
+COMPANY_LOOSE_REJECT = re.compile('发票|号码|日期|金额|项目|购买方|买方')
+
+NUMBER_RULES = [
+    ('发票号码', r'发票号码[：:]】?【?([0-9]{6,20})'),  # 【发票号码：】【数字】
+    ('发票号码', r'发票号码[：:]\s*([0-9]{6,20})'),
+    ('发票号', r'发票号[：:]?\s*([0-9]{6,20})'),
+    ('号码', r'号码[：:]\s*([0-9]{6,20})'),
+    ('No', r'No[：:.]?\s*([0-9]{6,20})'),
+    (None, r'【([0-9]{15,20})】'),  # 单独一行的长数字
+]
+
+DATE_RULES = [
+    ('发票日期', r'发票日期[：:]\s*([0-9]{4})年([0-9]{1,2})月([0-9]{1,2})日'),
+    ('开票日期', r'开票日期[：:]\s*([0-9]{4})年([0-9]{1,2})月([0-9]{1,2})日'),
+    ('日期', r'日期[：:]\s*([0-9]{4})年([0-9]{1,2})月([0-9]{1,2})日'),
+    (None, r'([0-9]{4})年([0-9]{1,2})月([0-9]{1,2})日'),
+    ('发票日期', r'发票日期[：:]\s*([0-9]{4})[.-]([0-9]{1,2})[.-]([0-9]{1,2})'),
+    ('开票日期', r'开票日期[：:]\s*([0-9]{4})[.-]([0-9]{1,2})[.-]([0-9]{1,2})'),
+    (None, r'([0-9]{4})[.-]([0-9]{1,2})[.-]([0-9]{1,2})'),
+]
+
+
+def _amount_rule(keyword):
+    return keyword, keyword + r'[：:][^￥¥\d]*[￥¥]?\s*([0-9]+\.?[0-9]*)'
+
+
+# 第一优先级：价税合计/实付金额等，取该规则所有匹配中的最大值
+AMOUNT_PRIORITY_RULES = [
+    _amount_rule('价税合计'),
+    ('价税合计', r'价税合计[：:][^￥¥\d]*([0-9]+\.?[0-9]*)\s*[￥¥]?'),
+    _amount_rule('实付金额'),
+    _amount_rule('实付'),
+    _amount_rule('应付金额'),
+    _amount_rule('总计'),
+    _amount_rule('总金额'),
+]
+# 第二优先级：合计/小写/金额（含税）
+AMOUNT_SECONDARY_RULES = [
+    _amount_rule('合计'),
+    _amount_rule('小写'),
+    ('金额', r'金额[（\(]含税[）\)][：:][^￥¥\d]*[￥¥]?\s*([0-9]+\.?[0-9]*)'),
+]
+# 兜底：最后一个 ¥ 金额（通常是价税合计）；匹配只能从货币符号开始且不含第二个货币符号
+AMOUNT_FALLBACK_KEYWORDS = ('￥', '¥')
+AMOUNT_FALLBACK = r'[￥¥]\s*([0-9]+\.?[0-9]*)'
+MIN_AMOUNT = 0.01
+MAX_AMOUNT = 999999999
+
+PROJECT_RULES = [
+    ('【*', r'【\*([^\*】]+)\*([^\*】]+)】'),  # 【*体育用品*Keep动感单车】
+] + [
+    (keyword, keyword + r'[：:]\s*([^\n\r【】]+?)' + _SEGMENT_END)
+    for keyword in ('项目名称', '项目', '商品名称', '名称', '服务名称', '费用名称')
+]
+PROJECT_NOISE = re.compile(r'[【】\*]')
+
+INVOICE_KEYWORDS = re.compile('发票|增值税|客票|中国铁路|出租汽车|通行费')  # 专用发票/普通发票/发票号码/发票代码都包含“发票”；其余为不含“发票”字样的车票、票据
+
+# 字段名称（用于日志与规则名）
+FIELD_COMPANY = "开票公司名称"
+FIELD_NUMBER = "发票号码"
+FIELD_DATE = "发票日期"
+FIELD_AMOUNT = "发票金额"
+FIELD_PROJECT = "项目名称"
+# 字段在结果中的下标: [文件路径, 开票公司名称, 发票号码, 发票日期, 金额, 项目名称]
+FIELD_INDEX = {FIELD_COMPANY: 1, FIELD_NUMBER: 2, FIELD_DATE: 3, FIELD_AMOUNT: 4, FIELD_PROJECT: 5}
+
+# 规则优先级权重（用于字段置信度）：带关键词的规则按顺序从 1.0 递减到 0.6，兜底规则 0.5
+RULE_WEIGHT_FIRST = 1.0
+RULE_WEIGHT_LAST = 0.6
+FALLBACK_RULE_WEIGHT = 0.5
+
+
+def _keywords_of(*rule_lists):
+    keywords = []
+    for rules in rule_lists:
+        for keyword, _ in rules:
+            if keyword and keyword not in keywords:
+                keywords.append(keyword)
+    return keywords
+
+
+def _trie_pattern(words):
+    """关键词 -> 按前缀合并的交替正则（如 发票(?:号(?:码)?|日期)），每个位置只比较一次首字"""
+    trie = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[''] = {}
+
+    def build(node):
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ''
+        body = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+        # 较短的关键词是较长关键词的前缀时，可选分组保证优先匹配较长的
+        return '(?:' + body + ')?' if '' in node else body
+
+    return build(trie)
+
+
+def load_extract_config():
+    """读取字段提取配置"""
+    return load_config_section("extract", DEFAULT_EXTRACT_CONFIG)
+
+
+def load_regex_engine(name="auto"):
+    """返回正则模块：auto/re2 时优先 google-re2（线性时间），未安装时使用内置 re"""
+    if name in ("auto", "re2"):
+        try:
+            import re2  # 可选依赖
+            return re2
+        except ImportError:
+            if name == "re2":
+                log.warning("未安装 google-re2，字段提取使用内置 re 引擎")
+    return re
+
+
+def contains_invoice_keywords(text):
+    """文本是否包含发票关键词（未包含时调用方会旋转图片重新识别）"""
+    return INVOICE_KEYWORDS.search(text) is not None
+
+
+def read_corpus(path):
+    """读取语料：JSON 行（corpus_file 采集的格式）或每行一条纯文本"""
+    texts = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.rstrip('\n')
+            if not line:
+                continue
+            if line.startswith('"'):
+                try:
+                    texts.append(json.loads(line))
+                    continue
+                except ValueError:
+                    pass
+            texts.append(line)
+    return texts
+
+
+class KeywordIndex:
+    """一次扫描得到各关键词在文本中的全部出现位置
+
+    正则在每个位置取最长的关键词，匹配会消耗字符；被覆盖的关键词
+    （如“发票号码”中的“发票号”“号码”）由预先计算的重叠关系补全。
+    """
+
+    def __init__(self, keywords, engine=re):
+        self.keywords = sorted(set(keywords), key=len, reverse=True)
+        self.pattern = engine.compile(_trie_pattern(self.keywords))
+        # 关键词 -> [(偏移, 可能从该偏移开始的其他关键词)]
+        self.overlaps = {}
+        for keyword in self.keywords:
+            related = []
+            for offset in range(len(keyword)):
+                tail = keyword[offset:]
+                for other in self.keywords:
+                    if offset == 0 and len(other) >= len(keyword):
+                        continue  # 同一位置上更长的关键词会被正则直接匹配
+                    if other.startswith(tail) or tail.startswith(other):
+                        related.append((offset, other))
+            if related:
+                self.overlaps[keyword] = related
+
+    def scan(self, text):
+        """返回 {关键词: [出现位置（升序）]}
+
+        补全的位置都在当前匹配结束之前、下一个匹配开始之前，按扫描顺序追加即为升序。
+        """
+        positions = {}
+        overlaps = self.overlaps
+        for match in self.pattern.finditer(text):
+            keyword, start = match.group(), match.start()
+            positions.setdefault(keyword, []).append(start)
+            if keyword in overlaps:
+                for offset, other in overlaps[keyword]:
+                    if text.startswith(other, start + offset):
+                        positions.setdefault(other, []).append(start + offset)
+        return positions
+
+
+class Rule:
+    """一条提取规则（已编译）"""
+    __slots__ = ("name", "field", "keyword", "source", "pattern", "weight")
+
+    def __init__(self, field, number, keyword, source, engine):
+        self.field = field
+        self.keyword = keyword
+        self.source = source
+        self.weight = FALLBACK_RULE_WEIGHT
+        self.name = f"{field}#{number} {keyword or '(全文)'}"
+        try:
+            self.pattern = engine.compile(source if engine is re else source.replace(_SEGMENT_END, _SEGMENT_END_RE2))
+        except Exception:
+            self.pattern = re.compile(source)  # RE2 不支持的语法退回内置引擎
+
+
+class ExtractionProfiler:
+    """按规则统计调用次数、匹配次数、被采用次数与耗时（用于离线分析，非线程安全）"""
+
+    def __init__(self):
+        self.rules = {}      # 规则名 -> [调用, 匹配, 采用, 总耗时, 最长耗时]
+        self.order = []
+        self.pages = 0
+        self.timeouts = 0
+        self.page_seconds = 0.0
+        self.max_page_seconds = 0.0
+
+    def _stats(self, rule):
+        stats = self.rules.get(rule.name)
+        if stats is None:
+            stats = self.rules[rule.name] = [0, 0, 0, 0.0, 0.0]
+            self.order.append(rule)
+        return stats
+
+    def record(self, rule, seconds, matched):
+        stats = self._stats(rule)
+        stats[0] += 1
+        stats[1] += bool(matched)
+        stats[3] += seconds
+        stats[4] = max(stats[4], seconds)
+
+    def selected(self, rule):
+        self._stats(rule)[2] += 1
+
+    def page(self, seconds, timed_out):
+        self.pages += 1
+        self.timeouts += bool(timed_out)
+        self.page_seconds += seconds
+        self.max_page_seconds = max(self.max_page_seconds, seconds)
+
+    def rows(self, all_rules=()):
+        """[{规则, 调用, 匹配, 采用, 命中率, 总耗时ms, 最长ms}]，按总耗时降序；all_rules 中从未调用的规则也列出"""
+        for rule in all_rules:
+            self._stats(rule)
+        rows = []
+        for rule in self.order:
+            calls, matched, selected, seconds, longest = self.rules[rule.name]
+            rows.append({
+                "rule": rule.name,
+                "pattern": rule.source,
+                "calls": calls,
+                "matched": matched,
+                "selected": selected,
+                "hit_rate": matched / calls if calls else 0.0,
+                "total_ms": seconds * 1000,
+                "max_ms": longest * 1000,
+            })
+        return sorted(rows, key=lambda row: row["total_ms"], reverse=True)
+
+    def report(self, all_rules=()):
+        rows = self.rows(all_rules)
+        lines = [f"页数: {self.pages}，超时: {self.timeouts}，"
+                 f"平均 {self.page_seconds * 1000 / max(1, self.pages):.3f} ms/页，"
+                 f"最长 {self.max_page_seconds * 1000:.3f} ms",
+                 f"{'规则':<24}{'调用':>8}{'匹配':>8}{'采用':>8}{'命中率':>9}{'总耗时ms':>11}{'最长ms':>9}"]
+        for row in rows:
+            note = "  (从未采用)" if not row["selected"] else ""
+            lines.append(f"{row['rule']:<24}{row['calls']:>8}{row['matched']:>8}{row['selected']:>8}"
+                         f"{row['hit_rate']:>9.1%}{row['total_ms']:>11.2f}{row['max_ms']:>9.3f}{note}")
+        return "\n".join(lines)
+
+
+class _Extraction:
+    """一页文本的提取状态：关键词位置、时间预算、性能统计、各字段的取值来源"""
+    __slots__ = ("text", "positions", "deadline", "profiler", "timed_out", "sources")
+
+    def __init__(self, text, positions, deadline, profiler):
+        self.text = text
+        self.positions = positions
+        self.deadline = deadline
+        self.profiler = profiler
+        self.timed_out = False
+        self.sources = {}
+
+    def expired(self):
+        if self.deadline is not None and time.perf_counter() > self.deadline:
+            self.timed_out = True
+        return self.timed_out
+
+    def skip(self, rule):
+        """规则的关键词不在文本中（无需匹配）"""
+        return rule.keyword is not None and rule.keyword not in self.positions
+
+    def matches(self, rule):
+        """按 findall 的语义返回规则的全部匹配（从左到右、互不重叠）"""
+        started = time.perf_counter() if self.profiler is not None else None
+        if rule.keyword is None:
+            matches = list(rule.pattern.finditer(self.text))
+        else:
+            matches = []
+            end = 0
+            for start in self.positions.get(rule.keyword, ()):
+                if start < end:
+                    continue
+                match = rule.pattern.match(self.text, start)
+                if match:
+                    end = match.end()
+                    matches.append(match)
+        if started is not None:
+            self.profiler.record(rule, time.perf_counter() - started, matches)
+        return matches
+
+    def first(self, rule):
+        """规则的第一个匹配（即 findall 结果的第一项）"""
+        started = time.perf_counter() if self.profiler is not None else None
+        match = None
+        if rule.keyword is None:
+            match = rule.pattern.search(self.text)
+        else:
+            for start in self.positions.get(rule.keyword, ()):
+                match = rule.pattern.match(self.text, start)
+                if match:
+                    break
+        if started is not None:
+            self.profiler.record(rule, time.perf_counter() - started, match)
+        return match
+
+    def selected(self, rule, match):
+        """字段取自 rule 的 match：记录规则权重与匹配范围（到最后一个分组为止，不含消耗掉的下一行“【”）"""
+        self.sources[rule.field] = (rule.weight, match.start(), match.end(len(match.groups())))
+        if self.profiler is not None:
+            self.profiler.selected(rule)
+
+
+class InvoiceFieldExtractor:
+    """发票字段提取（实例可在多个线程间共享，不保存每次提取的状态；profiler 除外）
+
+    engine: 正则模块（re 或 re2），默认内置 re
+    time_budget_ms: 每页时间预算，超出后不再尝试剩余规则；内置 re 无法打断正在执行的单次匹配，
+        RE2 保证单次匹配为线性时间
+    profiler: ExtractionProfiler（可选），记录每条规则的耗时与命中
+    corpus_file: 非空时把每页文本追加到该文件（JSON 行）
+    """
+
+    def __init__(self, debug=False, engine=None, time_budget_ms=0, profiler=None, corpus_file=""):
+        if debug:
+            set_module_level("FieldExtractor", "DEBUG")
+        self.debug = log.isEnabledFor(logging.DEBUG)  # 逐页判断的开关，关闭时调试消息不格式化
+        self.engine = engine or re
+        self.time_budget = max(0.0, float(time_budget_ms or 0)) / 1000.0
+        self.profiler = profiler
+        self.corpus_file = corpus_file
+        self._corpus_lock = threading.Lock()
+
+        def compile_rules(field, rules, first=1):
+            return [Rule(field, number, keyword, source, self.engine)
+                    for number, (keyword, source) in enumerate(rules, first)]
+
+        self.company_rules = compile_rules(FIELD_COMPANY, COMPANY_RULES)
+        self.company_loose = Rule(FIELD_COMPANY, "宽松", None, COMPANY_LOOSE, self.engine)
+        self.number_rules = compile_rules(FIELD_NUMBER, NUMBER_RULES)
+        self.date_rules = compile_rules(FIELD_DATE, DATE_RULES)
+        self.amount_tiers = [compile_rules(FIELD_AMOUNT, AMOUNT_PRIORITY_RULES),
+                             compile_rules(FIELD_AMOUNT, AMOUNT_SECONDARY_RULES, len(AMOUNT_PRIORITY_RULES) + 1)]
+        self.amount_fallback = Rule(FIELD_AMOUNT, "兜底", None, AMOUNT_FALLBACK, self.engine)
+        self.project_rules = compile_rules(FIELD_PROJECT, PROJECT_RULES)
+        for rules in (self.company_rules, self.number_rules, self.date_rules,
+                      self.amount_tiers[0] + self.amount_tiers[1], self.project_rules):
+            ranked = [rule for rule in rules if rule.keyword is not None]
+            for rank, rule in enumerate(ranked):
+                rule.weight = RULE_WEIGHT_FIRST - (RULE_WEIGHT_FIRST - RULE_WEIGHT_LAST) * rank / max(1, len(ranked) - 1)
+
+        keywords = _keywords_of(COMPANY_RULES, NUMBER_RULES, DATE_RULES,
+                                AMOUNT_PRIORITY_RULES, AMOUNT_SECONDARY_RULES, PROJECT_RULES)
+        self.index = KeywordIndex(keywords + list(COMPANY_LOOSE_KEYWORDS) + list(AMOUNT_FALLBACK_KEYWORDS),
+                                  self.engine)
+
+    @property
+    def all_rules(self):
+        rules = self.company_rules + [self.company_loose] + self.number_rules + self.date_rules
+        for tier in self.amount_tiers:
+            rules = rules + tier
+        return rules + [self.amount_fallback] + self.project_rules
+
+    @property
+    def engine_name(self):
+        return "RE2" if self.engine is not re else "re"
+
+    def _log(self, message, *args):
+        if self.debug:
+            log.debug(message, *args)
+
+    def extract_company(self, run):
+        for rule in self.company_rules:
+            if run.skip(rule):
+                continue
+            if run.expired():
+                return ''
+            for match in run.matches(rule):
+                value = COMPANY_PREFIX.sub('', match.group(1).strip()).strip()
+                if len(value) >= 2 and not value[0].isdigit() and not COMPANY_REJECT.search(value):
+                    run.selected(rule, match)
+                    self._log("提取到开票公司名称: %s", value)
+                    return value
+        # 兜底：包含“公司”“厂”“店”等字样的文本
+        rule = self.company_loose
+        started = time.perf_counter() if run.profiler is not None else None
+        value, found = '', None
+        for start, end in self._loose_segments(run.text, run.positions):
+            if run.expired():
+                break
+            for match in rule.pattern.finditer(run.text, start, end):
+                candidate = match.group(1).strip()
+                if (len(candidate) >= 3 and not candidate[0].isdigit()
+                        and not COMPANY_LOOSE_REJECT.search(candidate)):
+                    value, found = candidate, match
+                    break
+            if value:
+                break
+        if started is not None:
+            run.profiler.record(rule, time.perf_counter() - started, value)
+        if value:
+            run.selected(rule, found)
+            self._log("通过宽松模式提取到开票公司名称: %s", value)
+        return value
+
+    @staticmethod
+    def _loose_segments(text, positions):
+        """含“公司”等字样的行（【】之间）的范围，从左到右
+        宽松规则的匹配不会跨越【】与换行，只在这些行内查找与全文查找结果相同。
+        """
+        hits = sorted(start for keyword in COMPANY_LOOSE_KEYWORDS for start in positions.get(keyword, ()))
+        segment_end = -1
+        for hit in hits:
+            if hit < segment_end:
+                continue
+            start = max(text.rfind(separator, 0, hit) for separator in SEGMENT_SEPARATORS) + 1
+            ends = [end for end in (text.find(separator, hit) for separator in SEGMENT_SEPARATORS) if end >= 0]
+            segment_end = min(ends) if ends else len(text)
+            yield start, segment_end
+
+    def extract_number(self, run):
+        for rule in self.number_rules:
+            if run.skip(rule):
+                continue
+            if run.expired():
+                return ''
+            match = run.first(rule)
+            if match:
+                run.selected(rule, match)
+                self._log("提取到发票号码: %s", match.group(1))
+                return match.group(1)
+        return ''
+
+    def extract_date(self, run):
+        """每条规则只看第一个匹配，不是有效日期时换下一条规则"""
+        for rule in self.date_rules:
+            if run.skip(rule):
+                continue
+            if run.expired():
+                return ''
+            match = run.first(rule)
+            if not match:
+                continue
+            year, month, day = (int(part) for part in match.groups())
+            if 2000 <= year <= 2030 and 1 <= month <= 12 and 1 <= day <= 31:
+                value = f"{year}{month:02d}{day:02d}"
+                run.selected(rule, match)
+                self._log("提取到发票日期: %s", value)
+                return value
+        return ''
+
+    def extract_amount(self, run):
+        for rules in self.amount_tiers:
+            for rule in rules:
+                if run.skip(rule):
+                    continue
+                if run.expired():
+                    return ''
+                amounts = [(float(match.group(1)), match) for match in run.matches(rule)]
+                amounts = [item for item in amounts if MIN_AMOUNT <= item[0] <= MAX_AMOUNT]
+                if amounts:
+                    amount, match = max(amounts, key=lambda item: item[0])  # 取最大的金额作为发票总额
+                    run.selected(rule, match)
+                    self._log("提取到发票金额: %s (规则: %s)", amount, rule.name)
+                    return amount
+        # 从最后一个货币符号往前找第一个能匹配的位置，即全文最后一个匹配
+        rule = self.amount_fallback
+        started = time.perf_counter() if run.profiler is not None else None
+        symbols = [start for symbol in AMOUNT_FALLBACK_KEYWORDS for start in run.positions.get(symbol, ())]
+        last = None
+        for start in sorted(symbols, reverse=True):
+            last = rule.pattern.match(run.text, start)
+            if last is not None:
+                break
+        if started is not None:
+            run.profiler.record(rule, time.perf_counter() - started, last)
+        if last is not None:
+            amount = float(last.group(1))
+            if MIN_AMOUNT <= amount <= MAX_AMOUNT:
+                run.selected(rule, last)
+                self._log("通过备用模式提取到发票金额: %s (最后一个金额)", amount)
+                return amount
+        return ''
+
+    def extract_project(self, run):
+        """每条规则只看第一个匹配；【*分类*名称】格式取名称部分"""
+        for rule in self.project_rules:
+            if run.skip(rule):
+                continue
+            if run.expired():
+                return ''
+            match = run.first(rule)
+            if not match:
+                continue
+            value = match.groups()[-1].strip()
+            value = PROJECT_NOISE.sub('', value).strip()
+            if len(value) > 1:
+                run.selected(rule, match)
+                self._log("提取到项目名称: %s", value)
+                return value
+        return ''
+
+    def _save_text(self, text):
+        try:
+            with self._corpus_lock, open(self.corpus_file, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(text, ensure_ascii=False) + "\n")
+        except OSError as e:
+            log.warning("语料写入失败，停止采集: %s", e)
+            self.corpus_file = ""
+
+    def extract(self, text, image_path, known=None):
+        """提取结果 [文件路径, 开票公司名称, 发票号码, 发票日期, 金额, 项目名称]
+        known: 已由其他方式（如版面位置）得到的字段 {结果下标: 取值}，这些字段不再用正则提取
+        """
+        return self.extract_detailed(text, image_path, known)[0]
+
+    def extract_detailed(self, text, image_path, known=None):
+        """同 extract，另返回正则取值的来源 {字段名称: (规则权重, 匹配起点, 匹配终点)}"""
+        self._log("提取信息的文本: %s", text)
+        if self.corpus_file:
+            self._save_text(text)
+        started = time.perf_counter()
+        deadline = started + self.time_budget if self.time_budget else None
+        run = _Extraction(text, self.index.scan(text), deadline, self.profiler)
+        result = [image_path]
+        known = known or {}
+        for index, (name, extract) in enumerate(((FIELD_COMPANY, self.extract_company),
+                                                 (FIELD_NUMBER, self.extract_number),
+                                                 (FIELD_DATE, self.extract_date),
+                                                 (FIELD_AMOUNT, self.extract_amount),
+                                                 (FIELD_PROJECT, self.extract_project)), 1):
+            if known.get(index) not in (None, ''):
+                result.append(known[index])
+                continue
+            try:
+                result.append(extract(run))
+            except Exception as e:
+                log.warning("%s提取失败: %s", name, e)
+                result.append('')
+        if result[1].startswith("名称："):
+            result[1] = result[1][3:].strip()
+        if run.timed_out:
+            log.warning("字段提取超过时间预算 %.0fms，剩余规则已跳过: %s（%d 字）",
+                        self.time_budget * 1000, image_path, len(text), extra={"page": image_path})
+        if self.profiler is not None:
+            self.profiler.page(time.perf_counter() - started, run.timed_out)
+        self._log("最终提取结果: %s", result)
+        return result, run.sources
+
+
+def create_extractor(config=None, profiler=None):
+    """按配置创建提取器"""
+    config = config or load_extract_config()
+    return InvoiceFieldExtractor(
+        debug=bool(config.get("debug")),
+        engine=load_regex_engine(config.get("engine", "re")),
+        time_budget_ms=config.get("time_budget_ms", 0),
+        profiler=profiler,
+        corpus_file=config.get("corpus_file") or "",
+    )
+
+
+_shared_extractor = None
+
+
+def get_extractor():
+    """按配置返回共享的提取器"""
+    global _shared_extractor
+    if _shared_extractor is None:
+        _shared_extractor = create_extractor()
+    return _shared_extractor
+
+
+def extract_invoice_fields(text, image_path, known=None):
+    return get_extractor().extract(text, image_path, known)
+
+
+def extract_invoice_details(text, image_path, known=None):
+    """同 extract_invoice_fields，另返回正则取值的来源（用于字段置信度）"""
+    return get_extractor().extract_detailed(text, image_path, known)
+
+
+def profile_corpus(texts, config=None):
+    """对语料逐条提取，返回 (提取器, 性能统计)"""
+    config = dict(config or load_extract_config())
+    config["corpus_file"] = ""
+    config["debug"] = False
+    extractor = create_extractor(config, profiler=ExtractionProfiler())
+    for index, text in enumerate(texts):
+        extractor.extract(text, f"#{index + 1}")
+    return extractor, extractor.profiler
+
+
+def main(argv=None):
+    argv = list(sys.argv[1:] if argv is None else argv)
+    if len(argv) < 2 or argv[0] != "profile":
+        print(__doc__)
+        return 1
+    options = {name.lstrip("-"): value for name, value in zip(argv[2::2], argv[3::2])}
+    config = load_extract_config()
+    if "engine" in options:
+        config["engine"] = options["engine"]
+    if "budget-ms" in options:
+        config["time_budget_ms"] = float(options["budget-ms"])
+
+    texts = read_corpus(argv[1])
+    extractor, profiler = profile_corpus(texts, config)
+    print(f"引擎: {extractor.engine_name}，时间预算: {config.get('time_budget_ms') or '不限'} ms/页")
+    print(profiler.report(extractor.all_rules))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
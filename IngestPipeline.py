@@ -0,0 +1,308 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+统一输入管线 - 把混合来源（PDF、图片文件、文件夹、压缩包）整理成识别子任务，所有子任务走同一组步骤
+  1) 展开来源：文件按扩展名分类，文件夹（默认含子目录）按名称顺序展开，同一文件只计一次；
+     图片按所在文件夹每 image_chunk_size 张合成一个子任务，每个PDF一个子任务，压缩包一个子任务
+  2) 执行子任务：预检去重 -> PDF渲染页面 / 读取图片 -> 共享的微批处理器识别（MainAction.ocr_pages）
+  压缩包子任务解压后返回展开出的子任务（expanded_tasks），由调度器追加到同一任务中。
+  压缩包只解压其中的PDF与图片（不解压嵌套的压缩包），拒绝绝对路径、“..”与链接成员，解压总大小受 max_archive_mb 限制。
+
+配置在 offline_config.json 的 "ingest" 节。
+"""
+
+import os
+import shutil
+import hashlib
+import tarfile
+import zipfile
+
+from Cancellation import OperationCancelled
+from resource_utils import SUPPORTED_IMAGE_FORMATS, load_config_section
+from StructuredLog import get_logger
+
+log = get_logger("IngestPipeline")
+
+# 输入管线默认参数（可在 offline_config.json 的 "ingest" 节覆盖）
+DEFAULT_INGEST_CONFIG = {
+    "recursive": True,         # 文件夹是否包含子目录
+    "archives": True,          # 是否解压压缩包（.zip / .tar / .tar.gz 等）
+    "max_archive_mb": 2048,    # 单个压缩包解压出的文件总大小上限（MB）
+    "archive_dir": "",         # 解压目录，为空时为输出目录下的 ARCHIVES
+}
+
+PDF_EXTENSIONS = ('.pdf',)
+ARCHIVE_EXTENSIONS = ('.zip', '.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tbz2', '.tar.xz', '.txz')
+
+# 子任务类型
+KIND_PDF = "pdf"
+KIND_IMAGES = "images"
+KIND_ARCHIVE = "archive"
+
+_COPY_CHUNK = 1024 * 1024
+
+
+def load_ingest_config():
+    """读取输入管线配置"""
+    return load_config_section("ingest", DEFAULT_INGEST_CONFIG)
+
+
+def source_kind(path):
+    """按扩展名判断文件类型：KIND_PDF / "image" / KIND_ARCHIVE，不支持的文件返回 None"""
+    name = str(path).lower()
+    if name.endswith(PDF_EXTENSIONS):
+        return KIND_PDF
+    if name.endswith(SUPPORTED_IMAGE_FORMATS):
+        return "image"
+    if name.endswith(ARCHIVE_EXTENSIONS):
+        return KIND_ARCHIVE
+    return None
+
+
+class IngestTask:
+    """一个识别子任务：一个PDF、同一文件夹中的一组图片，或一个待解压的压缩包"""
+
+    def __init__(self, kind, path, image_files=None):
+        self.kind = kind                            # KIND_PDF / KIND_IMAGES / KIND_ARCHIVE
+        self.path = path                            # PDF或压缩包路径；图片子任务为所在文件夹
+        self.image_files = list(image_files or [])  # 图片子任务：文件夹中的图片文件名
+
+    @property
+    def files(self):
+        """计入进度的文件数"""
+        return len(self.image_files) if self.kind == KIND_IMAGES else 1
+
+    @property
+    def label(self):
+        if self.kind == KIND_IMAGES:
+            return f"{len(self.image_files)} 张图片"
+        return os.path.basename(self.path)
+
+    def __repr__(self):
+        return f"IngestTask({self.kind!r}, {self.path!r}, {len(self.image_files)} images)"
+
+
+def image_tasks(folder_path, image_files, chunk_size):
+    """同一文件夹中的图片每 chunk_size 张合成一个子任务"""
+    chunk_size = max(1, int(chunk_size))
+    return [IngestTask(KIND_IMAGES, folder_path, image_files[i:i + chunk_size])
+            for i in range(0, len(image_files), chunk_size)]
+
+
+def _walk_files(folder_path, recursive):
+    """文件夹中的文件（按名称排序；含子目录时先列当前目录的文件）"""
+    for root, dirs, files in os.walk(folder_path):
+        dirs.sort()
+        for name in sorted(files):
+            yield os.path.join(root, name)
+        if not recursive:
+            break
+
+
+def expand_sources(sources, chunk_size, config=None):
+    """混合来源 -> 子任务
+    Returns:
+        (子任务列表, 跳过的来源 [(路径, 原因)])；子任务按来源出现的顺序排列，
+        文件夹中不支持的文件直接忽略，只有直接给出的文件或路径才记为跳过
+    """
+    config = config or load_ingest_config()
+    order = []     # (类型, 路径)；图片按所在文件夹只记一次
+    images = {}    # 文件夹 -> 图片文件名
+    seen = set()
+    skipped = []
+
+    def add_file(path, explicit):
+        kind = source_kind(path)
+        if kind is None or (kind == KIND_ARCHIVE and not config.get("archives", True)):
+            if explicit:
+                skipped.append((path, "不支持的文件类型" if kind is None else "未启用压缩包解压"))
+            return
+        key = os.path.normcase(os.path.abspath(path))
+        if key in seen:
+            return
+        seen.add(key)
+        if kind == "image":
+            folder, name = os.path.split(path)
+            if folder not in images:
+                images[folder] = []
+                order.append((KIND_IMAGES, folder))
+            images[folder].append(name)
+        else:
+            order.append((kind, path))
+
+    for source in sources:
+        source = os.fspath(source)
+        if os.path.isdir(source):
+            for path in _walk_files(source, config.get("recursive", True)):
+                add_file(path, explicit=False)
+        elif os.path.isfile(source):
+            add_file(source, explicit=True)
+        else:
+            skipped.append((source, "文件不存在"))
+
+    tasks = []
+    for kind, path in order:
+        if kind == KIND_IMAGES:
+            tasks.extend(image_tasks(path, images[path], chunk_size))
+        else:
+            tasks.append(IngestTask(kind, path))
+    for path, reason in skipped:
+        log.warning("已跳过 %s：%s", path, reason)
+    return tasks, skipped
+
+
+def _member_path(name):
+    """压缩包成员的相对路径；绝对路径或含“..”的成员返回 None"""
+    parts = [part for part in name.replace("\\", "/").split("/") if part not in ("", ".")]
+    if not parts or name.startswith(("/", "\\")) or ".." in parts or ":" in parts[0]:
+        return None
+    return os.path.join(*parts)
+
+
+def _copy_limited(source, destination, budget):
+    """复制成员内容，返回剩余可解压字节数；超过上限时抛出 ValueError（不信任压缩包中记录的大小）"""
+    with open(destination, 'wb') as f:
+        while True:
+            data = source.read(_COPY_CHUNK)
+            if not data:
+                return budget
+            budget -= len(data)
+            if budget < 0:
+                raise ValueError("解压后的文件超过大小上限（max_archive_mb）")
+            f.write(data)
+
+
+def _archive_members(archive):
+    """(成员名, 打开成员的函数)；只列普通文件，目录与链接不解压"""
+    if isinstance(archive, zipfile.ZipFile):
+        for info in archive.infolist():
+            if not info.is_dir():
+                yield info.filename, lambda info=info: archive.open(info)
+    else:
+        for member in archive.getmembers():
+            if member.isfile():
+                yield member.name, lambda member=member: archive.extractfile(member)
+
+
+def extract_archive(archive_path, target_dir, max_bytes, cancel_token=None):
+    """把压缩包中的PDF与图片解压到 target_dir（先清空该目录），返回解压出的文件数"""
+    if os.path.isdir(target_dir):
+        shutil.rmtree(target_dir)
+    os.makedirs(target_dir, exist_ok=True)
+    if zipfile.is_zipfile(archive_path):
+        archive = zipfile.ZipFile(archive_path)
+    else:
+        archive = tarfile.open(archive_path, 'r:*')
+    extracted = 0
+    budget = int(max_bytes)
+    with archive:
+        for name, open_member in _archive_members(archive):
+            if cancel_token is not None and cancel_token.cancelled:
+                raise OperationCancelled()
+            relative = _member_path(name)
+            if relative is None:
+                log.warning("压缩包 %s 中的成员路径不安全，已跳过: %s", os.path.basename(archive_path), name)
+                continue
+            if source_kind(relative) not in (KIND_PDF, "image"):
+                continue
+            destination = os.path.join(target_dir, relative)
+            os.makedirs(os.path.dirname(destination), exist_ok=True)
+            with open_member() as source:
+                budget = _copy_limited(source, destination, budget)
+            extracted += 1
+    return extracted
+
+
+def archive_target_dir(archive_path, output_dir, config):
+    """压缩包的解压目录（按压缩包的完整路径区分同名压缩包）"""
+    base_dir = config.get("archive_dir") or os.path.join(output_dir or ".", "ARCHIVES")
+    stem = os.path.basename(archive_path)
+    digest = hashlib.md5(os.path.abspath(archive_path).encode('utf-8')).hexdigest()[:8]
+    return os.path.join(base_dir, f"{stem}_{digest}")
+
+
+def expand_archive(task, output_dir, chunk_size, config=None, cancel_token=None):
+    """解压压缩包子任务，返回其中PDF与图片的子任务"""
+    config = config or load_ingest_config()
+    target_dir = archive_target_dir(task.path, output_dir, config)
+    try:
+        count = extract_archive(task.path, target_dir, float(config.get("max_archive_mb", 2048)) * 1024 * 1024,
+                                cancel_token)
+    except (zipfile.BadZipFile, tarfile.TarError, ValueError) as e:
+        raise ValueError(f"{task.label} 解压失败: {e}") from e
+    log.info("已解压 %s: %d 个文件", task.label, count)
+    tasks, _ = expand_sources([target_dir], chunk_size, dict(config, recursive=True))
+    return tasks
+
+
+def _release(duplicates, claim):
+    """子任务出错：释放预检占用的文件与发票号码，允许之后重新识别"""
+    if claim is not None:
+        duplicates.finish(claim, ok=False)
+
+
+def _empty_result():
+    return {"invoice_data": [], "total_files": 0, "processed_count": 0}
+
+
+def run_task(task, precision_mode, output_dir, get_batcher, progress=None, cancel_token=None, duplicates=None,
+             chunk_size=16, config=None, owner=None):
+    """执行一个子任务（工作线程）：预检去重 -> PDF渲染 / 读取图片 -> 共享的微批处理器识别
+    Args:
+        get_batcher: get_batcher(precision_mode) -> OCRMicroBatcher，只在确实需要识别时调用
+        progress: ProgressTracker（可选），子任务的文件数已由调用方计入
+        duplicates: DuplicateFilter（可选），为空时不做预检去重
+        owner: 预检时登记的任务对象，跳过的相同文件重新放行时交给 duplicates.on_readmit
+    Returns:
+        (result, claim)：result 为 None 表示识别失败；压缩包子任务的 result["expanded_tasks"] 为展开出的子任务。
+        claim 由调用方在保存结果后 duplicates.finish；抛出异常时已在这里释放
+    """
+    from MainAction import ocr_pdf_offline, ocr_images_offline  # 延迟导入
+    claim = None
+    if task.kind == KIND_ARCHIVE:
+        try:
+            tasks = expand_archive(task, output_dir, chunk_size, config, cancel_token)
+        except OperationCancelled:
+            if progress is not None:
+                progress.add_files(-1)
+            return dict(_empty_result(), cancelled=True), None
+        except Exception:
+            if progress is not None:
+                progress.advance(files=1)
+            raise
+        if progress is not None:
+            # 压缩包本身不再计数，改为计入其中的文件
+            progress.add_files(sum(expanded.files for expanded in tasks) - 1)
+        return dict(_empty_result(), expanded_tasks=tasks), None
+
+    if task.kind == KIND_PDF:
+        claim = duplicates.check_pdf(task.path, owner) if duplicates is not None else None
+        if claim is not None and claim.duplicate_files:
+            # 内容相同的文件已处理过：不转换、不识别
+            if progress is not None:
+                progress.add_files(-1)
+            return _empty_result(), claim
+        try:
+            result = ocr_pdf_offline(task.path, precision_mode, output_dir, get_batcher(precision_mode), progress,
+                                     cancel_token=cancel_token,
+                                     skip_pages=claim.skipped_pages if claim is not None else None)
+        except Exception:
+            _release(duplicates, claim)
+            raise
+        if progress is not None:
+            progress.advance(files=1)
+        return result, claim
+
+    image_files = task.image_files
+    if duplicates is not None:
+        image_files, claim = duplicates.check_images(task.path, image_files, owner)
+        if claim.duplicate_files and progress is not None:
+            progress.add_files(-len(claim.duplicate_files))
+    if not image_files:
+        return _empty_result(), claim
+    try:
+        return ocr_images_offline(task.path, precision_mode, output_dir, get_batcher(precision_mode), progress,
+                                  image_files=image_files, cancel_token=cancel_token), claim
+    except Exception:
+        _release(duplicates, claim)
+        raise
@@ -0,0 +1,314 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+发票库 - 跨会话保存识别结果的 SQLite 数据库（WAL 模式）
+每个子任务识别完成后增量写入；写入前按发票号码索引查找历史记录，用于跨会话查重。
+另记录已处理文件的内容哈希，之后的会话遇到相同文件时直接跳过。
+GUI 与命令行都可查询。本模块只依赖标准库。
+
+用法：
+  python InvoiceStore.py query [--number 号码] [--seller 公司] [--item 项目]
+                               [--min-amount 金额] [--max-amount 金额]
+                               [--from 日期] [--to 日期] [--limit N]   # 查询，输出JSON
+  python InvoiceStore.py duplicates [--limit N]                         # 列出重复的发票号码
+  python InvoiceStore.py stats                                          # 库统计
+"""
+
+import os
+import sys
+import json
+import sqlite3
+import threading
+from datetime import datetime
+from pathlib import Path
+
+from resource_utils import load_config_section
+from ResultIndex import ResultQuery, normalize_seller, parse_amount, parse_date, parse_date_bound
+from StructuredLog import get_logger
+
+log = get_logger("InvoiceStore")
+
+# 发票库默认参数（可在 offline_config.json 的 "store" 节覆盖）
+DEFAULT_STORE_CONFIG = {
+    "enabled": True,   # 是否把识别结果写入发票库
+    "path": "",        # 数据库文件，默认 ~/.invoicevision/invoices.db
+}
+
+STORE_FILE_NAME = "invoices.db"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS invoices (
+    id INTEGER PRIMARY KEY,
+    invoice_number TEXT,
+    seller TEXT,
+    invoice_date TEXT,
+    date_key INTEGER,
+    amount REAL,
+    amount_text TEXT,
+    item TEXT,
+    invoice_type TEXT,
+    source_file TEXT,
+    page INTEGER,
+    image_path TEXT,
+    session TEXT,
+    created_at TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_invoices_number ON invoices(invoice_number);
+CREATE INDEX IF NOT EXISTS idx_invoices_seller ON invoices(seller);
+CREATE INDEX IF NOT EXISTS idx_invoices_date ON invoices(date_key);
+CREATE INDEX IF NOT EXISTS idx_invoices_amount ON invoices(amount);
+CREATE INDEX IF NOT EXISTS idx_invoices_source ON invoices(source_file, page);
+CREATE TABLE IF NOT EXISTS files (
+    digest TEXT PRIMARY KEY,
+    path TEXT,
+    session TEXT,
+    created_at TEXT
+);
+"""
+
+RECORD_FIELDS = ["id", "invoice_number", "seller", "invoice_date", "amount_text", "item", "invoice_type",
+                 "source_file", "page", "session", "created_at"]
+
+
+def _record_dict(record_id, record):
+    """add_results 写入的一条记录 -> 与查询结果相同的记录dict"""
+    (number, seller, invoice_date, _, _, amount_text, item, invoice_type, source_file, page, _, session,
+     created_at) = record
+    return {"id": record_id, "invoice_number": number, "seller": seller, "invoice_date": invoice_date,
+            "amount_text": amount_text, "item": item, "invoice_type": invoice_type, "source_file": source_file,
+            "page": page, "session": session, "created_at": created_at}
+
+
+def load_store_config():
+    """读取发票库配置"""
+    return load_config_section("store", DEFAULT_STORE_CONFIG)
+
+
+def get_store_path(config=None):
+    """数据库文件路径"""
+    config = config or load_store_config()
+    if config.get("path"):
+        path = Path(config["path"])
+    else:
+        path = Path.home() / ".invoicevision" / STORE_FILE_NAME
+    path.parent.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+class InvoiceStore:
+    """发票库（连接可在多个线程间共享，读写由锁串行化）"""
+
+    def __init__(self, path=None):
+        self.path = str(path or get_store_path())
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(_SCHEMA)
+            # 旧版本创建的库没有发票类型列
+            columns = {row[1] for row in self._conn.execute("PRAGMA table_info(invoices)")}
+            if "invoice_type" not in columns:
+                self._conn.execute("ALTER TABLE invoices ADD COLUMN invoice_type TEXT")
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def find_numbers(self, numbers):
+        """按发票号码查找已有记录 {号码: [记录dict]}"""
+        with self._lock:
+            return self._find_numbers(numbers)
+
+    def _find_numbers(self, numbers):
+        """find_numbers 的查询部分（调用方持有 _lock）"""
+        numbers = sorted({number for number in numbers if number})
+        found = {}
+        # 分批查询，避免超过 SQLite 的参数个数上限
+        for start in range(0, len(numbers), 500):
+            chunk = numbers[start:start + 500]
+            placeholders = ",".join("?" * len(chunk))
+            for row in self._conn.execute(
+                    f"SELECT {', '.join(RECORD_FIELDS)} FROM invoices "
+                    f"WHERE invoice_number IN ({placeholders}) ORDER BY id", chunk):
+                found.setdefault(row["invoice_number"], []).append(dict(row))
+        return found
+
+    def add_results(self, rows, page_sources=None, session=""):
+        """写入一批识别结果，返回写入前已有相同发票号码的记录 {号码: [记录dict]}
+        已有记录包括库中的记录，以及本批中来自其他文件的在前记录（同一文件的多页发票续页不算重复）；
+        查找与写入在同一个写事务中，并发写入的相同号码不会互相漏查
+        rows: 结果行 [文件路径, 开票公司名称, 发票号码, 发票日期, 金额, 项目名称, 发票类型]
+        page_sources: {图片路径: [PDF路径, 页下标]}，用于记录来源文件与页码
+        """
+        page_sources = page_sources or {}
+        records = []
+        for row in rows:
+            if not isinstance(row, (list, tuple)) or len(row) < 5:
+                continue
+            image_path = str(row[0] or "")
+            source_file, page = page_sources.get(image_path) or (image_path, None)
+            number = str(row[2] or "").strip()
+            records.append((
+                number,
+                normalize_seller(str(row[1] or "").strip()),
+                str(row[3] or ""),
+                parse_date(row[3]),
+                parse_amount(row[4]),
+                str(row[4] or ""),
+                str(row[5] or "") if len(row) > 5 else "",
+                str(row[6] or "") if len(row) > 6 else "",
+                source_file,
+                page,
+                image_path,
+                session,
+                datetime.now().isoformat(timespec="seconds"),
+            ))
+        if not records:
+            return {}
+
+        with self._lock, self._conn:
+            # 立即取得写锁：其他连接（进程）在本事务提交前不能写入，查找结果到写入时仍然有效
+            self._conn.execute("BEGIN IMMEDIATE")
+            known = self._find_numbers(record[0] for record in records)
+            batch = {}  # 号码 -> 本批中首条记录
+            for record in records:
+                cursor = self._conn.execute(
+                    "INSERT INTO invoices (invoice_number, seller, invoice_date, date_key, amount, amount_text, "
+                    "item, invoice_type, source_file, page, image_path, session, created_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", record)
+                number, source_file = record[0], record[8]
+                if not number:
+                    continue
+                first = batch.get(number)
+                if first is None:
+                    batch[number] = _record_dict(cursor.lastrowid, record)
+                elif first["source_file"] != source_file and first not in known.get(number, ()):
+                    known.setdefault(number, []).append(first)
+        return known
+
+    def find_file(self, digest):
+        """按文件内容哈希查找已处理过的文件，没有时返回 None"""
+        with self._lock:
+            row = self._conn.execute("SELECT digest, path, session, created_at FROM files WHERE digest = ?",
+                                     (digest,)).fetchone()
+        return dict(row) if row is not None else None
+
+    def add_files(self, digests, session=""):
+        """记录已处理的文件 {内容哈希: 文件路径}（已有记录的保留首次出现的路径）"""
+        created_at = datetime.now().isoformat(timespec="seconds")
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO files (digest, path, session, created_at) VALUES (?, ?, ?, ?)",
+                [(digest, path, session, created_at) for digest, path in digests.items()])
+
+    def search(self, query, limit=1000):
+        """按 ResultQuery 查询，返回记录dict列表（按写入时间倒序）"""
+        clauses, params = [], []
+        if query.number:
+            clauses.append("invoice_number = ?")
+            params.append(query.number)
+        if query.seller:
+            clauses.append("seller LIKE ?")
+            params.append(f"%{query.seller}%")
+        if query.item:
+            clauses.append("item LIKE ?")
+            params.append(f"%{query.item}%")
+        for column, low, high in (("amount", query.min_amount, query.max_amount),
+                                  ("date_key", query.date_from, query.date_to)):
+            if low is not None:
+                clauses.append(f"{column} >= ?")
+                params.append(low)
+            if high is not None:
+                clauses.append(f"{column} <= ?")
+                params.append(high)
+        sql = f"SELECT {', '.join(RECORD_FIELDS)} FROM invoices"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += " ORDER BY id DESC LIMIT ?"
+        params.append(int(limit))
+        with self._lock:
+            return [dict(row) for row in self._conn.execute(sql, params)]
+
+    def duplicates(self, limit=1000):
+        """出现多次的发票号码 [{"invoice_number", "count", "sources"}]"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT invoice_number, COUNT(*) AS count, GROUP_CONCAT(source_file, '\n') AS sources "
+                "FROM invoices WHERE invoice_number != '' GROUP BY invoice_number "
+                "HAVING COUNT(*) > 1 ORDER BY count DESC LIMIT ?", (int(limit),)).fetchall()
+        return [{"invoice_number": row["invoice_number"], "count": row["count"],
+                 "sources": sorted(set((row["sources"] or "").split("\n")))} for row in rows]
+
+    def stats(self):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT COUNT(*) AS records, COUNT(DISTINCT NULLIF(invoice_number, '')) AS numbers, "
+                "COUNT(DISTINCT session) AS sessions, MIN(created_at) AS first, MAX(created_at) AS last "
+                "FROM invoices").fetchone()
+            files = self._conn.execute("SELECT COUNT(*) FROM files").fetchone()[0]
+        return dict(row, files=files, path=self.path)
+
+
+_shared_store = None
+_shared_store_lock = threading.Lock()
+
+
+def get_shared_store():
+    """按配置返回共享的发票库；未启用或打开失败时返回 None"""
+    global _shared_store
+    with _shared_store_lock:
+        if _shared_store is None:
+            config = load_store_config()
+            if not config.get("enabled", True):
+                return None
+            try:
+                _shared_store = InvoiceStore(get_store_path(config))
+            except (sqlite3.Error, OSError) as e:
+                log.warning("发票库打开失败，本次不保存历史记录: %s", e)
+                return None
+        return _shared_store
+
+
+def main(argv=None):
+    argv = list(sys.argv[1:] if argv is None else argv)
+    if not argv:
+        print(__doc__)
+        return 1
+
+    command, options = argv[0], {}
+    args = argv[1:]
+    for name, value in zip(args[::2], args[1::2]):
+        options[name.lstrip("-")] = value
+    limit = int(options.get("limit", 1000))
+
+    if not os.path.exists(get_store_path()):
+        print("发票库尚不存在")
+        return 1
+    store = InvoiceStore()
+    if command == "query":
+        query = ResultQuery(
+            number=options.get("number", ""),
+            seller=options.get("seller", ""),
+            item=options.get("item", ""),
+            min_amount=parse_amount(options.get("min-amount")),
+            max_amount=parse_amount(options.get("max-amount")),
+            date_from=parse_date_bound(options.get("from", "")),
+            date_to=parse_date_bound(options.get("to", ""), end=True),
+        )
+        result = store.search(query, limit)
+    elif command == "duplicates":
+        result = store.duplicates(limit)
+    elif command == "stats":
+        result = store.stats()
+    else:
+        print(__doc__)
+        return 1
+    print(json.dumps(result, ensure_ascii=False, indent=2, default=str))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+票据类型识别与模板提取 - 先按页面前几行（票头）判断票据类型，再用该类型的少量针对性规则
+在固定区域内取值（如旧版增值税发票的销售方在页面底部、全电发票的销售方在右侧）。
+模板取不到的字段仍交给版面配对（PageLayout）与通用正则规则（FieldExtractor）。
+
+区域为相对页面内容范围（所有文本框的外接矩形）的比例坐标 (x0, y0, x1, y1)；
+没有文本框位置时，带区域的规则不使用。
+"""
+
+import re
+import numpy as np
+
+from FieldExtractor import FIELD_AMOUNT, FIELD_COMPANY, FIELD_DATE, FIELD_NUMBER, FIELD_PROJECT, load_extract_config
+
+TYPE_DIGITAL = "全电发票"
+TYPE_VAT_SPECIAL = "增值税专用发票"
+TYPE_VAT_GENERAL = "增值税普通发票"
+TYPE_TRAIN = "火车票"
+TYPE_TAXI = "出租车票"
+TYPE_TOLL = "通行费发票"
+TYPE_OTHER = "其他票据"
+
+# 结果行中票据类型的下标（[文件路径, 开票公司, 发票号码, 日期, 金额, 项目名称, 票据类型]）
+TYPE_INDEX = 6
+
+# 票头判断使用的行数
+HEAD_LINES = 8
+
+# 类型: (票头标题（在前几行出现即判定，按顺序优先），正文特征（每出现一个计1分）, 版面宽高比范围)
+# 全电发票的标题“电子发票（增值税专用发票）”也含“增值税专用发票”，所以排在最前
+SIGNATURES = [
+    (TYPE_DIGITAL, re.compile(r'电子发票[（(](?:普通发票|增值税专用发票)[）)]'),
+     re.compile('购买方信息|销售方信息|下载次数'), None),
+    (TYPE_TRAIN, re.compile('铁路电子客票|中国铁路|电子客票号'),
+     re.compile('检票|车次|二等座|一等座|商务座|硬卧|软卧|硬座|开$|限乘当日'), (1.2, 2.5)),
+    (TYPE_TOLL, re.compile('通行费'),
+     re.compile('收费站|入口|出口|车牌|车型|通行日期'), None),
+    (TYPE_TAXI, re.compile('出租汽车|出租车'),
+     re.compile('上车|下车|里程|等候|车号|单价'), (0.2, 0.8)),
+    (TYPE_VAT_SPECIAL, re.compile('增值税专用发票'),
+     re.compile('发票代码|密码区|抵扣联|发票联'), None),
+    (TYPE_VAT_GENERAL, re.compile('增值税(?:电子)?普通发票'),
+     re.compile('发票代码|密码区|校验码|机器编号'), None),
+]
+# 只靠正文特征判定时所需的最低分
+MIN_BODY_SCORE = 2
+
+_DATE = r'([0-9]{4})\s*[年.\-/]\s*([0-9]{1,2})\s*[月.\-/]\s*([0-9]{1,2})'
+_TOTAL = r'[（(]小写[）)]\s*[￥¥]?\s*([0-9]+\.[0-9]{1,2})'
+
+# 模板规则: 字段 -> [(正则, 区域或 None)]；正则在单个文本行内查找，取最后一个分组；
+# 值为 str 的规则表示该类型的固定取值（如项目名称）
+TEMPLATES = {
+    TYPE_DIGITAL: {
+        FIELD_NUMBER: [(r'发票号码[：:]?\s*([0-9]{20})', None)],
+        FIELD_DATE: [(r'开票日期[：:]?\s*' + _DATE, None)],
+        FIELD_AMOUNT: [(_TOTAL, None)],
+        FIELD_COMPANY: [(r'^名称[：:]\s*(\S.{1,60})$', (0.5, 0.0, 1.0, 0.5))],  # 销售方在右侧
+        FIELD_PROJECT: [(r'^\*[^*]+\*(.{2,})$', None)],
+    },
+    TYPE_VAT_SPECIAL: {
+        FIELD_NUMBER: [(r'(?:发票号码|No)[：:.]?\s*([0-9]{8})$', None),
+                       (r'^([0-9]{8})$', (0.6, 0.0, 1.0, 0.25))],          # 右上角的号码
+        FIELD_DATE: [(r'开票日期[：:]?\s*' + _DATE, None)],
+        FIELD_AMOUNT: [(_TOTAL, None)],
+        FIELD_COMPANY: [(r'^名\s*称[：:]\s*(\S.{1,60})$', (0.0, 0.65, 0.75, 1.0))],  # 销售方在底部
+        FIELD_PROJECT: [(r'^\*[^*]+\*(.{2,})$', None)],
+    },
+    TYPE_TRAIN: {
+        FIELD_NUMBER: [(r'发票号码[：:]?\s*([0-9]{20})', None),
+                       (r'^([A-Z][0-9]{6})$', (0.0, 0.0, 0.4, 0.25))],     # 纸质车票左上角的票号
+        FIELD_DATE: [(_DATE + r'\s*日?\s*[0-9]{1,2}[:：][0-9]{2}\s*开', None),
+                     (r'开票日期[：:]?\s*' + _DATE, None)],
+        FIELD_AMOUNT: [(r'^[￥¥]\s*([0-9]+\.[0-9]{1,2})\s*元?$', None)],
+        FIELD_COMPANY: "中国国家铁路集团有限公司",
+        FIELD_PROJECT: "铁路旅客运输服务",
+    },
+    TYPE_TAXI: {
+        FIELD_NUMBER: [(r'发票号码[：:]?\s*([0-9]{8,20})', None)],
+        FIELD_DATE: [(r'日期[：:]?\s*' + _DATE, None), (r'^' + _DATE + r'$', None)],
+        FIELD_AMOUNT: [(r'^(?:金额|实收|合计)[：:]?\s*[￥¥]?\s*([0-9]+\.[0-9]{1,2})\s*元?$', None)],
+        FIELD_COMPANY: [(r'^(\S{2,30}(?:出租汽车|出租车|客运|汽车)\S{0,10}公司)$', None)],
+        FIELD_PROJECT: "出租车客运服务",
+    },
+    TYPE_TOLL: {
+        FIELD_NUMBER: [(r'发票号码[：:]?\s*([0-9]{8,20})', None)],
+        FIELD_DATE: [(r'开票日期[：:]?\s*' + _DATE, None)],
+        FIELD_AMOUNT: [(_TOTAL, None)],
+        FIELD_COMPANY: [(r'^名\s*称[：:]\s*(\S*(?:高速|公路|路桥|交通)\S*公司)$', None)],
+        FIELD_PROJECT: "通行费",
+    },
+}
+# 旧版普通发票与专用发票版式相同
+TEMPLATES[TYPE_VAT_GENERAL] = TEMPLATES[TYPE_VAT_SPECIAL]
+
+# 模板取值的权重（用于字段置信度，与规则/标签权重同一尺度）；固定取值不依赖识别结果
+TEMPLATE_WEIGHT = 1.0
+FIXED_VALUE_WEIGHT = 0.9
+
+
+def classify_texts(texts, aspect=None):
+    """票据类型：票头标题优先，其次按正文特征得分（宽高比符合时加1分），都不满足时为 TYPE_OTHER"""
+    head = "\n".join(texts[:HEAD_LINES])
+    for invoice_type, title, _, _ in SIGNATURES:
+        if title.search(head):
+            return invoice_type
+    body = "\n".join(texts)
+    best, best_score = TYPE_OTHER, MIN_BODY_SCORE - 1
+    for invoice_type, title, features, aspect_range in SIGNATURES:
+        score = len(features.findall(body)) + (2 if title.search(body) else 0)
+        if aspect is not None and aspect_range and aspect_range[0] <= aspect <= aspect_range[1]:
+            score += 1
+        if score > best_score:
+            best, best_score = invoice_type, score
+    return best
+
+
+def _relative_centers(boxes):
+    """文本框中心相对页面内容范围的比例坐标 (N, 2) 与内容范围宽高比"""
+    x0, y0 = boxes[:, 0].min(), boxes[:, 1].min()
+    x1, y1 = boxes[:, 2].max(), boxes[:, 3].max()
+    width, height = max(float(x1 - x0), 1.0), max(float(y1 - y0), 1.0)
+    centers = np.stack([((boxes[:, 0] + boxes[:, 2]) / 2 - x0) / width,
+                        ((boxes[:, 1] + boxes[:, 3]) / 2 - y0) / height], axis=1)
+    return centers, width / height
+
+
+def _parse(field, match):
+    groups = match.groups()
+    if field == FIELD_DATE:
+        year, month, day = (int(part) for part in groups[-3:])
+        if not (2000 <= year <= 2030 and 1 <= month <= 12 and 1 <= day <= 31):
+            return None
+        return f"{year}{month:02d}{day:02d}"
+    if field == FIELD_AMOUNT:
+        return float(groups[-1])
+    value = groups[-1].strip()
+    return value or None
+
+
+class TemplateExtractor:
+    """按票据类型路由的模板提取（规则在创建时编译，实例可在多个线程间共享）"""
+
+    def __init__(self, templates=None):
+        self.templates = {}
+        for invoice_type, fields in (templates or TEMPLATES).items():
+            compiled = {}
+            for field, rules in fields.items():
+                compiled[field] = rules if isinstance(rules, str) else [
+                    (re.compile(pattern), region) for pattern, region in rules]
+            self.templates[invoice_type] = compiled
+
+    def classify(self, layout):
+        aspect = _relative_centers(layout.boxes)[1] if layout.has_boxes else None
+        return classify_texts(layout.texts, aspect)
+
+    def extract(self, layout, invoice_type=None):
+        """返回 (票据类型, {字段: (取值, 行下标, 行下标, 权重)})；固定取值的行下标为 -1"""
+        if not len(layout):
+            return TYPE_OTHER, {}
+        centers = None
+        aspect = None
+        if layout.has_boxes:
+            centers, aspect = _relative_centers(layout.boxes)
+        if invoice_type is None:
+            invoice_type = classify_texts(layout.texts, aspect)
+        found = {}
+        for field, rules in self.templates.get(invoice_type, {}).items():
+            if isinstance(rules, str):
+                found[field] = (rules, -1, -1, FIXED_VALUE_WEIGHT)
+                continue
+            value = self._extract_field(field, rules, layout.texts, centers)
+            if value is not None:
+                found[field] = value
+        return invoice_type, found
+
+    @staticmethod
+    def _extract_field(field, rules, texts, centers):
+        for pattern, region in rules:
+            if region is not None and centers is None:
+                continue  # 没有位置信息时不使用依赖区域的规则
+            for line, text in enumerate(texts):
+                if region is not None:
+                    x, y = centers[line]
+                    if not (region[0] <= x <= region[2] and region[1] <= y <= region[3]):
+                        continue
+                match = pattern.search(text.strip())
+                if match:
+                    value = _parse(field, match)
+                    if value is not None:
+                        return value, line, line, TEMPLATE_WEIGHT
+        return None
+
+
+_shared_templates = None
+
+
+def get_template_extractor():
+    """按配置返回共享的模板提取器；"extract" 节 templates 为 false 时返回 None（仍会识别票据类型）"""
+    global _shared_templates
+    if _shared_templates is None:
+        _shared_templates = TemplateExtractor() if load_extract_config().get("templates", True) else False
+    return _shared_templates or None
+
+
+def extract_template_fields(layout):
+    """(票据类型, 模板字段 {字段: (取值, 行下标, 行下标, 权重)})；未启用模板时只识别类型"""
+    if layout is None or not len(layout):
+        return TYPE_OTHER, {}
+    extractor = get_template_extractor()
+    if extractor is None:
+        aspect = _relative_centers(layout.boxes)[1] if layout.has_boxes else None
+        return classify_texts(layout.texts, aspect), {}
+    return extractor.extract(layout)
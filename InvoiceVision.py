@@ -2,20 +2,35 @@
 # -*- coding: utf-8 -*-
 """
 离线版GUI界面 - 完全离线运行的发票OCR识别器 (外部模型架构)
+启动时只导入 PyQt5 与轻量模块；pandas、numpy/cv2/fitz 及 Paddle 在首次使用时才导入，
+OCR引擎在后台线程中预热，窗口可立即显示。
 """
 
 from PyQt5 import QtCore, QtGui, QtWidgets
 import sys
 from PyQt5.QtWidgets import (QFileDialog, QApplication, QPushButton,
-                            QMessageBox, QMainWindow, QTextEdit,
+                            QMessageBox, QMainWindow,
                             QSplitter, QWidget, QVBoxLayout, QHBoxLayout,
                             QTabWidget,
                             QFrame, QGroupBox, QGridLayout,
                             QProgressBar,
-                            QTableWidget, QTableWidgetItem, QHeaderView, QAbstractItemView)
+                            QTableView, QHeaderView, QAbstractItemView)
 from PyQt5.Qt import QThread, pyqtSignal
-from PyQt5.QtCore import Qt
-from MainAction import ocr_pdf_offline, ocr_images_offline
+from PyQt5.QtCore import Qt, QTimer
+from OCRDaemon import connect_daemon, load_daemon_config, spawn_daemon
+from ResultTableModel import InvoiceResultModel
+from LogView import LogSink, LogView, load_log_config
+from ProgressTracker import format_eta
+from JobQueue import JobScheduler, JobQueuePanel
+from IngestPipeline import ARCHIVE_EXTENSIONS, PDF_EXTENSIONS
+from resource_utils import SUPPORTED_IMAGE_FORMATS
+from ResultExporter import ExportThread, EXPORT_FILTER, resolve_export_path
+from PagePreview import PagePreviewPanel
+from ResultIndex import ResultQuery, parse_amount, parse_date_bound
+from InvoiceStore import get_shared_store
+from DuplicateProbe import load_dedup_config
+from FieldConfidence import load_refine_config, low_confidence_fields
+from StructuredLog import get_logger
 try:
     # 注意：使用ModelManager.py（大写M），不是model_manager.py
     from ModelManager import ModelManager, check_and_setup_models
@@ -36,81 +51,55 @@ except ImportError as e:
         return True
 import os
 import json
-import pandas as pd
+import logging
 from datetime import datetime
+from concurrent.futures import Future
 
-class OfflineOCRThread(QThread):
-    """离线OCR处理线程基类"""
-    finished = pyqtSignal()
-    progress = pyqtSignal(str)
-    result = pyqtSignal(dict)
-    ocr_result = pyqtSignal(dict)  # 新增：OCR结果信号
-    
-    def __init__(self):
-        super().__init__()
-        self.file_path = ''
-        self.precision_mode = '快速'
-        self.output_dir = ''  # 输出目录
-
-class PDFOCRThread(OfflineOCRThread):
-    """PDF离线OCR处理线程"""
-    def run(self):
-        try:
-            self.progress.emit("正在处理PDF文件...")
-            result = ocr_pdf_offline(self.file_path, self.precision_mode, self.output_dir)
-            self.progress.emit("PDF处理完成！")
-            self.ocr_result.emit(result or {})
-            self.result.emit({"success": True, "type": "PDF", "result": result})
-        except Exception as e:
-            self.progress.emit(f"处理出错: {e}")
-            self.result.emit({"success": False, "error": str(e)})
-        finally:
-            self.finished.emit()
+PROGRESS_REFRESH_MS = 100  # 进度显示刷新间隔（毫秒），工作线程只更新计数
+gui_log = get_logger("InvoiceVision")
 
-class ImageOCRThread(OfflineOCRThread):
-    """图片文件夹离线OCR处理线程"""
-    def run(self):
-        try:
-            self.progress.emit("正在处理图片文件夹...")
-            result = ocr_images_offline(self.file_path, self.precision_mode, self.output_dir)
-            self.progress.emit("图片处理完成！")
-            self.ocr_result.emit(result or {})
-            self.result.emit({"success": True, "type": "Images", "result": result})
-        except Exception as e:
-            self.progress.emit(f"处理出错: {e}")
-            self.result.emit({"success": False, "error": str(e)})
-        finally:
-            self.finished.emit()
+def warm_up_ocr(precision_mode):
+    """预热OCR引擎（可在后台线程调用，不涉及界面）
+    Returns:
+        tuple: (是否成功, 失败类型 None/'import'/'init'/'error', 说明)
+    """
+    # 常驻守护进程已持有预热的引擎时，无需在本进程初始化
+    if connect_daemon(precision_mode) is not None:
+        return True, None, "已连接OCR守护进程，跳过本地引擎初始化"
+    if load_daemon_config().get("autostart"):
+        spawn_daemon(precision_mode)
+        gui_log.info("已在后台启动OCR守护进程，下次启动将直接使用")
+    
+    try:
+        # 动态导入OCRInvoice模块（numpy/cv2 在此时才加载）
+        import OCRInvoice
+    except ImportError as e:
+        return False, "import", str(e)
+    
+    try:
+        if OCRInvoice.OfflineOCRInvoice.global_initialize_ocr(precision_mode):
+            return True, None, "OCR引擎预初始化成功"
+        return False, "init", "OCR引擎预初始化失败"
+    except Exception as e:
+        import traceback
+        return False, "error", f"{e}\n{traceback.format_exc()}"
 
-class PDFBatchOCRThread(OfflineOCRThread):
-    """PDF 批量离线OCR处理线程"""
-    def __init__(self):
+class OCRWarmupThread(QThread):
+    """后台预热OCR引擎，完成后通过 ready 信号与 future 通知"""
+    ready = pyqtSignal(bool, str, str)  # 是否成功, 失败类型, 说明
+    
+    def __init__(self, precision_mode='快速'):
         super().__init__()
-        self.files = []  # PDF 文件列表
+        self.precision_mode = precision_mode
+        self.future = Future()
     
     def run(self):
         try:
-            total = len(self.files)
-            success_count = 0
-            for idx, pdf_path in enumerate(self.files, start=1):
-                self.progress.emit(f"正在处理PDF ({idx}/{total}): {os.path.basename(pdf_path)}")
-                try:
-                    result = ocr_pdf_offline(pdf_path, self.precision_mode, self.output_dir)
-                    if result:
-                        self.ocr_result.emit(result)
-                        # 统计识别成功的条数（粗略按是否有数据判断）
-                        if result.get('invoice_data'):
-                            success_count += 1
-                except Exception as e:
-                    self.progress.emit(f"处理出错: {os.path.basename(pdf_path)} - {e}")
-            
-            self.progress.emit(f"PDF批量处理完成，共 {total} 个，成功 {success_count} 个")
-            self.result.emit({"success": True, "type": "PDF批量", "result": {"total": total, "success": success_count}})
+            success, kind, message = warm_up_ocr(self.precision_mode)
         except Exception as e:
-            self.progress.emit(f"批量处理出错: {e}")
-            self.result.emit({"success": False, "error": str(e)})
-        finally:
-            self.finished.emit()
+            success, kind, message = False, "error", str(e)
+        self.future.set_result(success)
+        self.ready.emit(success, kind or "", message)
 
 class OfflineInvoiceOCRMainWindow(QMainWindow):
     """离线版主窗口类 - 现代化界面"""
@@ -118,8 +107,13 @@ class OfflineInvoiceOCRMainWindow(QMainWindow):
     def __init__(self):
         super().__init__()
         
-        # 初始化调试日志
+        # 初始化调试日志（界面只保留最近的行，完整日志写入滚动日志文件）
+        self.log_config = load_log_config()
+        self.debug_log_sink = LogSink("debug", self.log_config)
+        self.raw_data_sink = LogSink("raw_data", self.log_config)
         self.log_debug("=== InvoiceVision 启动 ===", "INFO")
+        if self.debug_log_sink.log_file:
+            self.log_debug(f"日志文件: {self.debug_log_sink.log_file}", "INFO")
         
         self.offline_status = self.check_offline_status()
         self.log_debug(f"离线状态: {self.offline_status}", "INFO")
@@ -132,14 +126,26 @@ class OfflineInvoiceOCRMainWindow(QMainWindow):
         self.model_manager = ModelManager()
         self.check_models_on_startup()
         
-        # 🔥 关键修改：预初始化OCR引擎（在主线程中）
-        self.log_debug("预初始化OCR引擎...", "INFO")
-        self.global_ocr_initialized = self.pre_initialize_ocr()
+        self.global_ocr_initialized = False
+        
+        # 识别任务队列：多个任务共享工作线程池并发执行（引擎预热期间提交的任务会等待预热完成）
+        self.job_scheduler = JobScheduler(parent=self)
+        self.job_scheduler.job_result.connect(self.on_job_result)
+        self.job_scheduler.job_changed.connect(self.on_job_changed)
+        self.job_scheduler.queue_idle.connect(self.on_queue_finished)
+        self.reported_jobs = set()  # 已提示过结束状态的任务
+        self.setAcceptDrops(True)   # 拖入PDF、图片、文件夹或压缩包即加入任务队列
+        self.job_filter = None      # 结果表当前筛选的任务
+        self.export_thread = None       # 正在进行的一次性导出
+        self.continuous_export = None   # 边识别边导出的导出线程
         
         self.log_debug("设置用户界面...", "DEBUG")
         self.setup_ui()
-        self.pdf_thread = None
-        self.image_thread = None
+        
+        # 🔥 OCR引擎在后台线程预热，窗口无需等待
+        self.log_debug("后台预初始化OCR引擎...", "INFO")
+        self.warmup_thread = self.pre_initialize_ocr()
+        self.ocr_ready_future = self.warmup_thread.future
         
         self.log_debug("初始化完成", "INFO")
         
@@ -205,95 +211,58 @@ class OfflineInvoiceOCRMainWindow(QMainWindow):
             QMessageBox.critical(None, "下载错误", f"下载过程出错: {e}")
         
     def pre_initialize_ocr(self):
-        """预初始化OCR引擎 - 在主线程中完成，避免后续阻塞"""
-        try:
-            # 动态导入OCRInvoice模块
-            import OCRInvoice
-            
-            # 获取当前精度模式
-            precision_mode = '快速'  # 默认使用快速模式启动
-            
-            self.log_debug(f"开始预初始化OCR引擎，模式: {precision_mode}", "INFO")
-            
-            # 调用全局初始化方法
-            success = OCRInvoice.OfflineOCRInvoice.global_initialize_ocr(precision_mode)
-            
-            if success:
-                self.log_debug("[SUCCESS] OCR引擎预初始化成功", "INFO")
-                return True
-            else:
-                self.log_debug("[ERROR] OCR引擎预初始化失败", "ERROR")
-                # 显示警告但不阻止启动
-                QMessageBox.warning(
-                    None,
-                    "OCR初始化警告", 
-                    "OCR引擎预初始化失败，程序可能无法正常识别发票。\n\n"
-                    "可能的原因：\n"
-                    "1. 模型文件缺失或损坏\n"
-                    "2. 依赖库不完整\n"
-                    "3. 系统资源不足\n\n"
-                    "您可以通过调试工具查看详细错误信息。"
-                )
-                return False
-                
-        except ImportError as e:
-            self.log_debug(f"[ERROR] OCRInvoice模块导入失败: {e}", "ERROR")
+        """在后台线程预初始化OCR引擎，返回预热线程（其 future 在完成时给出结果）"""
+        # 获取当前精度模式
+        precision_mode = '快速'  # 默认使用快速模式启动
+        
+        self.log_debug(f"开始预初始化OCR引擎，模式: {precision_mode}", "INFO")
+        self.set_ocr_indicator("loading")
+        
+        thread = OCRWarmupThread(precision_mode)
+        thread.ready.connect(self.on_ocr_warmup_finished)
+        thread.start()
+        return thread
+    
+    def on_ocr_warmup_finished(self, success, kind, message):
+        """预热完成回调（主线程）"""
+        self.global_ocr_initialized = success
+        self.set_ocr_indicator("ready" if success else "failed")
+        
+        if success:
+            self.log_debug(f"[SUCCESS] {message}", "INFO")
+        elif kind == "import":
+            self.log_debug(f"[ERROR] OCRInvoice模块导入失败: {message}", "ERROR")
             QMessageBox.critical(
-                None,
+                self,
                 "模块导入错误",
-                f"无法导入OCRInvoice模块:\n{str(e)}\n\n"
+                f"无法导入OCRInvoice模块:\n{message}\n\n"
                 "这可能是打包问题，请检查所有必要文件是否包含在内。"
             )
-            return False
-        except Exception as e:
-            self.log_debug(f"[ERROR] OCR预初始化异常: {e}", "ERROR")
-            import traceback
-            self.log_debug(f"详细错误:\n{traceback.format_exc()}", "ERROR")
-            return False
+        elif kind == "init":
+            self.log_debug("[ERROR] OCR引擎预初始化失败", "ERROR")
+            # 显示警告但不阻止使用
+            QMessageBox.warning(
+                self,
+                "OCR初始化警告", 
+                "OCR引擎预初始化失败，程序可能无法正常识别发票。\n\n"
+                "可能的原因：\n"
+                "1. 模型文件缺失或损坏\n"
+                "2. 依赖库不完整\n"
+                "3. 系统资源不足\n\n"
+                "您可以通过调试工具查看详细错误信息。"
+            )
+        else:
+            self.log_debug(f"[ERROR] OCR预初始化异常: {message}", "ERROR")
     
-    def ensure_ocr_ready(self, precision_mode):
-        """确保OCR引擎就绪，如有必要重新初始化"""
-        try:
-            import OCRInvoice
-            
-            # 检查当前状态
-            status = OCRInvoice.OfflineOCRInvoice.get_initialization_status()
-            self.log_debug(f"当前OCR状态: {status}", "DEBUG")
-            
-            if status == "ready":
-                self.log_debug("OCR引擎已就绪", "DEBUG")
-                return True
-            elif status == "failed":
-                self.log_debug("OCR引擎之前初始化失败，尝试重新初始化", "INFO")
-            elif status == "pending":
-                self.log_debug("OCR引擎未初始化，现在初始化", "INFO")
-            
-            # 重新初始化
-            self.log_debug(f"重新初始化OCR引擎，模式: {precision_mode}", "INFO")
-            success = OCRInvoice.OfflineOCRInvoice.global_initialize_ocr(precision_mode)
-            
-            if success:
-                self.log_debug("[SUCCESS] OCR引擎重新初始化成功", "INFO")
-                return True
-            else:
-                self.log_debug("[ERROR] OCR引擎重新初始化失败", "ERROR")
-                QMessageBox.critical(
-                    self,
-                    "OCR引擎错误", 
-                    f"OCR引擎初始化失败，无法处理文件。\n\n"
-                    f"当前模式: {precision_mode}\n"
-                    "请检查:\n"
-                    "1. 模型文件是否完整\n"
-                    "2. 系统内存是否充足\n"
-                    "3. 依赖库是否正确安装\n\n"
-                    "您可以通过【调试工具】查看详细错误信息。"
-                )
-                return False
-                
-        except Exception as e:
-            self.log_debug(f"[ERROR] ensure_ocr_ready异常: {e}", "ERROR")
-            QMessageBox.critical(self, "系统错误", f"OCR状态检查失败:\n{str(e)}")
-            return False
+    def set_ocr_indicator(self, state):
+        """更新标题栏中的OCR引擎状态指示"""
+        texts = {
+            "loading": "⏳ OCR引擎预热中…",
+            "ready": "🟢 OCR引擎就绪",
+            "failed": "🔴 OCR引擎不可用",
+        }
+        if hasattr(self, 'ocr_indicator_label'):
+            self.ocr_indicator_label.setText(texts.get(state, state))
     
     def setup_ui(self):
         """设置现代化UI界面"""
@@ -374,8 +343,13 @@ class OfflineInvoiceOCRMainWindow(QMainWindow):
             }
         """)
         
+        # OCR引擎状态指示（后台预热）
+        self.ocr_indicator_label = QtWidgets.QLabel("⏳ OCR引擎预热中…")
+        self.ocr_indicator_label.setStyleSheet(status_label.styleSheet())
+        
         header_layout.addWidget(title_label)
         header_layout.addStretch()
+        header_layout.addWidget(self.ocr_indicator_label)
         header_layout.addWidget(status_label)
         
         layout.addWidget(header_frame)
@@ -406,6 +380,14 @@ class OfflineInvoiceOCRMainWindow(QMainWindow):
         output_layout.addWidget(self.output_btn)
         settings_layout.addLayout(output_layout, 1, 1)
         
+        # 重复发票预检
+        self.skip_duplicates_check = QtWidgets.QCheckBox("跳过重复发票")
+        self.skip_duplicates_check.setToolTip("识别前跳过内容相同的文件，以及文本层/二维码中的发票号码已识别过的页面")
+        dedup_config = load_dedup_config()
+        self.skip_duplicates_check.setChecked(
+            bool(dedup_config["skip_identical_files"] or dedup_config["probe_numbers"]))
+        settings_layout.addWidget(self.skip_duplicates_check, 2, 0, 1, 2)
+        
         control_layout.addWidget(settings_group)
         
         # 操作组
@@ -427,6 +409,11 @@ class OfflineInvoiceOCRMainWindow(QMainWindow):
         self.image_button.clicked.connect(self.handle_image_folder)
         actions_layout.addWidget(self.image_button)
         
+        # 混合来源按钮（PDF、图片、压缩包可一起选择；也可直接拖入窗口）
+        self.mixed_button = QPushButton("📥 处理混合文件（PDF/图片/压缩包）")
+        self.mixed_button.clicked.connect(self.handle_mixed_files)
+        actions_layout.addWidget(self.mixed_button)
+        
         control_layout.addWidget(actions_group)
         
         # 模型状态组
@@ -470,38 +457,59 @@ class OfflineInvoiceOCRMainWindow(QMainWindow):
         # 结果标签页
         self.result_tabs = QTabWidget()
         
-        # OCR结果选项卡 - 使用表格显示
-        self.result_table = QTableWidget()
-        self.result_table.setColumnCount(5)
-        self.result_table.setHorizontalHeaderLabels(["开票公司名称", "发票号码", "发票日期", "项目名称", "金额（价税合计）"])
+        # OCR结果选项卡 - 使用虚拟化表格显示（数据由模型按需提供）
+        self.result_model = InvoiceResultModel(self.accumulated_results, self)
+        self.refine_config = load_refine_config()
+        self.result_model.confidence_threshold = float(self.refine_config.get("min_confidence", 0.6))
+        self.result_table = QTableView()
+        self.result_table.setModel(self.result_model)
         
         # 设置表格属性
         self.result_table.setAlternatingRowColors(True)
         self.result_table.setSelectionBehavior(QAbstractItemView.SelectRows)
         self.result_table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.result_table.horizontalHeader().setSortIndicator(-1, Qt.AscendingOrder)  # 初始按识别顺序
+        self.result_table.setSortingEnabled(True)
         self.result_table.verticalHeader().setVisible(False)
+        # 固定行高，避免逐行计算高度
+        self.result_table.verticalHeader().setSectionResizeMode(QHeaderView.Fixed)
+        self.result_table.verticalHeader().setDefaultSectionSize(32)
         
-        # 设置列宽自适应
+        # 列宽可手动调整；首批结果到达时按内容调整一次（ResizeToContents 会在每次插入时扫描全部行）
         header = self.result_table.horizontalHeader()
-        header.setSectionResizeMode(0, QHeaderView.ResizeToContents)  # 开票公司名称列自适应内容
-        header.setSectionResizeMode(1, QHeaderView.ResizeToContents)  # 发票号码列自适应内容
-        header.setSectionResizeMode(2, QHeaderView.ResizeToContents)  # 发票日期列自适应内容
-        header.setSectionResizeMode(3, QHeaderView.ResizeToContents)  # 项目名称列自适应内容
-        header.setSectionResizeMode(4, QHeaderView.ResizeToContents)  # 金额列自适应内容
-        
-        self.result_tabs.addTab(self.result_table, "📋 识别结果")
+        header.setSectionResizeMode(QHeaderView.Interactive)
+        header.setStretchLastSection(True)
+        
+        # 来源页面预览：选中结果行时显示对应页面并框出识别字段
+        self.preview_panel = PagePreviewPanel()
+        self.result_table.selectionModel().currentRowChanged.connect(self.on_result_row_changed)
+        
+        self.result_splitter = QSplitter(Qt.Horizontal)
+        self.result_splitter.addWidget(self.result_table)
+        self.result_splitter.addWidget(self.preview_panel)
+        self.result_splitter.setSizes([600, 400])
+        
+        self.result_page = QWidget()
+        result_page_layout = QVBoxLayout(self.result_page)
+        result_page_layout.setContentsMargins(0, 0, 0, 0)
+        result_page_layout.addWidget(self.create_filter_bar())
+        result_page_layout.addWidget(self.result_splitter)
+        self.result_tabs.addTab(self.result_page, "📋 识别结果")
+        
+        # 任务队列选项卡
+        self.job_panel = JobQueuePanel(self.job_scheduler)
+        self.job_panel.job_activated.connect(self.show_job_results)
+        self.result_tabs.addTab(self.job_panel, "🗂️ 任务队列")
         
         # 原始数据选项卡
-        self.raw_data_text = QTextEdit()
-        self.raw_data_text.setReadOnly(True)
+        self.raw_data_text = LogView(self.raw_data_sink)
         self.raw_data_text.setFont(QtGui.QFont("Consolas", 10))
         self.result_tabs.addTab(self.raw_data_text, "📊 原始数据")
         
         # 调试日志选项卡
-        self.debug_log_text = QTextEdit()
-        self.debug_log_text.setReadOnly(True)
+        self.debug_log_text = LogView(self.debug_log_sink)
         self.debug_log_text.setFont(QtGui.QFont("Consolas", 9))
-        self.debug_log_text.setStyleSheet("QTextEdit { background-color: #1e1e1e; color: #ffffff; }")
+        self.debug_log_text.setStyleSheet("QPlainTextEdit { background-color: #1e1e1e; color: #ffffff; }")
         self.result_tabs.addTab(self.debug_log_text, "🔍 调试日志")
         
         result_layout.addWidget(self.result_tabs)
@@ -509,21 +517,79 @@ class OfflineInvoiceOCRMainWindow(QMainWindow):
         # 结果操作按钮
         result_actions = QHBoxLayout()
         
-        self.export_btn = QPushButton("💾 导出Excel")
+        self.export_btn = QPushButton("💾 导出结果")
+        self.export_btn.setToolTip("导出为 Excel / CSV / Parquet（后台写入，导出中再次点击可取消）")
         self.export_btn.clicked.connect(self.export_results)
         self.export_btn.setEnabled(False)
         
+        self.continuous_export_check = QtWidgets.QCheckBox("边识别边导出")
+        self.continuous_export_check.setToolTip("选择文件后，已有结果与之后识别到的结果持续写入该文件")
+        self.continuous_export_check.toggled.connect(self.toggle_continuous_export)
+        
+        self.summary_export_check = QtWidgets.QCheckBox("附加汇总表")
+        self.summary_export_check.setToolTip("按开票公司、月份、项目名称汇总张数与金额，并列出重复的发票号码\n"
+                                             "（Excel 为附加工作表，CSV/Parquet 为同目录的单独文件）")
+        
         self.clear_btn = QPushButton("🗑️ 清空结果")
         self.clear_btn.clicked.connect(self.clear_results)
         
+        self.export_progress = QProgressBar()
+        self.export_progress.setVisible(False)
+        self.export_progress.setMaximumWidth(200)
+        
         result_actions.addWidget(self.export_btn)
+        result_actions.addWidget(self.continuous_export_check)
+        result_actions.addWidget(self.summary_export_check)
         result_actions.addWidget(self.clear_btn)
         result_actions.addStretch()
+        result_actions.addWidget(self.export_progress)
         
         result_layout.addLayout(result_actions)
         
         return result_widget
         
+    def create_filter_bar(self):
+        """创建结果筛选栏（通过内存索引查询，输入停顿后自动筛选）"""
+        filter_widget = QWidget()
+        filter_layout = QHBoxLayout(filter_widget)
+        filter_layout.setContentsMargins(0, 0, 0, 0)
+        
+        self.filter_fields = {}
+        for name, placeholder, width in [
+            ("number", "发票号码", 150),
+            ("seller", "开票公司", 140),
+            ("item", "项目名称", 110),
+            ("min_amount", "金额 ≥", 70),
+            ("max_amount", "金额 ≤", 70),
+            ("date_from", "起始日期", 90),
+            ("date_to", "截止日期", 90),
+        ]:
+            field = QtWidgets.QLineEdit()
+            field.setPlaceholderText(placeholder)
+            field.setMaximumWidth(width)
+            field.setClearButtonEnabled(True)
+            field.textChanged.connect(lambda _: self.filter_timer.start())
+            filter_layout.addWidget(field)
+            self.filter_fields[name] = field
+        self.filter_fields["date_from"].setToolTip("支持 2024、2024-03、2024-03-15 或 20240315")
+        self.filter_fields["date_to"].setToolTip("支持 2024、2024-03、2024-03-15 或 20240315（含当月/当年末）")
+        
+        clear_filter_btn = QPushButton("清除筛选")
+        clear_filter_btn.clicked.connect(self.clear_result_filter)
+        filter_layout.addWidget(clear_filter_btn)
+        
+        store_query_btn = QPushButton("🗄️ 查询发票库")
+        store_query_btn.setToolTip("按当前筛选条件查询历史会话保存的发票记录")
+        store_query_btn.clicked.connect(self.show_store_results)
+        filter_layout.addWidget(store_query_btn)
+        filter_layout.addStretch()
+        
+        self.filter_timer = QTimer(self)
+        self.filter_timer.setSingleShot(True)
+        self.filter_timer.setInterval(150)
+        self.filter_timer.timeout.connect(self.apply_result_filter)
+        return filter_widget
+    
     def create_status_bar(self, layout):
         """创建状态栏"""
         status_frame = QFrame()
@@ -536,12 +602,18 @@ class OfflineInvoiceOCRMainWindow(QMainWindow):
         # 进度条
         self.progress_bar = QProgressBar()
         self.progress_bar.setVisible(False)
-        self.progress_bar.setMaximumWidth(200)
+        self.progress_bar.setMaximumWidth(320)
         
         status_layout.addWidget(self.status_label)
         status_layout.addStretch()
         status_layout.addWidget(self.progress_bar)
         
+        # 进度按固定频率刷新，工作线程不直接驱动界面重绘
+        self.progress_tracker = None
+        self.progress_timer = QTimer(self)
+        self.progress_timer.setInterval(PROGRESS_REFRESH_MS)
+        self.progress_timer.timeout.connect(self.refresh_progress)
+        
         layout.addWidget(status_frame)
         
     def apply_modern_style(self):
@@ -613,7 +685,7 @@ class OfflineInvoiceOCRMainWindow(QMainWindow):
                 border-top-right-radius: 6px;
                 border-bottom-right-radius: 6px;
             }
-            QTableWidget {
+            QTableView {
                 border: 1px solid #dee2e6;
                 border-radius: 6px;
                 background-color: white;
@@ -621,29 +693,29 @@ class OfflineInvoiceOCRMainWindow(QMainWindow):
                 selection-background-color: #007bff;
                 font-size: 13px;
             }
-            QTableWidget::item {
+            QTableView::item {
                 padding: 8px;
                 border-bottom: 1px solid #e9ecef;
             }
-            QTableWidget::item:selected {
+            QTableView::item:selected {
                 background-color: #007bff;
                 color: white;
             }
-            QTableWidget::horizontalHeader {
+            QTableView::horizontalHeader {
                 background-color: #f8f9fa;
                 border: none;
                 border-bottom: 2px solid #dee2e6;
                 font-weight: bold;
                 padding: 8px;
             }
-            QTableWidget::horizontalHeader::section {
+            QTableView::horizontalHeader::section {
                 background-color: #f8f9fa;
                 border: none;
                 border-right: 1px solid #dee2e6;
                 padding: 8px;
                 font-weight: bold;
             }
-            QTextEdit {
+            QTextEdit, QPlainTextEdit {
                 border: 1px solid #dee2e6;
                 border-radius: 6px;
                 background-color: white;
@@ -743,24 +815,30 @@ class OfflineInvoiceOCRMainWindow(QMainWindow):
             return
         
         # 处理结果数据
+        new_rows = []
         if isinstance(results, dict) and 'invoice_data' in results:
             # 处理主处理函数返回的结果
             invoice_data = results['invoice_data']
             if isinstance(invoice_data, list):
                 # 添加到累积结果中
-                self.accumulated_results.extend(invoice_data)
+                new_rows = invoice_data
             elif isinstance(invoice_data, dict):
                 # 单个结果转换为列表格式
                 if 'data' in invoice_data:
-                    self.accumulated_results.extend(invoice_data['data'])
+                    new_rows = invoice_data['data']
         else:
             # 直接处理单个发票结果（从OCR返回的格式）
             # 假设results是单个发票的[文件路径, 发票代码, 发票号码, 日期, 金额]格式
             if isinstance(results, list) and len(results) >= 5:
-                self.accumulated_results.append(results)
+                new_rows = [results]
+        
+        # 记录PDF页面来源，预览时从原始PDF渲染；字段置信度用于标出低置信度单元格
+        if isinstance(results, dict):
+            self.preview_panel.add_page_sources(results.get('page_sources'))
+            self.result_model.add_field_confidence(results.get('field_confidence'))
         
-        # 更新表格显示
-        self.update_result_table()
+        # 更新表格显示（只插入新增的行）
+        self.append_result_rows(new_rows)
         
         # 存储结果用于导出
         self.ocr_results = results
@@ -768,92 +846,50 @@ class OfflineInvoiceOCRMainWindow(QMainWindow):
         # 启用导出按钮
         self.export_btn.setEnabled(True)
         
-        # 更新原始数据显示
+        # 更新原始数据显示（每条结果一行紧凑JSON，完整记录写入 raw_data.log）
         try:
-            formatted_json = json.dumps(results, ensure_ascii=False, indent=2)
-            self.raw_data_text.append("=" * 50)
-            self.raw_data_text.append(f"新识别结果 - {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-            self.raw_data_text.append("=" * 50)
-            self.raw_data_text.append(formatted_json)
-        except:
-            self.raw_data_text.append(str(results))
+            formatted_json = json.dumps(results, ensure_ascii=False)
+        except (TypeError, ValueError):
+            formatted_json = str(results)
+        self.raw_data_sink.write(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] {formatted_json}")
     
-    def update_result_table(self):
-        """更新结果表格"""
-        # 设置行数
-        self.result_table.setRowCount(len(self.accumulated_results))
-        
-        # 填充表格数据
-        for row, result in enumerate(self.accumulated_results):
-            if isinstance(result, list) and len(result) >= 6:
-                # [文件路径, 开票公司名称, 发票号码, 发票日期, 金额（价税合计）, 项目名称]
-                company_name = str(result[1]) if result[1] else ""
-                # 清理开票公司名称的前缀
-                if company_name.startswith("名称："):
-                    company_name = company_name[3:]  # 去掉"名称："前缀
-                
-                invoice_number = str(result[2]) if result[2] else ""
-                invoice_date = str(result[3]) if result[3] else ""
-                invoice_amount = str(result[4]) if result[4] else ""  # 金额（价税合计）
-                project_name = str(result[5]) if result[5] else ""  # 项目名称
-                
-                # 设置单元格内容（去掉文件路径列）
-                self.result_table.setItem(row, 0, QTableWidgetItem(company_name))
-                self.result_table.setItem(row, 1, QTableWidgetItem(invoice_number))
-                self.result_table.setItem(row, 2, QTableWidgetItem(invoice_date))
-                self.result_table.setItem(row, 3, QTableWidgetItem(project_name))  # 项目名称
-                self.result_table.setItem(row, 4, QTableWidgetItem(invoice_amount))  # 金额（价税合计）
-                
-                # 设置工具提示显示完整路径
-                self.result_table.item(row, 0).setToolTip(str(result[0]))
-            elif isinstance(result, list) and len(result) >= 5:
-                # 兼容旧格式（5个字段）
-                # [文件路径, 开票公司名称, 发票号码, 日期, 金额(价税合计)]
-                company_name = str(result[1]) if result[1] else ""
-                # 清理开票公司名称的前缀
-                if company_name.startswith("名称："):
-                    company_name = company_name[3:]  # 去掉"名称："前缀
-                
-                invoice_number = str(result[2]) if result[2] else ""
-                invoice_date = str(result[3]) if result[3] else ""
-                invoice_amount = str(result[4]) if result[4] else ""
-                
-                # 设置单元格内容（去掉文件路径列）
-                self.result_table.setItem(row, 0, QTableWidgetItem(company_name))
-                self.result_table.setItem(row, 1, QTableWidgetItem(invoice_number))
-                self.result_table.setItem(row, 2, QTableWidgetItem(invoice_date))
-                self.result_table.setItem(row, 3, QTableWidgetItem(""))  # 项目名称为空
-                self.result_table.setItem(row, 4, QTableWidgetItem(invoice_amount))  # 金额（价税合计）
-                
-                # 设置工具提示显示完整路径
-                self.result_table.item(row, 0).setToolTip(str(result[0]))
+    def append_result_rows(self, rows):
+        """追加结果到表格模型（累积结果列表由模型维护）"""
+        first_batch = self.result_model.rowCount() == 0
+        self.result_model.append_rows(rows)
+        if self.continuous_export is not None:
+            self.continuous_export.append(rows)
+        if self.result_model.rowCount() == 0:
+            return
         
-        # 自动滚动到底部显示最新结果
-        if self.result_table.rowCount() > 0:
+        if first_batch:
+            # 首批结果按内容调整列宽
+            self.result_table.resizeColumnsToContents()
+        # 未排序时自动滚动到底部显示最新结果
+        if self.result_table.horizontalHeader().sortIndicatorSection() < 0:
             self.result_table.scrollToBottom()
     
     def clear_results(self):
         """清空所有结果"""
-        self.accumulated_results.clear()
+        self.result_model.clear()  # 同时清空 accumulated_results
+        self.preview_panel.clear()
         self.ocr_results = {}
-        self.result_table.setRowCount(0)
         self.raw_data_text.clear()
         self.debug_log_text.clear()
-        self.export_btn.setEnabled(False)
+        if self.export_thread is None:  # 导出中保留按钮用于取消
+            self.export_btn.setEnabled(False)
     
     def log_debug(self, message, level="INFO"):
         """添加调试日志"""
         timestamp = datetime.now().strftime("%H:%M:%S")
         log_entry = f"[{timestamp}] [{level}] {message}\n"
         
-        # 在控制台输出
-        print(log_entry.strip())
+        # 在控制台 / JSON 日志中输出（按 "logging" 节的级别与模块开关）
+        gui_log.log(logging.getLevelName(level) if level in ("DEBUG", "INFO", "WARNING", "ERROR") else logging.INFO,
+                    "[%s] [%s] %s", timestamp, level, message)
         
-        # 在调试日志窗口显示（如果组件已经创建）
-        if hasattr(self, 'debug_log_text') and self.debug_log_text:
-            self.debug_log_text.moveCursor(QtGui.QTextCursor.End)
-            self.debug_log_text.insertPlainText(log_entry)
-            self.debug_log_text.ensureCursorVisible()
+        # 写入日志缓冲，由调试日志窗口定时批量刷新（可在任意线程调用）
+        self.debug_log_sink.write(log_entry.rstrip("\n"))
     
     def show_debug_log(self):
         """显示调试日志窗口"""
@@ -1077,65 +1113,91 @@ class OfflineInvoiceOCRMainWindow(QMainWindow):
             import traceback
             self.log_debug(f"错误详情:\n{traceback.format_exc()}", "ERROR")
     
+    def choose_export_path(self, title):
+        """选择导出文件，返回补全扩展名后的路径（取消时返回空字符串）"""
+        file_path, selected_filter = QFileDialog.getSaveFileName(
+            self, 
+            title, 
+            os.path.join(self.output_dir, f'发票识别结果_{datetime.now().strftime("%Y%m%d_%H%M%S")}.xlsx'),
+            EXPORT_FILTER
+        )
+        return resolve_export_path(file_path, selected_filter) if file_path else ""
+    
     def export_results(self):
-        """导出结果到Excel"""
+        """导出结果（后台线程流式写入，导出中再次点击则取消）"""
+        if self.export_thread is not None:
+            self.export_thread.cancel()
+            return
         if not self.accumulated_results:
             QMessageBox.warning(self, "警告", "没有可导出的结果")
             return
-            
-        # 选择保存位置
-        file_path, _ = QFileDialog.getSaveFileName(
-            self, 
-            '保存Excel文件', 
-            os.path.join(self.output_dir, f'发票识别结果_{datetime.now().strftime("%Y%m%d_%H%M%S")}.xlsx'),
-            'Excel文件 (*.xlsx)'
-        )
         
-        if file_path:
-            try:
-                # 转换累积结果为DataFrame
-                data_list = []
-                for result in self.accumulated_results:
-                    if isinstance(result, list) and len(result) >= 6:
-                        # 新格式（6个字段）
-                        company_name = str(result[1]) if result[1] else ""
-                        # 清理开票公司名称的前缀
-                        if company_name.startswith("名称："):
-                            company_name = company_name[3:]  # 去掉"名称："前缀
-                        
-                        data_dict = {
-                            "开票公司名称": company_name,
-                            "发票号码": str(result[2]) if result[2] else "",
-                            "发票日期": str(result[3]) if result[3] else "",
-                            "项目名称": str(result[5]) if result[5] else "",
-                            "金额（价税合计）": str(result[4]) if result[4] else ""
-                        }
-                        data_list.append(data_dict)
-                    elif isinstance(result, list) and len(result) >= 5:
-                        # 兼容旧格式（5个字段）
-                        company_name = str(result[1]) if result[1] else ""
-                        # 清理开票公司名称的前缀
-                        if company_name.startswith("名称："):
-                            company_name = company_name[3:]  # 去掉"名称："前缀
-                        
-                        data_dict = {
-                            "开票公司名称": company_name,
-                            "发票号码": str(result[2]) if result[2] else "",
-                            "发票日期": str(result[3]) if result[3] else "",
-                            "项目名称": "",
-                            "金额（价税合计）": result[4] if result[4] else ""
-                        }
-                        data_list.append(data_dict)
-                
-                if data_list:
-                    df = pd.DataFrame(data_list)
-                    df.to_excel(file_path, index=False)
-                    QMessageBox.information(self, "成功", f"已导出 {len(data_list)} 条记录到: {file_path}")
-                else:
-                    QMessageBox.warning(self, "警告", "没有有效的数据可导出")
-                
-            except Exception as e:
-                QMessageBox.critical(self, "错误", f"导出失败: {str(e)}")
+        file_path = self.choose_export_path('导出识别结果')
+        if not file_path:
+            return
+        
+        # 只复制行引用；行的转换与写入在导出线程中分块进行
+        self.export_thread = ExportThread(file_path, self.accumulated_results,
+                                          summary=self.summary_export_check.isChecked(), parent=self)
+        self.export_thread.progress.connect(self.on_export_progress)
+        self.export_thread.done.connect(self.on_export_finished)
+        self.export_progress.setRange(0, max(1, self.export_thread.submitted))
+        self.export_progress.setValue(0)
+        self.export_progress.setVisible(True)
+        self.export_btn.setText("⏹️ 取消导出")
+        self.log_debug(f"开始导出 {self.export_thread.submitted} 条结果: {file_path}", "INFO")
+        self.export_thread.start()
+    
+    def on_export_progress(self, consumed, submitted):
+        self.export_progress.setRange(0, max(1, submitted))
+        self.export_progress.setValue(consumed)
+    
+    def on_export_finished(self, ok, message, count):
+        """一次性导出结束"""
+        self.export_thread = None
+        self.export_progress.setVisible(False)
+        self.export_btn.setText("💾 导出结果")
+        self.log_debug(f"导出结束: {message}（{count} 条）", "INFO" if ok else "WARNING")
+        if ok:
+            QMessageBox.information(self, "成功", f"已导出 {count} 条记录到: {message}")
+        elif message == "导出已取消":
+            self.update_status("导出已取消")
+        else:
+            QMessageBox.critical(self, "错误", message)
+    
+    def toggle_continuous_export(self, checked):
+        """开启/关闭边识别边导出"""
+        if not checked:
+            if self.continuous_export is not None:
+                self.continuous_export.finish()  # 写完后通过 done 信号通知
+                self.update_status("正在完成持续导出...")
+            return
+        
+        file_path = self.choose_export_path('边识别边导出到')
+        if not file_path:
+            self.continuous_export_check.blockSignals(True)
+            self.continuous_export_check.setChecked(False)
+            self.continuous_export_check.blockSignals(False)
+            return
+        
+        self.continuous_export = ExportThread(file_path, self.accumulated_results, continuous=True,
+                                              summary=self.summary_export_check.isChecked(), parent=self)
+        self.continuous_export.done.connect(self.on_continuous_export_finished)
+        self.continuous_export.start()
+        self.log_debug(f"边识别边导出: {file_path}（Excel 文件在关闭持续导出后写完）", "INFO")
+        self.update_status(f"边识别边导出: {os.path.basename(file_path)}")
+    
+    def on_continuous_export_finished(self, ok, message, count):
+        """持续导出结束（关闭或出错）"""
+        self.continuous_export = None
+        self.continuous_export_check.blockSignals(True)
+        self.continuous_export_check.setChecked(False)
+        self.continuous_export_check.blockSignals(False)
+        self.log_debug(f"持续导出结束: {message}（{count} 条）", "INFO" if ok else "ERROR")
+        if ok:
+            self.update_status(f"已导出 {count} 条记录到: {os.path.basename(message)}")
+        else:
+            QMessageBox.critical(self, "错误", f"持续导出失败: {message}")
     
     def handle_pdf_file(self):
         """处理PDF文件"""
@@ -1153,37 +1215,9 @@ class OfflineInvoiceOCRMainWindow(QMainWindow):
             precision_mode = self.precision_combo.currentText()
             self.log_debug(f"精度模式: {precision_mode}", "DEBUG")
             
-            # 🔥 检查OCR引擎状态，必要时重新初始化
-            if not self.ensure_ocr_ready(precision_mode):
-                return
-            
-            try:
-                # 创建并启动PDF批量处理线程
-                self.pdf_thread = PDFBatchOCRThread()
-                self.pdf_thread.files = file_paths
-                self.pdf_thread.precision_mode = precision_mode
-                self.pdf_thread.output_dir = self.output_dir  # 设置输出目录
-                self.pdf_thread.progress.connect(self.update_status)
-                self.pdf_thread.result.connect(self.on_processing_result)
-                self.pdf_thread.finished.connect(self.on_processing_finished)
-                self.pdf_thread.ocr_result.connect(self.display_ocr_results)  # 连接结果显示
-                
-                # 禁用按钮，显示进度条，开始处理
-                self.set_buttons_enabled(False)
-                self.progress_bar.setVisible(True)
-                self.progress_bar.setRange(0, 0)  # 不确定进度
-                if len(file_paths) == 1:
-                    self.update_status(f"📄 开始处理PDF: {os.path.basename(file_paths[0])}")
-                else:
-                    self.update_status(f"📄 开始批量处理PDF: {len(file_paths)} 个")
-                self.log_debug("启动PDF批量处理线程...", "DEBUG")
-                self.pdf_thread.start()
-                
-            except Exception as e:
-                self.log_debug(f"PDF处理失败: {str(e)}", "ERROR")
-                import traceback
-                self.log_debug(f"错误详情:\n{traceback.format_exc()}", "ERROR")
-                QMessageBox.critical(self, "错误", f"PDF处理失败:\n{str(e)}")
+            job = self.job_scheduler.submit_pdfs(file_paths, precision_mode, self.output_dir,
+                                                 skip_duplicates=self.skip_duplicates_check.isChecked())
+            self.on_job_submitted(job, f"📄 已加入任务队列: {job.name}")
         else:
             self.log_debug("用户取消了PDF文件选择", "DEBUG")
     
@@ -1202,34 +1236,9 @@ class OfflineInvoiceOCRMainWindow(QMainWindow):
             precision_mode = self.precision_combo.currentText()
             self.log_debug(f"精度模式: {precision_mode}", "DEBUG")
             
-            # 🔥 检查OCR引擎状态，必要时重新初始化
-            if not self.ensure_ocr_ready(precision_mode):
-                return
-            
-            try:
-                # 创建并启动图片处理线程
-                self.image_thread = ImageOCRThread()
-                self.image_thread.file_path = folder_path
-                self.image_thread.precision_mode = precision_mode
-                self.image_thread.output_dir = self.output_dir  # 设置输出目录
-                self.image_thread.progress.connect(self.update_status)
-                self.image_thread.result.connect(self.on_processing_result)
-                self.image_thread.finished.connect(self.on_processing_finished)
-                self.image_thread.ocr_result.connect(self.display_ocr_results)  # 连接结果显示
-                
-                # 禁用按钮，显示进度条，开始处理
-                self.set_buttons_enabled(False)
-                self.progress_bar.setVisible(True)
-                self.progress_bar.setRange(0, 0)  # 不确定进度
-                self.update_status(f"🖼️ 开始处理文件夹: {os.path.basename(folder_path)}")
-                self.log_debug("启动图片处理线程...", "DEBUG")
-                self.image_thread.start()
-                
-            except Exception as e:
-                self.log_debug(f"图片处理失败: {str(e)}", "ERROR")
-                import traceback
-                self.log_debug(f"错误详情:\n{traceback.format_exc()}", "ERROR")
-                QMessageBox.critical(self, "错误", f"图片处理失败:\n{str(e)}")
+            job = self.job_scheduler.submit_image_folder(folder_path, precision_mode, self.output_dir,
+                                                         skip_duplicates=self.skip_duplicates_check.isChecked())
+            self.on_job_submitted(job, f"🖼️ 已加入任务队列: {job.name}")
         else:
             self.log_debug("用户取消了图片文件夹选择", "DEBUG")
     
@@ -1262,54 +1271,234 @@ class OfflineInvoiceOCRMainWindow(QMainWindow):
         precision_mode = self.precision_combo.currentText()
         self.log_debug(f"精度模式: {precision_mode}", "DEBUG")
         
-        # 🔥 检查OCR引擎状态，必要时重新初始化
-        if not self.ensure_ocr_ready(precision_mode):
-            return
+        folder_name = os.path.basename(folder_path) or folder_path
+        job = self.job_scheduler.submit_pdfs(pdf_files, precision_mode, self.output_dir,
+                                             name=f"{folder_name}（{len(pdf_files)} 个PDF）",
+                                             skip_duplicates=self.skip_duplicates_check.isChecked())
+        self.on_job_submitted(job, f"📂 已加入任务队列: {job.name}")
+    
+    def handle_mixed_files(self):
+        """处理混合文件（PDF、图片、压缩包可多选）"""
+        self.log_debug("准备处理混合文件...", "INFO")
         
-        try:
-            # 创建并启动PDF批量处理线程
-            self.pdf_thread = PDFBatchOCRThread()
-            self.pdf_thread.files = pdf_files
-            self.pdf_thread.precision_mode = precision_mode
-            self.pdf_thread.output_dir = self.output_dir
-            self.pdf_thread.progress.connect(self.update_status)
-            self.pdf_thread.result.connect(self.on_processing_result)
-            self.pdf_thread.finished.connect(self.on_processing_finished)
-            self.pdf_thread.ocr_result.connect(self.display_ocr_results)
-            
-            # 禁用按钮，显示进度条，开始处理
-            self.set_buttons_enabled(False)
-            self.progress_bar.setVisible(True)
-            self.progress_bar.setRange(0, 0)
-            folder_name = os.path.basename(folder_path) or folder_path
-            self.update_status(f"📂 开始批量处理PDF（{folder_name}）：共 {len(pdf_files)} 个")
-            self.log_debug("启动PDF批量处理线程（文件夹）...", "DEBUG")
-            self.pdf_thread.start()
+        patterns = " ".join(f"*{ext}" for ext in PDF_EXTENSIONS + SUPPORTED_IMAGE_FORMATS + ARCHIVE_EXTENSIONS)
+        file_paths, _ = QFileDialog.getOpenFileNames(
+            self,
+            '选择PDF、图片或压缩包（可多选）',
+            './',
+            f'支持的文件 ({patterns})'
+        )
         
-        except Exception as e:
-            self.log_debug(f"PDF批量处理失败: {str(e)}", "ERROR")
-            import traceback
-            self.log_debug(f"错误详情:\n{traceback.format_exc()}", "ERROR")
-            QMessageBox.critical(self, "错误", f"PDF批量处理失败:\n{str(e)}")
+        if file_paths:
+            self.submit_sources(file_paths)
+        else:
+            self.log_debug("用户取消了混合文件选择", "DEBUG")
+    
+    def submit_sources(self, paths):
+        """混合来源（文件、文件夹、压缩包）展开为子任务后加入任务队列"""
+        self.log_debug(f"提交的文件/文件夹数: {len(paths)}", "INFO")
+        precision_mode = self.precision_combo.currentText()
+        self.log_debug(f"精度模式: {precision_mode}", "DEBUG")
+        
+        job = self.job_scheduler.submit_sources(paths, precision_mode, self.output_dir,
+                                                skip_duplicates=self.skip_duplicates_check.isChecked())
+        for path, reason in job.skipped_sources:
+            self.log_debug(f"已跳过 {os.path.basename(path)}：{reason}", "WARNING")
+        if not job.total_tasks:
+            QMessageBox.information(self, "提示", "未发现可识别的PDF、图片或压缩包。")
+            return
+        self.on_job_submitted(job, f"📥 已加入任务队列: {job.name}")
+    
+    def dragEnterEvent(self, event):
+        if event.mimeData().hasUrls():
+            event.acceptProposedAction()
+    
+    def dropEvent(self, event):
+        """拖入的文件与文件夹加入任务队列"""
+        paths = [url.toLocalFile() for url in event.mimeData().urls() if url.isLocalFile()]
+        if paths:
+            event.acceptProposedAction()
+            self.submit_sources(paths)
+    
+    def on_job_submitted(self, job, status_message):
+        """任务已加入队列：显示总体进度"""
+        self.log_debug(f"任务 #{job.id} 已入队: {job.name}（{job.precision_mode}，{job.total_tasks} 个子任务）", "INFO")
+        self.update_status(status_message)
+        if self.job_scheduler.tracker is not None and self.progress_tracker is not self.job_scheduler.tracker:
+            self.start_progress(self.job_scheduler.tracker)
+    
+    def on_job_result(self, job, result):
+        """子任务识别结果（归属于 job）"""
+        if result.get("invoice_data"):
+            self.display_ocr_results(result)
+        for path, first in (result.get("duplicate_files") or {}).items():
+            self.log_debug(f"已跳过 {os.path.basename(path)}：与已处理的 {first} 内容相同", "WARNING")
+        skipped = result.get("skipped_pages") or {}
+        if skipped:
+            pages = "、".join(f"第{page + 1}页({number})" for page, number in sorted(skipped.items()))
+            self.log_debug(f"已跳过发票号码已识别过的页面: {pages}", "WARNING")
+        refined = result.get("refined_pages") or []
+        if refined:
+            self.log_debug(f"{len(refined)} 页关键字段置信度低，已用高精引擎复核", "INFO")
+        for path, confidences in (result.get("field_confidence") or {}).items():
+            low = low_confidence_fields(confidences, self.refine_config)
+            if low:
+                detail = "、".join(f"{field} {confidences.get(field, 0.0):.2f}" for field in low)
+                self.log_debug(f"{os.path.basename(path)} 低置信度字段: {detail}（表格中以底色标出）", "WARNING")
+        known = result.get("known_duplicates") if isinstance(result, dict) else None
+        if known:
+            for number, records in known.items():
+                first = records[0]
+                self.log_debug(f"发票号码 {number} 已识别过 {len(records)} 次，"
+                               f"首次: {first['created_at']} {first['source_file']}", "WARNING")
+            self.update_status(f"⚠️ {len(known)} 张发票在发票库中已有记录（详见调试日志）")
+    
+    def on_job_changed(self, job):
+        """任务状态变化：结束时记录日志"""
+        if not job.finished or job.id in self.reported_jobs:
+            return
+        self.reported_jobs.add(job.id)
+        message = f"任务 #{job.id}「{job.name}」{job.state}：识别 {len(job.results)} 条"
+        if job.duplicate_files or job.skipped_pages:
+            message += f"，跳过重复文件 {job.duplicate_files} 个、重复发票页 {job.skipped_pages} 页"
+        if job.refined_pages:
+            message += f"，高精复核 {job.refined_pages} 页"
+        if job.failed:
+            message += f"，{job.failed} 个子任务失败"
+            for error in job.errors:
+                self.log_debug(f"  任务 #{job.id}: {error}", "ERROR")
+        self.log_debug(message, "ERROR" if job.failed else "INFO")
+        self.update_status(("[ERROR] " if job.failed else "[SUCCESS] ") + message)
+    
+    def result_query(self):
+        """由筛选栏输入构造查询条件"""
+        text = {name: field.text().strip() for name, field in self.filter_fields.items()}
+        return ResultQuery(
+            number=text["number"],
+            seller=text["seller"],
+            item=text["item"],
+            min_amount=parse_amount(text["min_amount"]),
+            max_amount=parse_amount(text["max_amount"]),
+            date_from=parse_date_bound(text["date_from"]),
+            date_to=parse_date_bound(text["date_to"], end=True),
+        )
+    
+    def apply_result_filter(self):
+        """按筛选栏条件筛选结果表"""
+        query = self.result_query()
+        self.job_filter = None
+        started = datetime.now()
+        self.result_model.apply_query(query)
+        if query.is_empty:
+            self.update_status("显示全部识别结果")
+            return
+        elapsed = (datetime.now() - started).total_seconds() * 1000
+        self.update_status(f"筛选结果: {self.result_model.rowCount()} 条（{elapsed:.0f} ms）")
+    
+    def clear_result_filter(self, apply=True):
+        """清空筛选栏"""
+        for field in self.filter_fields.values():
+            field.blockSignals(True)
+            field.clear()
+            field.blockSignals(False)
+        self.filter_timer.stop()
+        if apply:
+            self.apply_result_filter()
+    
+    def show_store_results(self):
+        """按筛选栏条件查询发票库（跨会话的历史记录）"""
+        store = get_shared_store()
+        if store is None:
+            QMessageBox.warning(self, "警告", "发票库未启用或无法打开")
+            return
+        limit = 1000
+        records = store.search(self.result_query(), limit=limit)
+        
+        columns = [("发票号码", "invoice_number"), ("开票公司", "seller"), ("日期", "invoice_date"),
+                   ("金额", "amount_text"), ("项目名称", "item"), ("发票类型", "invoice_type"),
+                   ("来源文件", "source_file"),
+                   ("页", "page"), ("识别时间", "created_at")]
+        dialog = QtWidgets.QDialog(self)
+        dialog.setWindowTitle(f"发票库查询 - {len(records)} 条" + ("（仅显示最近的记录）" if len(records) >= limit else ""))
+        dialog.resize(1000, 600)
+        table = QtWidgets.QTableWidget(len(records), len(columns), dialog)
+        table.setHorizontalHeaderLabels([title for title, _ in columns])
+        table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        table.verticalHeader().setVisible(False)
+        for row, record in enumerate(records):
+            for column, (_, key) in enumerate(columns):
+                value = record.get(key)
+                if key == "page" and value is not None:
+                    value = value + 1
+                table.setItem(row, column, QtWidgets.QTableWidgetItem("" if value is None else str(value)))
+        table.resizeColumnsToContents()
+        layout = QVBoxLayout(dialog)
+        layout.addWidget(table)
+        dialog.exec_()
+    
+    def show_job_results(self, job):
+        """结果表只显示某个任务的结果；再次选择同一任务时恢复显示全部"""
+        if self.job_filter is job:
+            self.job_filter = None
+            self.result_model.set_filter(None)
+            self.update_status("显示全部识别结果")
+        else:
+            self.clear_result_filter(apply=False)  # 任务筛选与筛选栏条件不叠加
+            self.job_filter = job
+            self.result_model.set_filter(lambda result: id(result) in job.result_ids)
+            self.update_status(f"仅显示任务 #{job.id}「{job.name}」的识别结果（再次双击恢复全部）")
+        self.result_tabs.setCurrentWidget(self.result_page)
+    
+    def on_result_row_changed(self, current, previous):
+        """预览选中行的来源页面，并预取前后几行"""
+        if not current.isValid():
+            self.preview_panel.show_result(None)
+            return
+        row = current.row()
+        span = self.preview_panel.config["prefetch_rows"]
+        rows = range(max(0, row - span), min(self.result_model.rowCount(), row + span + 1))
+        neighbours = [self.result_model.result_at(r) for r in rows if r != row]
+        self.preview_panel.show_result(self.result_model.result_at(row), neighbours)
     
     def update_status(self, message):
         """更新状态显示"""
         self.status_label.setText(message)
-        QApplication.processEvents()  # 强制更新UI
     
-    def on_processing_result(self, result):
-        """处理结果回调"""
-        if result.get("success", False):
-            file_type = result.get("type", "文件")
-            self.update_status(f"[SUCCESS] {file_type}处理成功！")
-        else:
-            error = result.get("error", "未知错误")
-            self.update_status(f"[ERROR] 处理失败: {error}")
+    def start_progress(self, tracker):
+        """显示进度条并开始定时刷新"""
+        self.progress_tracker = tracker
+        self.progress_bar.setRange(0, 0)  # 尚未得到页数前显示忙碌状态
+        self.progress_bar.setFormat("%p%")
+        self.progress_bar.setVisible(True)
+        self.progress_timer.start()
     
-    def on_processing_finished(self):
-        """处理完成回调"""
-        self.set_buttons_enabled(True)
+    def stop_progress(self):
+        """停止进度刷新并隐藏进度条"""
+        self.progress_timer.stop()
+        self.progress_tracker = None
         self.progress_bar.setVisible(False)
+    
+    def refresh_progress(self):
+        """按固定频率读取进度快照，更新确定进度条与任务队列"""
+        if self.progress_tracker is None:
+            return
+        self.job_panel.refresh_active()
+        snapshot = self.progress_tracker.snapshot()
+        if not snapshot["estimated_pages"]:
+            return
+        if self.progress_bar.maximum() == 0:
+            self.progress_bar.setRange(0, 1000)
+        self.progress_bar.setValue(int(snapshot["fraction"] * 1000))
+        self.progress_bar.setFormat(
+            f"%p% · 页 {snapshot['pages_done']}/{snapshot['estimated_pages']}"
+            f" · 文件 {snapshot['files_done']}/{snapshot['total_files']}"
+            f" · 剩余 {format_eta(snapshot['eta'])}"
+        )
+    
+    def on_queue_finished(self):
+        """任务队列全部结束"""
+        self.stop_progress()
+        failed_jobs = [job for job in self.job_scheduler.jobs if job.failed]
         
         # 显示完成对话框
         msg = QMessageBox(self)
@@ -1317,41 +1506,35 @@ class OfflineInvoiceOCRMainWindow(QMainWindow):
         msg.setText('📄 发票信息识别完成！')
         
         if self.output_dir != os.getcwd():
-            msg.setInformativeText(f'📁 结果已保存到: {self.output_dir}\n\n📊 请在右侧查看识别结果。')
+            info = f'📁 结果已保存到: {self.output_dir}\n\n📊 请在右侧查看识别结果。'
         else:
-            msg.setInformativeText('📁 结果已保存为 Excel 文件，请查看当前目录。\n\n📊 请在右侧查看识别结果。')
+            info = '📁 结果已保存为 Excel 文件，请查看当前目录。\n\n📊 请在右侧查看识别结果。'
+        if failed_jobs:
+            info += f'\n\n⚠️ {len(failed_jobs)} 个任务有失败的文件，详见“任务队列”与调试日志。'
+        msg.setInformativeText(info)
         
-        msg.setIcon(QMessageBox.Information)
+        msg.setIcon(QMessageBox.Warning if failed_jobs else QMessageBox.Information)
         msg.exec_()
         
         mode_text = "🟢 离线运行" if self.offline_status else "🔴 在线运行"
         self.update_status(f"[SUCCESS] 就绪 - {mode_text}")
     
-    def set_buttons_enabled(self, enabled):
-        """设置按钮启用状态"""
-        self.pdf_button.setEnabled(enabled)
-        self.pdf_folder_button.setEnabled(enabled)
-        self.image_button.setEnabled(enabled)
-        self.precision_combo.setEnabled(enabled)
-        self.model_status_btn.setEnabled(enabled)
-        self.output_btn.setEnabled(enabled)  # 新增: 输出目录选择按钮
-    
     def closeEvent(self, event):
         """窗口关闭事件"""
-        # 优先温和中止线程，超时后再强制结束
-        for t in (self.pdf_thread, self.image_thread):
-            try:
-                if t and t.isRunning():
-                    try:
-                        t.requestInterruption()
-                    except Exception:
-                        pass
-                    # 尝试优雅退出
-                    if not t.wait(5000):
-                        t.terminate()
-                        t.wait(1000)
-            except Exception:
-                pass
+        # 取消全部任务：执行中的子任务在当前页结束后停止，超时后不再等待；随后释放OCR引擎
+        self.job_scheduler.shutdown()
+        self.preview_panel.shutdown()
+        # 一次性导出直接取消；持续导出写完已有结果再退出，保证文件完整
+        if self.export_thread is not None:
+            self.export_thread.cancel()
+            self.export_thread.wait()
+        if self.continuous_export is not None:
+            self.continuous_export.finish()
+            self.continuous_export.wait()
+        # 仅在工作池模块已加载时关闭（避免退出时额外导入）
+        worker_pool = sys.modules.get('OCRWorkerPool')
+        if worker_pool is not None:
+            worker_pool.shutdown_shared_pool()
         event.accept()
 
 def main():
@@ -0,0 +1,515 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+识别任务队列 - 多个PDF/文件夹/混合来源任务在同一个工作线程池上并发执行
+每个任务由 IngestPipeline 拆成若干子任务（一个PDF、一组图片或一个压缩包），调度器按优先级做加权轮转(stride scheduling)，
+任务可暂停、取消、调整优先级，识别结果按任务归属。
+"""
+
+import os
+import sys
+import itertools
+import threading
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from PyQt5.QtCore import QObject, pyqtSignal, Qt
+from PyQt5.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QPushButton,
+                             QTableWidget, QTableWidgetItem, QHeaderView, QAbstractItemView)
+
+from Cancellation import CancellationToken
+from DuplicateProbe import DuplicateFilter
+from InvoiceStore import get_shared_store
+from OCRDaemon import connect_daemon
+from ProgressTracker import ProgressTracker
+from IngestPipeline import (KIND_PDF, IngestTask, expand_sources, image_tasks, load_ingest_config, run_task,
+                            source_kind)
+from resource_utils import list_image_files, load_config_section
+from StructuredLog import get_logger
+
+log = get_logger("JobQueue")
+
+# 任务队列默认参数（可在 offline_config.json 的 "queue" 节覆盖）
+DEFAULT_QUEUE_CONFIG = {
+    "max_concurrent_tasks": 2,   # 同时执行的子任务数（PDF转换与识别提交并行）
+    "image_chunk_size": 16,      # 图片文件夹按多少张拆成一个子任务
+    "shutdown_timeout": 5,       # 退出时等待正在执行的子任务停止的秒数
+}
+
+# 任务状态
+STATE_QUEUED = "排队中"
+STATE_RUNNING = "运行中"
+STATE_PAUSED = "已暂停"
+STATE_CANCELLING = "取消中"
+STATE_CANCELLED = "已取消"
+STATE_DONE = "已完成"
+STATE_FAILED = "失败"
+
+MIN_PRIORITY = 1
+MAX_PRIORITY = 5
+_STRIDE = 1000.0  # 优先级越高，每次分发后推进的虚拟时间越少，获得的份额越多
+
+
+def load_queue_config():
+    """读取任务队列配置"""
+    return load_config_section("queue", DEFAULT_QUEUE_CONFIG)
+
+
+def get_remote_backend(precision_mode):
+    """优先连接常驻OCR守护进程，其次使用多进程工作池；均不可用时返回 None（进程内识别）"""
+    from OCRWorkerPool import get_shared_pool
+    return connect_daemon(precision_mode) or get_shared_pool(precision_mode)
+
+
+class OCRJob:
+    """一个识别任务：一组PDF、一个图片文件夹，或一组混合来源"""
+
+    def __init__(self, job_id, kind, name, tasks, precision_mode, output_dir, priority=MIN_PRIORITY,
+                 skip_duplicates=True):
+        self.id = job_id
+        self.kind = kind                    # "pdf"、"images" 或 "mixed"
+        self.name = name
+        self.precision_mode = precision_mode
+        self.output_dir = output_dir
+        self.priority = priority
+        self.skip_duplicates = skip_duplicates  # 预检跳过重复文件与已识别过的发票页
+        self.tasks = list(tasks)            # 尚未分发的子任务（IngestTask）
+        self.total_tasks = len(self.tasks)
+        self.running = 0
+        self.completed = 0
+        self.failed = 0
+        self.paused = False
+        self.cancelled = False
+        self.pass_value = 0.0               # 调度用的虚拟时间
+        self.tracker = None
+        self.token = None                   # CancellationToken，取消时正在执行的子任务在当前页结束后停止
+        self.results = []                   # 本任务的识别结果行
+        self.result_ids = set()             # 结果行对象的 id，用于在结果表中筛选本任务
+        self.errors = []
+        self.duplicate_files = 0            # 因内容相同跳过的文件数
+        self.skipped_pages = 0              # 因发票号码已识别过跳过的页数
+        self.refined_pages = 0              # 关键字段置信度低、经高精引擎复核的页数
+        self.skipped_sources = []           # 不支持或不存在的来源 [(路径, 原因)]
+
+    @property
+    def runnable(self):
+        return bool(self.tasks) and not self.paused and not self.cancelled
+
+    @property
+    def finished(self):
+        return self.running == 0 and (self.cancelled or not self.tasks)
+
+    @property
+    def state(self):
+        if self.cancelled:
+            return STATE_CANCELLED if self.running == 0 else STATE_CANCELLING
+        if self.finished:
+            return STATE_FAILED if self.failed and not self.completed else STATE_DONE
+        if self.paused:
+            return STATE_PAUSED
+        return STATE_RUNNING if self.running else STATE_QUEUED
+
+
+class JobScheduler(QObject):
+    """任务调度器（运行在主线程，子任务在线程池中执行）
+
+    同一时刻只运行同一精度模式的子任务：进程内引擎、守护进程与工作池都按精度模式初始化。
+    其他模式的任务虚拟时间最小时，当前模式不再分发新的子任务，运行中的子任务结束后切换过去，
+    因此任何一种模式都不会因同模式任务不断到来而一直占用工作线程。
+    """
+    job_changed = pyqtSignal(object)         # OCRJob 状态/进度变化
+    job_result = pyqtSignal(object, dict)    # OCRJob, 子任务识别结果
+    queue_idle = pyqtSignal()                # 全部任务结束
+    _task_done = pyqtSignal(object, object, object)  # 工作线程 -> 主线程: job, result, error
+    _readmit = pyqtSignal(str, object)               # 工作线程 -> 主线程: 重新放行的文件路径, job
+
+    def __init__(self, config=None, parent=None):
+        super().__init__(parent)
+        self.config = config or load_queue_config()
+        self.ingest_config = load_ingest_config()
+        self.max_workers = max(1, int(self.config["max_concurrent_tasks"]))
+        self.jobs = []
+        self.tracker = None                  # 当前这一轮任务的总体进度
+        self.session = datetime.now().isoformat(timespec="seconds")  # 写入发票库的会话标识
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="OCRJob")
+        self._ids = itertools.count(1)
+        self._running = 0
+        self._active_mode = None
+        self._batchers = {}
+        self._batcher_lock = threading.Lock()
+        self._shutdown_token = CancellationToken()  # 各任务令牌的父令牌，退出时一并取消
+        self._futures = set()
+        self.duplicates = DuplicateFilter(store=get_shared_store(), session=self.session,
+                                          on_readmit=self._readmit.emit)
+        self._task_done.connect(self._on_task_done, Qt.QueuedConnection)
+        self._readmit.connect(self._on_readmit, Qt.QueuedConnection)
+
+    # ---------- 提交与控制 ----------
+
+    def submit_sources(self, sources, precision_mode, output_dir, name=None, priority=MIN_PRIORITY,
+                       skip_duplicates=True):
+        """提交混合来源任务（PDF、图片文件、文件夹、压缩包），由 IngestPipeline 展开为子任务"""
+        sources = list(sources)
+        tasks, skipped = expand_sources(sources, self.config["image_chunk_size"], self.ingest_config)
+        name = name or (os.path.basename(sources[0].rstrip("/\\")) or sources[0] if len(sources) == 1
+                        else f"{len(sources)} 个文件/文件夹")
+        job = self._submit("mixed", name, tasks, precision_mode, output_dir, priority, skip_duplicates)
+        job.skipped_sources = skipped
+        return job
+
+    def submit_pdfs(self, pdf_files, precision_mode, output_dir, name=None, priority=MIN_PRIORITY,
+                    skip_duplicates=True):
+        """提交PDF任务，每个PDF是一个子任务"""
+        name = name or (os.path.basename(pdf_files[0]) if len(pdf_files) == 1 else f"{len(pdf_files)} 个PDF")
+        tasks = [IngestTask(KIND_PDF, pdf_path) for pdf_path in pdf_files]
+        return self._submit("pdf", name, tasks, precision_mode, output_dir, priority, skip_duplicates)
+
+    def submit_image_folder(self, folder_path, precision_mode, output_dir, priority=MIN_PRIORITY,
+                            skip_duplicates=True):
+        """提交图片文件夹任务（不含子目录），按 image_chunk_size 张拆成子任务"""
+        image_files = list_image_files(folder_path) if os.path.isdir(folder_path) else []
+        tasks = image_tasks(folder_path, image_files, self.config["image_chunk_size"])
+        name = os.path.basename(folder_path.rstrip("/\\")) or folder_path
+        return self._submit("images", name, tasks, precision_mode, output_dir, priority, skip_duplicates)
+
+    def pause(self, job):
+        if not job.finished:
+            job.paused = True
+            self.job_changed.emit(job)
+
+    def resume(self, job):
+        if job.paused:
+            job.paused = False
+            # 从当前虚拟时间继续，不因暂停期间落后而独占工作线程
+            job.pass_value = max(job.pass_value, self._min_pass())
+            self.job_changed.emit(job)
+            self._dispatch()
+
+    def cancel(self, job):
+        """取消任务：未开始的子任务不再执行，执行中的子任务在当前页结束后停止，已完成的结果保留"""
+        if job.finished:
+            return
+        job.cancelled = True
+        job.token.cancel()
+        job.tracker.add_files(-sum(task.files for task in job.tasks))
+        job.tasks = []
+        self.job_changed.emit(job)
+        self._check_idle()
+
+    def set_priority(self, job, priority):
+        job.priority = max(MIN_PRIORITY, min(MAX_PRIORITY, int(priority)))
+        self.job_changed.emit(job)
+
+    def remove_finished(self):
+        """从队列中移除已结束的任务"""
+        self.jobs = [job for job in self.jobs if not job.finished]
+
+    def has_active_jobs(self):
+        return any(not job.finished for job in self.jobs)
+
+    def shutdown(self, timeout=None):
+        """取消全部任务并停止线程池
+        正在执行的子任务最多等待 timeout 秒（默认取配置 shutdown_timeout），随后释放进程内OCR引擎
+        """
+        if timeout is None:
+            timeout = float(self.config.get("shutdown_timeout", DEFAULT_QUEUE_CONFIG["shutdown_timeout"]))
+        for job in self.jobs:
+            job.cancelled = True
+            job.tasks = []
+        self._shutdown_token.cancel()
+        self._executor.shutdown(wait=False)
+        _, still_running = wait(list(self._futures), timeout=timeout)
+
+        with self._batcher_lock:
+            batchers, self._batchers = self._batchers, {}
+        if still_running:
+            # 仍有子任务卡在一个识别批次中：不阻塞退出，后台关闭
+            log.warning("退出时仍有 %d 个子任务未停止，后台结束", len(still_running))
+            for batcher in batchers.values():
+                threading.Thread(target=batcher.close, daemon=True).start()
+            return
+        for batcher in batchers.values():
+            batcher.close()
+        # 仅在OCR模块已加载时释放引擎（避免退出时额外导入）
+        ocr_module = sys.modules.get('OCRInvoice')
+        if ocr_module is not None:
+            ocr_module.OfflineOCRInvoice.release_engine()
+
+    # ---------- 调度 ----------
+
+    def _submit(self, kind, name, tasks, precision_mode, output_dir, priority, skip_duplicates):
+        job = self._add_job(kind, name, tasks, precision_mode, output_dir, priority, skip_duplicates)
+        job.tracker.add_files(sum(task.files for task in tasks))
+        self._dispatch()
+        self._check_idle()  # 没有可识别的文件时任务立即结束
+        return job
+
+    def _add_job(self, kind, name, tasks, precision_mode, output_dir, priority, skip_duplicates=True):
+        if self.tracker is None:
+            self.tracker = ProgressTracker()
+        job = OCRJob(next(self._ids), kind, name, tasks, precision_mode, output_dir, priority, skip_duplicates)
+        job.tracker = ProgressTracker(parent=self.tracker)
+        job.token = CancellationToken(parent=self._shutdown_token)
+        job.pass_value = self._min_pass()
+        self.jobs.append(job)
+        self.job_changed.emit(job)
+        return job
+
+    def _min_pass(self):
+        values = [job.pass_value for job in self.jobs if job.runnable or job.running]
+        return min(values) if values else 0.0
+
+    def _next_job(self):
+        """选出虚拟时间最小的可运行任务；它与运行中的子任务精度模式不同时先不分发，等待切换"""
+        candidates = [job for job in self.jobs if job.runnable]
+        if not candidates:
+            return None
+        job = min(candidates, key=lambda job: (job.pass_value, job.id))
+        if self._running and job.precision_mode != self._active_mode:
+            return None
+        return job
+
+    def _dispatch(self):
+        while self._running < self.max_workers:
+            job = self._next_job()
+            if job is None:
+                break
+            task = job.tasks.pop(0)
+            job.running += 1
+            job.pass_value += _STRIDE / job.priority
+            self._running += 1
+            self._active_mode = job.precision_mode
+            future = self._executor.submit(self._run_task, job, task)
+            self._futures.add(future)
+            future.add_done_callback(self._futures.discard)
+            self.job_changed.emit(job)
+
+    def _get_batcher(self, precision_mode):
+        """按精度模式获取共享的微批处理器（工作线程中调用，可能需要初始化引擎）"""
+        with self._batcher_lock:
+            # 切换模式时当前模式已无运行中的子任务，可以关闭旧的批处理器
+            for mode in [mode for mode in self._batchers if mode != precision_mode]:
+                self._batchers.pop(mode).close()
+            batcher = self._batchers.get(precision_mode)
+            if batcher is not None and not getattr(batcher.ocr, "is_running", True):
+                # 工作池的工作进程意外退出：换用重建的工作池（或其他后端）
+                self._batchers.pop(precision_mode)
+                batcher.close()
+                batcher = None
+            if batcher is None:
+                from OCRInvoice import OfflineOCRInvoice, OCRMicroBatcher
+                backend = get_remote_backend(precision_mode)
+                if backend is None:
+                    self._init_local_engine(OfflineOCRInvoice, precision_mode)
+                batcher = OCRMicroBatcher(ocr=backend)
+                self._batchers[precision_mode] = batcher
+            return batcher
+
+    @staticmethod
+    def _init_local_engine(ocr_class, precision_mode):
+        """进程内识别：确保全局引擎按该精度模式初始化
+        引擎是其他模式初始化的（如预热或上一个任务）时释放后重建；切换模式时其他模式的子任务均已结束。
+        """
+        if ocr_class.global_initialize_ocr(precision_mode) and ocr_class.get_engine_mode() != precision_mode:
+            log.info("切换OCR引擎精度模式: %s -> %s", ocr_class.get_engine_mode(), precision_mode)
+            ocr_class.release_engine()
+            ocr_class.global_initialize_ocr(precision_mode)
+        if ocr_class.get_engine_mode() != precision_mode:
+            raise RuntimeError("OCR引擎初始化失败，请检查模型文件、内存与依赖库")
+
+    def _run_task(self, job, task):
+        """工作线程：执行一个子任务"""
+        result, error, claim = None, None, None
+        try:
+            if job.token.cancelled:  # 分发后、开始前已被取消
+                self._task_done.emit(job, None, None)
+                return
+            result, claim = run_task(task, job.precision_mode, job.output_dir, self._get_batcher, job.tracker,
+                                     job.token, self.duplicates if job.skip_duplicates else None,
+                                     self.config["image_chunk_size"], self.ingest_config, owner=job)
+            if result is None:
+                error = f"{task.label} 处理失败，详见调试日志"
+            if result and result.get("invoice_data"):
+                self._save_results(result)
+            if claim is not None and result is not None:
+                result.update(claim.as_result())
+        except Exception as e:
+            error = str(e)
+        if claim is not None:
+            self.duplicates.finish(claim, ok=not error and result is not None and not result.get("cancelled"))
+        self._task_done.emit(job, result, error)
+
+    def _save_results(self, result):
+        """工作线程：写入发票库，并记录库中已有相同发票号码的历史记录（跨会话查重）"""
+        store = get_shared_store()
+        if store is None:
+            return
+        try:
+            known = store.add_results(result["invoice_data"], result.get("page_sources"), self.session)
+        except Exception as e:
+            log.error("写入发票库失败: %s", e)
+            return
+        if known:
+            result["known_duplicates"] = known
+
+    def _on_task_done(self, job, result, error):
+        """主线程：子任务结束，归档结果并继续分发"""
+        self._running -= 1
+        job.running -= 1
+        if error:
+            job.failed += 1
+            job.errors.append(error)
+        else:
+            job.completed += 1
+        result = result or {}
+        expanded = result.pop("expanded_tasks", None)
+        if expanded is not None:
+            self._add_expanded(job, expanded)
+        rows = result.get("invoice_data") or []
+        job.duplicate_files += len(result.get("duplicate_files") or ())
+        job.skipped_pages += len(result.get("skipped_pages") or ())
+        job.refined_pages += len(result.get("refined_pages") or ())
+        if rows:
+            # 取消的子任务也保留已识别的页面
+            job.results.extend(rows)
+            job.result_ids.update(id(row) for row in rows)
+        if rows or result.get("duplicate_files") or result.get("skipped_pages"):
+            self.job_result.emit(job, result)
+        self.job_changed.emit(job)
+        self._dispatch()
+        self._check_idle()
+
+    def _add_expanded(self, job, tasks):
+        """压缩包解压出的子任务追加到同一任务（文件数已在解压时计入进度）"""
+        if job.cancelled:
+            job.tracker.add_files(-sum(task.files for task in tasks))
+            return
+        job.tasks.extend(tasks)
+        job.total_tasks += len(tasks)
+
+    def _on_readmit(self, path, job):
+        """主线程：与之相同的首个文件识别失败或被取消，此前跳过的文件作为新的子任务重新识别
+        （在首个文件的子任务结束通知之前到达，队列不会先判定为空闲）
+        """
+        if job is None or job.cancelled:
+            return
+        if source_kind(path) == KIND_PDF:
+            task = IngestTask(KIND_PDF, path)
+        else:
+            task = image_tasks(os.path.dirname(path), [os.path.basename(path)], 1)[0]
+        job.tasks.append(task)
+        job.total_tasks += 1
+        job.duplicate_files -= 1  # 跳过时计入的重复数（其结束通知可能稍后才到）
+        if job.tracker is not None:
+            job.tracker.add_files(task.files)
+        self.job_changed.emit(job)
+        self._dispatch()
+
+    def _check_idle(self):
+        """全部任务结束（暂停中的任务仍算未结束）时通知"""
+        if self._running or self.has_active_jobs():
+            return
+        self.tracker = None
+        self.queue_idle.emit()
+
+
+class JobQueuePanel(QWidget):
+    """任务队列面板：显示任务状态，支持暂停/继续、取消、调整优先级"""
+    job_activated = pyqtSignal(object)  # 双击任务（OCRJob），用于筛选该任务的结果
+
+    COLUMNS = ["任务", "模式", "优先级", "状态", "进度", "结果"]
+
+    def __init__(self, scheduler, parent=None):
+        super().__init__(parent)
+        self.scheduler = scheduler
+        self._rows = {}  # job.id -> 行号
+
+        layout = QVBoxLayout(self)
+        self.table = QTableWidget(0, len(self.COLUMNS))
+        self.table.setHorizontalHeaderLabels(self.COLUMNS)
+        self.table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.table.setSelectionMode(QAbstractItemView.SingleSelection)
+        self.table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.table.verticalHeader().setVisible(False)
+        self.table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeToContents)
+        self.table.horizontalHeader().setSectionResizeMode(0, QHeaderView.Stretch)
+        self.table.itemDoubleClicked.connect(lambda item: self._activate(item.row()))
+        layout.addWidget(self.table)
+
+        buttons = QHBoxLayout()
+        self.pause_btn = QPushButton("⏸️ 暂停/继续")
+        self.cancel_btn = QPushButton("⏹️ 取消")
+        self.up_btn = QPushButton("⬆️ 提高优先级")
+        self.down_btn = QPushButton("⬇️ 降低优先级")
+        self.clean_btn = QPushButton("🧹 移除已结束")
+        self.pause_btn.clicked.connect(self.toggle_pause)
+        self.cancel_btn.clicked.connect(lambda: self._with_selected(self.scheduler.cancel))
+        self.up_btn.clicked.connect(lambda: self._with_selected(
+            lambda job: self.scheduler.set_priority(job, job.priority + 1)))
+        self.down_btn.clicked.connect(lambda: self._with_selected(
+            lambda job: self.scheduler.set_priority(job, job.priority - 1)))
+        self.clean_btn.clicked.connect(self.remove_finished)
+        for button in (self.pause_btn, self.cancel_btn, self.up_btn, self.down_btn, self.clean_btn):
+            buttons.addWidget(button)
+        layout.addLayout(buttons)
+
+        scheduler.job_changed.connect(self.update_job)
+
+    def refresh_active(self):
+        """刷新未结束任务的进度（由界面定时调用）"""
+        for job in self.scheduler.jobs:
+            if job.running:
+                self.update_job(job)
+
+    def selected_job(self):
+        row = self.table.currentRow()
+        if row < 0:
+            return None
+        return self.table.item(row, 0).data(Qt.UserRole)
+
+    def _with_selected(self, action):
+        job = self.selected_job()
+        if job is not None:
+            action(job)
+
+    def _activate(self, row):
+        self.job_activated.emit(self.table.item(row, 0).data(Qt.UserRole))
+
+    def toggle_pause(self):
+        job = self.selected_job()
+        if job is None:
+            return
+        if job.paused:
+            self.scheduler.resume(job)
+        else:
+            self.scheduler.pause(job)
+
+    def remove_finished(self):
+        self.scheduler.remove_finished()
+        self.table.setRowCount(0)
+        self._rows = {}
+        for job in self.scheduler.jobs:
+            self.update_job(job)
+
+    def update_job(self, job):
+        """刷新一个任务所在的行"""
+        row = self._rows.get(job.id)
+        if row is None:
+            row = self.table.rowCount()
+            self.table.insertRow(row)
+            self._rows[job.id] = row
+        snapshot = job.tracker.snapshot()
+        values = [
+            job.name,
+            job.precision_mode,
+            str(job.priority),
+            job.state,
+            f"{int(snapshot['fraction'] * 100)}% ({job.completed + job.failed}/{job.total_tasks})",
+            f"{len(job.results)} 条" + (f"，{job.failed} 个失败" if job.failed else ""),
+        ]
+        for column, value in enumerate(values):
+            item = QTableWidgetItem(value)
+            if column == 0:
+                item.setData(Qt.UserRole, job)
+                item.setToolTip("\n".join(job.errors[-10:]) or job.name)
+            self.table.setItem(row, column, item)
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+有界日志视图 - 界面只保留最近的若干行，完整日志写入滚动日志文件
+任意线程调用 LogSink.write() 只把文本放入待刷新队列并写文件，
+界面端 LogView 由定时器批量取出后一次追加，避免逐条重绘。
+"""
+
+import logging
+import threading
+from collections import deque
+from logging.handlers import RotatingFileHandler
+from pathlib import Path
+
+from PyQt5.QtCore import QTimer
+from PyQt5.QtWidgets import QPlainTextEdit
+
+from resource_utils import load_config_section
+
+# 日志视图默认参数（可在 offline_config.json 的 "log" 节覆盖）
+DEFAULT_LOG_CONFIG = {
+    "max_lines": 5000,              # 每个日志视图保留的最大行数
+    "flush_interval_ms": 200,       # 界面刷新间隔（毫秒）
+    "log_dir": "",                  # 日志文件目录，默认 ~/.invoicevision/logs
+    "max_bytes": 5 * 1024 * 1024,   # 单个日志文件大小上限
+    "backup_count": 5,              # 保留的历史日志文件数
+}
+
+
+def load_log_config():
+    """读取日志配置"""
+    return load_config_section("log", DEFAULT_LOG_CONFIG)
+
+
+def get_log_dir(config=None):
+    """日志文件目录"""
+    config = config or load_log_config()
+    log_dir = Path(config.get("log_dir") or (Path.home() / ".invoicevision" / "logs"))
+    log_dir.mkdir(parents=True, exist_ok=True)
+    return log_dir
+
+
+class LogSink:
+    """线程安全的日志缓冲：待刷新的行有上限，完整内容写入滚动日志文件"""
+
+    def __init__(self, name, config=None):
+        self.name = name
+        self.config = config or load_log_config()
+        self.max_lines = max(1, int(self.config["max_lines"]))
+        self.dropped = 0  # 界面来不及刷新而丢弃的行数（文件中仍完整保留）
+        self._pending = deque(maxlen=self.max_lines)
+        self._lock = threading.Lock()
+        self._file_logger = self._create_file_logger()
+
+    def _create_file_logger(self):
+        logger = logging.getLogger(f"InvoiceVision.{self.name}")
+        logger.propagate = False
+        logger.setLevel(logging.INFO)
+        if logger.handlers:
+            return logger
+        try:
+            handler = RotatingFileHandler(
+                get_log_dir(self.config) / f"{self.name}.log",
+                maxBytes=int(self.config["max_bytes"]),
+                backupCount=int(self.config["backup_count"]),
+                encoding='utf-8', delay=True)
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            logger.addHandler(handler)
+        except OSError as e:
+            print(f"日志文件不可用，仅在界面显示: {e}")
+        return logger
+
+    @property
+    def log_file(self):
+        """当前日志文件路径（不可用时为 None）"""
+        for handler in self._file_logger.handlers:
+            if isinstance(handler, RotatingFileHandler):
+                return handler.baseFilename
+        return None
+
+    def write(self, text):
+        """写入一条日志（可在任意线程调用）"""
+        self._file_logger.info(text)
+        lines = text.splitlines() or [""]
+        with self._lock:
+            self.dropped += max(0, len(self._pending) + len(lines) - self.max_lines)
+            self._pending.extend(lines)
+
+    def drain(self):
+        """取出全部待刷新的行"""
+        with self._lock:
+            lines = list(self._pending)
+            self._pending.clear()
+        return lines
+
+
+class LogView(QPlainTextEdit):
+    """只读日志视图：按固定间隔批量追加，超过行数上限时自动丢弃最早的行"""
+
+    def __init__(self, sink, flush_interval_ms=None, parent=None):
+        super().__init__(parent)
+        self.sink = sink
+        self.setReadOnly(True)
+        self.setUndoRedoEnabled(False)
+        self.setMaximumBlockCount(sink.max_lines)  # Qt 内置的环形缓冲
+
+        if flush_interval_ms is None:
+            flush_interval_ms = sink.config["flush_interval_ms"]
+        self._timer = QTimer(self)
+        self._timer.setInterval(max(16, int(flush_interval_ms)))
+        self._timer.timeout.connect(self.flush)
+        self._timer.start()
+
+    def flush(self):
+        """把缓冲中的行一次性追加到视图"""
+        lines = self.sink.drain()
+        if not lines:
+            return
+        scrollbar = self.verticalScrollBar()
+        at_bottom = scrollbar.value() >= scrollbar.maximum() - 2
+        self.appendPlainText("\n".join(lines))
+        if at_bottom:
+            scrollbar.setValue(scrollbar.maximum())
+
+    def clear(self):
+        self.sink.drain()
+        super().clear()
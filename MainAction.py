@@ -2,228 +2,228 @@
 # -*- coding: utf-8 -*-
 """
 离线版主要操作模块 - 支持完全离线运行
+PDF 渲染出的页面与图片文件都经 ocr_pages 识别并整理为结果行；
+混合来源（PDF、图片、文件夹、压缩包）先由 IngestPipeline 拆成子任务，再调用这里的函数。
 """
 
 from OCRInvoice import OfflineOCRInvoice
 from PDF2IMG import pdf2img
-from pandas import DataFrame
-from os import listdir
 import os
+import logging
+from concurrent.futures import wait
+from resource_utils import list_image_files
+from Cancellation import OperationCancelled
+from StructuredLog import get_logger
 
-def ocr_pdf_offline(pdf_path, precision_mode, output_dir=None):
+log = get_logger("MainAction")
+
+def _get_local_engine(precision_mode):
+    """获取进程内的OCR识别器，全局引擎未初始化时返回 None"""
+    log.debug("创建OCR引擎实例...")
+    ocr_engine = OfflineOCRInvoice()
+    
+    # 检查全局OCR引擎状态
+    if ocr_engine.ocr_engine is None:
+        log.error("ERROR: 全局OCR引擎未初始化，请确保应用启动时已完成预初始化")
+        return None
+    
+    log.debug("✅ 使用全局OCR引擎，模式: %s", precision_mode)
+    
+    # 显示模型信息（需要检查模型文件，只在调试时获取）
+    if log.isEnabledFor(logging.DEBUG):
+        log.debug("OCR模型信息: %s", ocr_engine.get_model_info())
+    return ocr_engine
+
+def _run_ocr_batch(ocr_engine, image_paths, batcher=None, progress=None, files_per_page=0, cancel_token=None):
+    """按批次识别图片；提供 batcher 时提交到共享的微批处理器
+    progress: ProgressTracker（可选），每识别完一页计数一次
+    cancel_token: CancellationToken（可选），取消后未识别的页面结果为 None，已识别的保留
+    """
+    if batcher is not None:
+        futures = [batcher.submit(image_path) for image_path in image_paths]
+        if progress is not None:
+            for future in futures:
+                future.add_done_callback(
+                    lambda f: f.cancelled() or progress.advance(pages=1, files=files_per_page))
+        if cancel_token is None:
+            return [future.result() for future in futures]
+        # 取消时撤回尚未进入识别批次的页面
+        unregister = cancel_token.on_cancel(lambda: [future.cancel() for future in futures])
+        try:
+            wait(futures)
+        finally:
+            unregister()
+        return [None if future.cancelled() else future.result() for future in futures]
+    if progress is None and cancel_token is None:
+        return ocr_engine.run_ocr_batch(image_paths)
+    
+    # 逐批识别，每批完成后更新进度并检查取消
+    max_batch = max(1, int(ocr_engine.batch_config.get("max_batch_size", 1)))
+    results = []
+    for start in range(0, len(image_paths), max_batch):
+        chunk = image_paths[start:start + max_batch]
+        try:
+            results.extend(ocr_engine.run_ocr_batch(chunk, max_batch=max_batch, cancel_token=cancel_token))
+        except OperationCancelled:
+            break
+        if progress is not None:
+            progress.advance(pages=len(chunk), files=files_per_page * len(chunk))
+        if cancel_token is not None and cancel_token.cancelled:
+            break
+    results.extend([None] * (len(image_paths) - len(results)))
+    return results
+
+def _take_field_quality(result, quality):
+    """取出结果行末尾附带的字段置信度（OCRInvoice 追加在票据类型之后的字典）
+    quality: {"field_confidence": {图片路径: {字段: 置信度}}, "refined_pages": [图片路径]}，原地更新
+    """
+    if len(result) > 6 and isinstance(result[-1], dict):
+        info = result.pop()
+        quality["field_confidence"][result[0]] = info.get("confidence") or {}
+        if info.get("refined"):
+            quality["refined_pages"].append(result[0])
+
+def _cancelled_result():
+    """尚未识别任何页面即被取消时的结果"""
+    return {"total_files": 0, "processed_count": 0, "success_rate": "0%", "invoice_data": [], "cancelled": True}
+
+def _normalize_result(result):
+    """结果行的7个字段（识别结果均为7个字段，置信度已由 _take_field_quality 取出）：
+    文件路径, 公司名称, 发票号码, 日期, 金额, 项目名称, 发票类型"""
+    return list(result[:7])
+
+def ocr_pages(image_paths, precision_mode, batcher=None, progress=None, files_per_page=0, cancel_token=None):
+    """识别一组页面图片（PDF 渲染出的页面或图片文件），是 PDF 与图片共用的识别与结果整理步骤
+    Args:
+        image_paths: 页面图片路径
+        batcher / progress / cancel_token: 同 ocr_pdf_offline；页数由调用方计入 progress
+        files_per_page: 每识别完一页计入 progress 的文件数（图片为 1，PDF 页面为 0）
+    Returns:
+        dict: 识别结果（格式见 ocr_pdf_offline，不含 page_sources）；全局OCR引擎不可用时返回 None
+    """
+    image_paths = list(image_paths)
+    # 使用全局预初始化的引擎（由 batcher 提供识别后端时无需本地引擎）
+    ocr_engine = _get_local_engine(precision_mode) if batcher is None else None
+    if batcher is None and ocr_engine is None:
+        return None
+    
+    rows = []
+    processed_count = 0
+    quality = {"field_confidence": {}, "refined_pages": []}
+    if image_paths:
+        log.debug("找到 %d 个图片文件", len(image_paths))
+        ocr_results = _run_ocr_batch(ocr_engine, image_paths, batcher, progress, files_per_page,
+                                     cancel_token=cancel_token)
+        for image_path, result in zip(image_paths, ocr_results):
+            if result is None:  # 已取消，未识别
+                continue
+            log.debug("[%d/%d] 识别完成: %s", len(rows) + 1, len(image_paths), os.path.basename(image_path))
+            _take_field_quality(result, quality)
+            result = _normalize_result(result)
+            rows.append(result)
+            if result[1] or result[2]:  # 识别到公司名称或发票号码
+                processed_count += 1
+                log.debug("  识别成功: 公司=%s, 号码=%s", result[1], result[2])
+            else:
+                log.debug("  未识别到发票信息")
+    
+    success_rate = f"{processed_count/len(image_paths)*100:.1f}%" if image_paths else "0%"
+    log.info("处理完成！总计处理: %d 个文件，成功识别: %d 个发票，识别率: %s",
+             len(image_paths), processed_count, success_rate if image_paths else "N/A")
+    if log.isEnabledFor(logging.DEBUG) and rows:
+        log.debug("识别结果预览:\n%s", "\n".join(" | ".join(str(value) for value in row) for row in rows[:10]))
+    
+    result_data = {
+        "total_files": len(image_paths),
+        "processed_count": processed_count,
+        "success_rate": success_rate,
+        "invoice_data": rows,  # 结果行列表，每行同 _normalize_result
+        "cancelled": bool(cancel_token is not None and cancel_token.cancelled),
+    }
+    result_data.update(quality)
+    return result_data
+
+def ocr_pdf_offline(pdf_path, precision_mode, output_dir=None, batcher=None, progress=None, cancel_token=None,
+                    skip_pages=None):
     """
     离线处理PDF文件中的发票
     Args:
         pdf_path: PDF文件路径
         precision_mode: 精度模式 ('快速' 或 '高精')
         output_dir: 输出目录（可选）
+        batcher: OCRMicroBatcher（可选），多个PDF共享时页面跨文件合批识别
+        progress: ProgressTracker（可选），记录页数与已识别页数（文件完成数由调用方计数）
+        cancel_token: CancellationToken（可选），取消后在当前页结束时停止，返回已识别的部分结果
+        skip_pages: {页下标: 发票号码}（可选），预检确认重复的页面，不渲染也不识别
     Returns:
         dict: 包含识别结果的字典
     """
     try:
-        print(f"开始处理PDF: {pdf_path}")
-        print(f"精度模式: {precision_mode}")
-        
-        # 创建结果DataFrame
-        invoice_info = DataFrame(columns=['文件地址', '开票公司', '发票号码', '日期', '金额（价税合计）', '项目名称'])
+        log.info("开始处理PDF: %s（精度模式: %s）", pdf_path, precision_mode)
         
-        # 转换PDF为图片
-        print("正在将PDF转换为图片...")
+        # 转换PDF为图片（只使用本次渲染出的页面，目录中的旧文件不参与识别）
+        log.debug("正在将PDF转换为图片...")
         pdf_converter = pdf2img()
-        pdf_converter.pyMuPDF_fitz(pdf_path, output_dir=output_dir)
-        print(f"PDF转换完成，图片保存路径: {pdf_converter.imagePath}")
-        
-        # 初始化离线OCR识别器 - 使用全局预初始化的引擎
-        print("创建OCR引擎实例...")
-        ocr_engine = OfflineOCRInvoice()
-        
-        # 检查全局OCR引擎状态
-        if ocr_engine.ocr_engine is None:
-            print("ERROR: 全局OCR引擎未初始化，请确保应用启动时已完成预初始化")
-            return
-        
-        print(f"✅ 使用全局OCR引擎，模式: {precision_mode}")
-        
-        # 显示模型信息
-        model_info = ocr_engine.get_model_info()
-        print(f"OCR模型信息: {model_info}")
-        
-        # 处理所有转换后的图片
-        item_no = 1
-        processed_count = 0
-        
-        # 确保在路径不存在时变量可用，避免 NameError
-        image_files = []
-        
-        if os.path.exists(pdf_converter.imagePath):
-            image_files = [f for f in listdir(pdf_converter.imagePath) 
-                          if f.lower().endswith(('.jpg', '.jpeg', '.png', '.bmp'))]
-            
-            print(f"找到 {len(image_files)} 个图片文件")
-            
-            for filename in image_files:
-                print(f"[{item_no}/{len(image_files)}] 正在处理: {filename}")
-                image_path = os.path.join(pdf_converter.imagePath, filename)
-                
-                # 执行OCR识别
-                result = ocr_engine.run_ocr(image_path)
-                # 确保结果有正确的长度（6个字段：文件路径, 公司名称, 发票号码, 日期, 金额, 项目名称）
-                while len(result) < 6:
-                    result.append('')  # 补充空字段
-                if len(result) > 6:
-                    result = result[:6]  # 截断多余字段
-                invoice_info.loc[item_no] = result
-                
-                # 显示识别结果
-                if result[1] or result[2]:  # 如果识别到公司名称或发票号码
-                    processed_count += 1
-                    print(f"  识别成功: 公司={result[1]}, 号码={result[2]}")
-                else:
-                    print(f"  未识别到发票信息")
-                
-                item_no += 1
-        
-        print(f"\n处理完成！")
-        print(f"总计处理: {len(image_files)} 个文件")
-        print(f"成功识别: {processed_count} 个发票")
-        print(f"识别率: {processed_count/len(image_files)*100:.1f}%" if image_files else "N/A")
-        
-        # 显示结果预览
-        print("\n识别结果预览:")
-        print(invoice_info.to_string(index=False, max_rows=10))
-        
-        # 返回结果数据供界面显示 - 修改为兼容新GUI的格式
-        invoice_list = []
-        if not invoice_info.empty:
-            # 将DataFrame转换为列表格式
-            for _, row in invoice_info.iterrows():
-                invoice_list.append([
-                    row['文件地址'],     # 文件路径
-                    row['开票公司'],     # 开票公司名称
-                    row['发票号码'],     # 发票号码
-                    row['日期'],        # 发票日期
-                    row['金额（价税合计）'], # 发票金额
-                    row['项目名称']      # 项目名称
-                ])
-        
-        result_data = {
-            "total_files": len(image_files) if 'image_files' in locals() else 0,
-            "processed_count": processed_count,
-            "success_rate": f"{processed_count/len(image_files)*100:.1f}%" if 'image_files' in locals() and image_files else "0%",
-            "invoice_data": invoice_list  # 新的格式，直接是列表
-        }
-        
+        pdf_converter.pyMuPDF_fitz(pdf_path, output_dir=output_dir, cancel_token=cancel_token,
+                                   skip_pages=skip_pages)
+        log.debug("PDF转换完成，图片保存路径: %s", pdf_converter.imagePath)
+        if progress is not None and pdf_converter.imageFiles:
+            progress.add_pages(len(pdf_converter.imageFiles))
+        
+        result_data = ocr_pages(pdf_converter.imageFiles, precision_mode, batcher, progress,
+                                cancel_token=cancel_token)
+        if result_data is None:
+            return None
+        # 页面图片 -> [原始PDF路径, 页下标]，界面预览时从原始PDF渲染
+        result_data["page_sources"] = {image_path: [pdf_path, page_index]
+                                       for page_index, image_path in zip(pdf_converter.pageIndices,
+                                                                          pdf_converter.imageFiles)}
+        if skip_pages:
+            result_data["skipped_pages"] = dict(skip_pages)
         return result_data
         
+    except OperationCancelled:
+        log.info("PDF处理已取消: %s", pdf_path)
+        return _cancelled_result()
     except Exception as e:
-        print(f"PDF处理出错: {e}")
-        import traceback
-        traceback.print_exc()
+        log.error("PDF处理出错: %s", e, exc_info=True, extra={"source": pdf_path})
 
-def ocr_images_offline(image_folder_path, precision_mode, output_dir=None):
+def ocr_images_offline(image_folder_path, precision_mode, output_dir=None, batcher=None, progress=None,
+                       image_files=None, cancel_token=None):
     """
     离线处理图片文件夹中的发票
     Args:
         image_folder_path: 图片文件夹路径
         precision_mode: 精度模式 ('快速' 或 '高精')
         output_dir: 输出目录（可选）
+        batcher: OCRMicroBatcher（可选），与其他任务共享识别批次
+        progress: ProgressTracker（可选），每张图片计为一个文件、一页
+        image_files: 只处理文件夹中的这些图片（可选，默认处理全部；也可以是绝对路径），用于把大文件夹
+            拆成多个任务；此时文件总数由调用方计入 progress
+        cancel_token: CancellationToken（可选），取消后尽快停止，返回已识别的部分结果
     Returns:
         dict: 包含识别结果的字典
     """
     try:
-        print(f"开始处理图片文件夹: {image_folder_path}")
-        print(f"精度模式: {precision_mode}")
-        
-        # 创建结果DataFrame
-        invoice_info = DataFrame(columns=['文件地址', '开票公司', '发票号码', '日期', '金额（价税合计）', '项目名称'])
-        
-        # 初始化离线OCR识别器 - 使用全局预初始化的引擎
-        print("创建OCR引擎实例...")
-        ocr_engine = OfflineOCRInvoice()
-        
-        # 检查全局OCR引擎状态
-        if ocr_engine.ocr_engine is None:
-            print("ERROR: 全局OCR引擎未初始化，请确保应用启动时已完成预初始化")
-            return
-        
-        print(f"✅ 使用全局OCR引擎，模式: {precision_mode}")
-        
-        # 显示模型信息
-        model_info = ocr_engine.get_model_info()
-        print(f"OCR模型信息: {model_info}")
-        
-        # 处理文件夹中的所有图片
-        item_no = 1
-        processed_count = 0
-        supported_formats = ('.jpg', '.jpeg', '.png', '.bmp', '.tiff', '.webp')
-        
-        # 确保在路径不存在时变量可用，避免 NameError
-        image_files = []
-        
-        if os.path.exists(image_folder_path):
-            image_files = [f for f in listdir(image_folder_path) 
-                          if f.lower().endswith(supported_formats)]
-            
-            print(f"找到 {len(image_files)} 个图片文件")
-            
-            for filename in image_files:
-                print(f"[{item_no}/{len(image_files)}] 正在处理: {filename}")
-                image_path = os.path.join(image_folder_path, filename)
-                
-                # 执行OCR识别
-                result = ocr_engine.run_ocr(image_path)
-                # 确保结果有正确的长度（6个字段：文件路径, 公司名称, 发票号码, 日期, 金额, 项目名称）
-                while len(result) < 6:
-                    result.append('')  # 补充空字段
-                if len(result) > 6:
-                    result = result[:6]  # 截断多余字段
-                invoice_info.loc[item_no] = result
-                
-                # 显示识别结果
-                if result[1] or result[2]:  # 如果识别到公司名称或发票号码
-                    processed_count += 1
-                    print(f"  识别成功: 公司={result[1]}, 号码={result[2]}")
-                else:
-                    print(f"  未识别到发票信息")
-                
-                item_no += 1
-        
-        print(f"\n处理完成！")
-        print(f"总计处理: {len(image_files)} 个文件")
-        print(f"成功识别: {processed_count} 个发票")
-        print(f"识别率: {processed_count/len(image_files)*100:.1f}%" if image_files else "N/A")
-        
-        # 显示结果预览
-        print("\n识别结果预览:")
-        print(invoice_info.to_string(index=False, max_rows=10))
-        
-        # 返回结果数据供界面显示 - 修改为兼容新GUI的格式
-        invoice_list = []
-        if not invoice_info.empty:
-            # 将DataFrame转换为列表格式
-            for _, row in invoice_info.iterrows():
-                invoice_list.append([
-                    row['文件地址'],     # 文件路径
-                    row['开票公司'],     # 开票公司名称
-                    row['发票号码'],     # 发票号码
-                    row['日期'],        # 发票日期
-                    row['金额（价税合计）'], # 发票金额
-                    row['项目名称']      # 项目名称
-                ])
-        
-        result_data = {
-            "total_files": len(image_files) if 'image_files' in locals() else 0,
-            "processed_count": processed_count,
-            "success_rate": f"{processed_count/len(image_files)*100:.1f}%" if 'image_files' in locals() and image_files else "0%",
-            "invoice_data": invoice_list  # 新的格式，直接是列表
-        }
-        
-        return result_data
+        log.info("开始处理图片文件夹: %s（精度模式: %s）", image_folder_path, precision_mode)
+        listed = image_files is None
+        if not listed:
+            image_files = list(image_files)
+        elif os.path.exists(image_folder_path):
+            image_files = list_image_files(image_folder_path)
+        else:
+            image_files = []
+        
+        if progress is not None and image_files:
+            if listed:
+                progress.add_files(len(image_files))
+            progress.add_pages(len(image_files), files=len(image_files))
+        image_paths = [os.path.join(image_folder_path, filename) for filename in image_files]
+        return ocr_pages(image_paths, precision_mode, batcher, progress, files_per_page=1,
+                         cancel_token=cancel_token)
         
     except Exception as e:
-        print(f"图片处理出错: {e}")
-        import traceback
-        traceback.print_exc()
+        log.error("图片处理出错: %s", e, exc_info=True, extra={"source": image_folder_path})
 
 # 保持向后兼容性
 def OCR_PDF(pdf_path, flag):
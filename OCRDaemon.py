@@ -0,0 +1,382 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+常驻OCR守护进程 - 预热好的OCR引擎在后台常驻，GUI/命令行/库调用直接连接使用，
+免去每次启动导入 Paddle 与初始化引擎的开销；守护进程不可用时自动回退到进程内识别。
+
+用法：
+  python OCRDaemon.py serve [--mode 快速|高精]   # 启动守护进程（前台运行）
+  python OCRDaemon.py status                    # 查看守护进程状态
+  python OCRDaemon.py stop                      # 停止守护进程
+  python OCRDaemon.py pdf <PDF文件>...          # 识别PDF，输出JSON（无守护进程时进程内识别）
+  python OCRDaemon.py images <图片>...          # 识别图片，输出JSON
+
+通信方式：POSIX 系统使用 Unix socket，Windows 使用 127.0.0.1 TCP；
+每行一个 JSON 请求/响应，并以状态文件中的随机令牌校验。
+本模块顶层只导入标准库，客户端连接无需加载 numpy/Paddle。
+"""
+
+import os
+import sys
+import json
+import time
+import socket
+import secrets
+import threading
+import socketserver
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+from resource_utils import load_config_section
+from StructuredLog import get_logger
+
+log = get_logger("OCRDaemon")
+
+# 守护进程默认参数（可在 offline_config.json 的 "daemon" 节覆盖）
+DEFAULT_DAEMON_CONFIG = {
+    "enabled": True,            # 前端是否尝试连接守护进程
+    "autostart": False,         # GUI 启动时若无守护进程，是否在后台拉起一个
+    "state_dir": "",            # 状态文件目录，默认 ~/.invoicevision
+    "tcp_port": 0,              # Windows 下的监听端口，0 表示自动分配
+    "connect_timeout": 0.5,     # 连接超时（秒）
+    "request_timeout": 600,     # 单次请求超时（秒）
+}
+
+STATE_FILE_NAME = "ocr_daemon.json"
+HAS_UNIX_SOCKET = hasattr(socket, "AF_UNIX") and os.name != "nt"
+
+
+def load_daemon_config():
+    """读取守护进程配置"""
+    return load_config_section("daemon", DEFAULT_DAEMON_CONFIG)
+
+
+def get_state_dir(config=None):
+    """状态文件目录"""
+    config = config or load_daemon_config()
+    state_dir = Path(config.get("state_dir") or (Path.home() / ".invoicevision"))
+    state_dir.mkdir(parents=True, exist_ok=True)
+    return state_dir
+
+
+def read_state(config=None):
+    """读取守护进程状态文件，不存在时返回 None"""
+    state_file = get_state_dir(config) / STATE_FILE_NAME
+    try:
+        with open(state_file, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_private(path, text):
+    """写入仅当前用户可读的文件"""
+    fd = os.open(str(path), os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        f.write(text)
+
+
+# ==================== 客户端 ====================
+
+class OCRDaemonClient:
+    """守护进程客户端，接口与 OfflineOCRInvoice.run_ocr_batch / OCRWorkerPool.submit_batch 一致"""
+
+    def __init__(self, state, config=None):
+        self.state = state
+        self.config = config or load_daemon_config()
+        self.precision_mode = state.get("precision_mode", '快速')
+        self._executor = None
+        self._executor_lock = threading.Lock()
+
+    @property
+    def batch_config(self):
+        """守护进程端的批处理配置"""
+        return self.state.get("batch") or {}
+
+    def _connect(self, timeout):
+        if self.state.get("family") == "unix":
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(timeout)
+            sock.connect(self.state["address"])
+        else:
+            host, port = self.state["address"]
+            sock = socket.create_connection((host, port), timeout=timeout)
+        return sock
+
+    def call(self, command, timeout=None, **params):
+        """发送一条请求并返回响应中的 result，失败时抛出 RuntimeError"""
+        request = dict(params, command=command, token=self.state.get("token"))
+        sock = self._connect(self.config.get("connect_timeout", 0.5))
+        try:
+            sock.settimeout(timeout or self.config.get("request_timeout", 600))
+            with sock.makefile('rwb') as stream:
+                stream.write(json.dumps(request, ensure_ascii=False).encode('utf-8') + b"\n")
+                stream.flush()
+                line = stream.readline()
+        finally:
+            sock.close()
+        if not line:
+            raise RuntimeError("守护进程未返回数据")
+        response = json.loads(line.decode('utf-8'))
+        if not response.get("ok"):
+            raise RuntimeError(response.get("error", "守护进程处理失败"))
+        return response.get("result")
+
+    def ping(self):
+        return self.call("ping", timeout=self.config.get("connect_timeout", 0.5))
+
+    def run_ocr_batch(self, image_paths, max_batch=None):
+        """识别一批图片，结果格式同 OfflineOCRInvoice.run_ocr_batch"""
+        paths = [os.path.abspath(p) for p in image_paths]
+        return self.call("ocr_images", paths=paths, max_batch=max_batch)
+
+    def submit_batch(self, image_paths):
+        """异步提交一批图片，返回 Future"""
+        with self._executor_lock:
+            if self._executor is None:
+                workers = max(1, int(self.state.get("workers", 1)))
+                self._executor = ThreadPoolExecutor(max_workers=workers + 1,
+                                                    thread_name_prefix="OCRDaemonClient")
+        return self._executor.submit(self.run_ocr_batch, image_paths)
+
+    def ocr_pdf(self, pdf_path, output_dir=None):
+        """由守护进程完成 PDF 转图片与识别，返回格式同 ocr_pdf_offline"""
+        return self.call("ocr_pdf", pdf_path=os.path.abspath(pdf_path),
+                         output_dir=os.path.abspath(output_dir) if output_dir else None)
+
+    def shutdown(self):
+        return self.call("shutdown")
+
+
+def connect_daemon(precision_mode=None, config=None):
+    """连接正在运行的守护进程；未启用、未运行或精度模式不一致时返回 None"""
+    config = config or load_daemon_config()
+    if not config.get("enabled", True):
+        return None
+    state = read_state(config)
+    if not state:
+        return None
+    client = OCRDaemonClient(state, config)
+    try:
+        info = client.ping()
+    except Exception:
+        return None
+    if precision_mode and info.get("precision_mode") != precision_mode:
+        return None
+    return client
+
+
+def spawn_daemon(precision_mode='快速'):
+    """在后台拉起守护进程（不等待其就绪）"""
+    import subprocess
+    args = [sys.executable, os.path.abspath(__file__), "serve", "--mode", precision_mode]
+    kwargs = {"cwd": os.getcwd(), "stdin": subprocess.DEVNULL,
+              "stdout": subprocess.DEVNULL, "stderr": subprocess.DEVNULL}
+    if os.name == "nt":
+        kwargs["creationflags"] = subprocess.DETACHED_PROCESS | subprocess.CREATE_NEW_PROCESS_GROUP
+    else:
+        kwargs["start_new_session"] = True
+    return subprocess.Popen(args, **kwargs)
+
+
+# ==================== 服务端 ====================
+
+class _DaemonRequestHandler(socketserver.StreamRequestHandler):
+    """每个连接可连续发送多条请求"""
+
+    def handle(self):
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                break
+            try:
+                request = json.loads(line.decode('utf-8'))
+                if not secrets.compare_digest(str(request.get("token", "")), self.server.daemon.token):
+                    raise PermissionError("令牌无效")
+                response = {"ok": True, "result": self.server.daemon.dispatch(request)}
+            except Exception as e:
+                response = {"ok": False, "error": str(e)}
+            self.wfile.write(json.dumps(response, ensure_ascii=False, default=str).encode('utf-8') + b"\n")
+            self.wfile.flush()
+
+
+if HAS_UNIX_SOCKET:
+    class _UnixDaemonServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+        daemon_threads = True
+
+
+class _TCPDaemonServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class OCRDaemon:
+    """常驻OCR服务：持有预热的引擎（或多进程工作池），并发请求共享同一个微批处理器"""
+
+    def __init__(self, precision_mode='快速', config=None):
+        self.precision_mode = precision_mode
+        self.config = config or load_daemon_config()
+        self.state_dir = get_state_dir(self.config)
+        self.token = secrets.token_hex(16)
+        self.started_at = None
+        self.requests_served = 0
+        self.backend = None
+        self.batcher = None
+        self.server = None
+        self._backend_lock = threading.Lock()
+
+    def warm_up(self):
+        """加载OCR引擎；配置为 forkserver 时改用多进程工作池"""
+        from OCRInvoice import OfflineOCRInvoice, OCRMicroBatcher
+        from OCRWorkerPool import get_shared_pool
+
+        self.backend = get_shared_pool(self.precision_mode)
+        if self.backend is None:
+            if not OfflineOCRInvoice.global_initialize_ocr(self.precision_mode):
+                raise RuntimeError("OCR引擎初始化失败")
+            OfflineOCRInvoice.preload_refine_engine()  # 复核引擎随预热加载，首个低置信度页面不再等待
+            self.backend = OfflineOCRInvoice()
+        self.batcher = OCRMicroBatcher(ocr=self.backend)
+
+    def _current_batcher(self):
+        """当前的微批处理器；工作池的工作进程意外退出后重建工作池"""
+        with self._backend_lock:
+            if not getattr(self.backend, "is_running", True):
+                self.batcher.close()
+                self.warm_up()
+            return self.batcher
+
+    def dispatch(self, request):
+        """处理一条请求"""
+        command = request.get("command")
+        if command == "ping":
+            return {
+                "pid": os.getpid(),
+                "precision_mode": self.precision_mode,
+                "uptime": time.time() - self.started_at,
+                "requests_served": self.requests_served,
+            }
+        self.requests_served += 1
+        if command == "ocr_images":
+            paths = request.get("paths") or []
+            batcher = self._current_batcher()
+            futures = [batcher.submit(path) for path in paths]
+            return [future.result() for future in futures]
+        if command == "ocr_pdf":
+            from MainAction import ocr_pdf_offline
+            return ocr_pdf_offline(request["pdf_path"], self.precision_mode,
+                                   request.get("output_dir"), batcher=self._current_batcher())
+        if command == "shutdown":
+            threading.Thread(target=self.server.shutdown, daemon=True).start()
+            return {"stopping": True}
+        raise ValueError(f"未知命令: {command}")
+
+    def serve_forever(self):
+        """预热引擎、监听并写入状态文件，直到收到 shutdown 请求"""
+        self.warm_up()
+
+        if HAS_UNIX_SOCKET:
+            address = str(self.state_dir / "ocr_daemon.sock")
+            if os.path.exists(address):
+                os.unlink(address)
+            self.server = _UnixDaemonServer(address, _DaemonRequestHandler)
+            os.chmod(address, 0o600)
+            family = "unix"
+        else:
+            self.server = _TCPDaemonServer(("127.0.0.1", int(self.config.get("tcp_port", 0))),
+                                           _DaemonRequestHandler)
+            address = list(self.server.server_address)
+            family = "tcp"
+        self.server.daemon = self
+
+        state_file = self.state_dir / STATE_FILE_NAME
+        self.started_at = time.time()
+        state = {
+            "pid": os.getpid(),
+            "family": family,
+            "address": address,
+            "token": self.token,
+            "precision_mode": self.precision_mode,
+            "batch": getattr(self.backend, "batch_config", {}),
+            "workers": getattr(self.backend, "workers", 1),
+            "started_at": self.started_at,
+        }
+        _write_private(state_file, json.dumps(state, ensure_ascii=False))
+        log.info("OCR守护进程已启动: %s（模式: %s）", address, self.precision_mode)
+
+        try:
+            self.server.serve_forever()
+        finally:
+            self.server.server_close()
+            self.batcher.close()
+            from OCRWorkerPool import shutdown_shared_pool
+            shutdown_shared_pool()
+            current = read_state(self.config)
+            if current and current.get("pid") == os.getpid():
+                state_file.unlink(missing_ok=True)
+            if family == "unix" and os.path.exists(address):
+                os.unlink(address)
+            log.info("OCR守护进程已停止")
+
+
+# ==================== 命令行 ====================
+
+def _recognize_local(command, paths, precision_mode):
+    """守护进程不可用时的进程内识别"""
+    from OCRInvoice import OfflineOCRInvoice
+    from MainAction import ocr_pdf_offline
+    if not OfflineOCRInvoice.global_initialize_ocr(precision_mode):
+        raise RuntimeError("OCR引擎初始化失败")
+    if command == "pdf":
+        return [ocr_pdf_offline(path, precision_mode) for path in paths]
+    return OfflineOCRInvoice().run_ocr_batch(paths)
+
+
+def main(argv=None):
+    argv = list(sys.argv[1:] if argv is None else argv)
+    precision_mode = '快速'
+    if "--mode" in argv:
+        index = argv.index("--mode")
+        precision_mode = argv[index + 1]
+        del argv[index:index + 2]
+    if not argv:
+        print(__doc__)
+        return 1
+
+    command, paths = argv[0], argv[1:]
+    if command == "serve":
+        if connect_daemon() is not None:
+            print("OCR守护进程已在运行")
+            return 1
+        OCRDaemon(precision_mode).serve_forever()
+        return 0
+
+    # status/stop 不区分精度模式
+    client = connect_daemon(precision_mode if command in ("pdf", "images") else None)
+    if command == "status":
+        print(json.dumps(client.ping() if client else {"running": False}, ensure_ascii=False, indent=2))
+        return 0
+    if command == "stop":
+        if client:
+            client.shutdown()
+            print("已请求停止OCR守护进程")
+        else:
+            print("OCR守护进程未运行")
+        return 0
+    if command in ("pdf", "images"):
+        if client is not None:
+            if command == "pdf":
+                result = [client.ocr_pdf(path) for path in paths]
+            else:
+                result = client.run_ocr_batch(paths)
+        else:
+            result = _recognize_local(command, paths, precision_mode)
+        print(json.dumps(result, ensure_ascii=False, indent=2, default=str))
+        return 0
+
+    print(__doc__)
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
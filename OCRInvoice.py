@@ -7,32 +7,57 @@
 
 # 延迟导入 - 避免启动时就加载PaddleOCR
 # from paddleocr import PaddleOCR  # 移到使用时导入
-import re
 import os
 import json
+import logging
 import numpy as np
 import cv2
 from pathlib import Path
 import threading
 import time
+import queue
+import gc
+from concurrent.futures import Future
+
+from Cancellation import OperationCancelled
+from FieldExtractor import contains_invoice_keywords, extract_invoice_fields
+from FieldConfidence import extract_page_fields, load_refine_config, low_confidence_fields, merge_fields
+from PageLayout import PageLayout
+from StructuredLog import get_logger
+
+log = get_logger("OCRInvoice")
+
+# 批处理默认参数（可在 offline_config.json 的 "batch" 节覆盖）
+DEFAULT_BATCH_CONFIG = {
+    "max_batch_size": 8,       # 单次送入检测/识别模型的最大页数
+    "max_latency_ms": 50,      # 微批处理凑批的最长等待时间
+    "rec_batch_size": 16,      # 识别模型每批处理的文本行数
+}
 
 class OfflineOCRInvoice:
     # 类变量：所有实例共享的OCR引擎
     _shared_ocr_engine = None
-    _initialization_lock = threading.Lock()
+    _shared_engine_mode = None          # 全局引擎的精度模式
+    _initialization_lock = threading.Condition()
     _initialization_status = "pending"  # pending, loading, ready, failed
+    # 复核低置信度页面用的高精引擎（快速模式下首次需要时创建）
+    _refine_engine = None
+    _refine_engine_failed = False
+    _refine_lock = threading.Lock()
     
     def __init__(self):
         """初始化离线OCR发票识别器"""
         self.precision_mode = '快速'
         self.offline_config = self._load_offline_config()
+        self._refine_config = None
         
         # 确保全局OCR引擎已初始化
         if self.__class__._initialization_status == "pending":
             self.global_initialize_ocr()
         
-    def _load_offline_config(self):
-        """加载离线配置 - 支持外部模型架构"""
+    @staticmethod
+    def _load_offline_config():
+        """加载离线配置 - 支持外部模型架构（不依赖OCR引擎，可在未初始化时调用）"""
         try:
             # 导入resource_utils模块，支持打包环境
             import resource_utils
@@ -51,7 +76,8 @@ class OfflineOCRInvoice:
             "offline_mode": True,
             "use_gpu": False,
             "lang": "ch",
-            "models_path": str(models_path)
+            "models_path": str(models_path),
+            "batch": dict(DEFAULT_BATCH_CONFIG)
         }
         
         if config_file.exists():
@@ -65,11 +91,16 @@ class OfflineOCRInvoice:
                         config[key] = value
                         
             except Exception as e:
-                print(f"配置文件加载失败，使用默认配置: {e}")
+                log.warning("配置文件加载失败，使用默认配置: %s", e)
                 config = default_config
         else:
             config = default_config
             
+        # 批处理参数：补齐配置文件中缺失的字段
+        batch_config = dict(DEFAULT_BATCH_CONFIG)
+        batch_config.update(config.get("batch") or {})
+        config["batch"] = batch_config
+        
         # 使用resource_utils提供的模型路径，覆盖配置文件中的相对路径
         config["models_path"] = str(models_path)
         
@@ -88,22 +119,34 @@ class OfflineOCRInvoice:
         
         return config
     
+    @property
+    def refine_config(self):
+        """低置信度页面复核配置（见 FieldConfidence）"""
+        if self._refine_config is None:
+            self._refine_config = load_refine_config()
+        return self._refine_config
+    
+    @property
+    def batch_config(self):
+        """获取批处理配置"""
+        return self.offline_config.get("batch") or dict(DEFAULT_BATCH_CONFIG)
+    
     def check_models_available(self):
         """检查模型文件是否可用"""
         if not self.offline_config or "models" not in self.offline_config:
             return False, "配置文件中未找到模型配置"
             
-        print(f"[DEBUG] 模型基础路径: {self.offline_config.get('models_path', 'N/A')}")
+        log.debug("[DEBUG] 模型基础路径: %s", self.offline_config.get('models_path', 'N/A'))
         
         missing_models = []
         incomplete_models = []
         
         for model_name, model_path in self.offline_config["models"].items():
-            print(f"[DEBUG] 检查模型 {model_name}: {model_path}")
+            log.debug("[DEBUG] 检查模型 %s: %s", model_name, model_path)
             
             if not os.path.exists(model_path):
                 missing_models.append(f"{model_name}: {model_path}")
-                print(f"  [ERROR] 路径不存在")
+                log.error("  [ERROR] 路径不存在: %s", model_path)
             else:
                 # 检查模型文件是否完整
                 try:
@@ -116,20 +159,16 @@ class OfflineOCRInvoice:
                     missing_files_old = [f for f in required_files_old if f not in files]
                     
                     if not missing_files_new:
-                        print(f"  [OK] 模型文件完整 (新格式)")
-                        print(f"    文件列表: {files}")
+                        log.debug("  [OK] 模型文件完整 (新格式)\n    文件列表: %s", files)
                     elif not missing_files_old:
-                        print(f"  [OK] 模型文件完整 (旧格式)")
-                        print(f"    文件列表: {files}")
+                        log.debug("  [OK] 模型文件完整 (旧格式)\n    文件列表: %s", files)
                     else:
                         incomplete_models.append(f"{model_name}: 缺少文件 (新格式需要{missing_files_new} 或 旧格式需要{missing_files_old})")
-                        print(f"  [ERROR] 缺少必需文件:")
-                        print(f"    新格式缺少: {missing_files_new}")
-                        print(f"    旧格式缺少: {missing_files_old}")
-                        print(f"    当前文件: {files}")
+                        log.error("  [ERROR] %s 缺少必需文件:\n    新格式缺少: %s\n    旧格式缺少: %s\n    当前文件: %s",
+                                  model_name, missing_files_new, missing_files_old, files)
                 except Exception as e:
                     incomplete_models.append(f"{model_name}: 读取错误 {e}")
-                    print(f"  [ERROR] 读取错误: {e}")
+                    log.error("  [ERROR] %s 读取错误: %s", model_name, e)
                 
         error_messages = []
         if missing_models:
@@ -143,69 +182,136 @@ class OfflineOCRInvoice:
         return True, "所有模型文件已就绪"
     
     @classmethod
-    def global_initialize_ocr(cls, precision_mode='快速'):
-        """全局OCR引擎初始化 - 在主线程中调用，避免重复初始化"""
+    def global_initialize_ocr(cls, precision_mode='快速', timeout=None):
+        """全局OCR引擎初始化 - 可在主线程或后台预热线程中调用，避免重复初始化
+        
+        其他线程同时调用时等待正在进行的初始化完成（timeout 秒，None 表示一直等待）。
+        """
         with cls._initialization_lock:
             if cls._initialization_status == "ready":
-                print("OCR引擎已经初始化完成")
+                log.debug("OCR引擎已经初始化完成")
                 return True
             
             if cls._initialization_status == "loading":
-                # 等待初始化完成
-                print("OCR引擎正在初始化中，等待完成...")
-                timeout = 30  # 30秒超时
-                start_time = time.time()
-                while cls._initialization_status == "loading" and time.time() - start_time < timeout:
-                    time.sleep(0.1)
+                # 等待初始化完成（由初始化线程通知，无需轮询）
+                log.info("OCR引擎正在初始化中，等待完成...")
+                cls._initialization_lock.wait_for(
+                    lambda: cls._initialization_status != "loading", timeout)
                 return cls._initialization_status == "ready"
             
             cls._initialization_status = "loading"
-            print(f"开始全局初始化OCR引擎，精度模式: {precision_mode}")
+        
+        log.info("开始全局初始化OCR引擎，精度模式: %s", precision_mode)
+        engine = None
+        try:
+            engine = cls._create_engine(precision_mode)
+        finally:
+            # 无论成功与否都要唤醒等待的线程
+            with cls._initialization_lock:
+                if engine is not None:
+                    cls._shared_ocr_engine = engine
+                    cls._shared_engine_mode = precision_mode
+                cls._initialization_status = "ready" if engine is not None else "failed"
+                cls._initialization_lock.notify_all()
+        return engine is not None
+    
+    @classmethod
+    def _create_engine(cls, precision_mode):
+        """导入 Paddle 并创建OCR引擎，失败时返回 None"""
+        try:
+            # 在主线程中设置环境变量 - 必须在导入前设置
+            os.environ['KMP_DUPLICATE_LIB_OK'] = 'TRUE'
+            os.environ['PADDLE_DISABLE_SHARED_MEM'] = '1'
+            os.environ['CUDA_VISIBLE_DEVICES'] = ''
+            log.debug("环境变量设置完成")
+            
+            # 创建临时实例获取配置
+            temp_instance = cls()
+            models_available, message = temp_instance.check_models_available()
+            if not models_available:
+                log.error("模型检查失败: %s", message)
+                return None
+            
+            models = temp_instance.offline_config.get("models", {})
+            
+            # 仅使用 PaddleOCR 初始化
+            from paddleocr import PaddleOCR
+            log.debug("PaddleOCR模块导入成功")
+            
+            rec_batch_size = int(temp_instance.batch_config.get("rec_batch_size", 1))
             
+            # 快速模式优先使用检测/识别分离流水线，多页文本行合并识别
+            stage_config = temp_instance.offline_config.get("stages") or {}
+            if precision_mode != '高精' and stage_config.get("enabled", True):
+                try:
+                    from OCRStages import DecoupledOCREngine
+                    engine = DecoupledOCREngine.from_config(models, stage_config, rec_batch_size)
+                    log.info("[SUCCESS] 全局检测/识别分离流水线初始化成功")
+                    return engine
+                except Exception as e:
+                    log.warning("检测/识别分离流水线不可用，改用PaddleOCR一体化流水线: %s", e)
+            
+            # 使用官方OCR pipeline；识别模型按批处理文本行（旧版本不支持该参数时降级）
             try:
-                # 在主线程中设置环境变量 - 必须在导入前设置
-                os.environ['KMP_DUPLICATE_LIB_OK'] = 'TRUE'
-                os.environ['PADDLE_DISABLE_SHARED_MEM'] = '1'
-                os.environ['CUDA_VISIBLE_DEVICES'] = ''
-                print("环境变量设置完成")
-                
-                # 创建临时实例获取配置
-                temp_instance = cls()
-                models_available, message = temp_instance.check_models_available()
-                if not models_available:
-                    cls._initialization_status = "failed"
-                    print(f"模型检查失败: {message}")
-                    return False
-                
-                models = temp_instance.offline_config.get("models", {})
-                
-                # 仅使用 PaddleOCR 初始化
-                from paddleocr import PaddleOCR
-                print("PaddleOCR模块导入成功")
-                
-                # 使用官方OCR pipeline
-                cls._shared_ocr_engine = PaddleOCR(use_angle_cls=precision_mode == '高精', lang='ch')
-                cls._initialization_status = "ready"
-                print("[SUCCESS] 全局PaddleOCR引擎初始化成功")
-                return True
-                        
-            except ImportError as e:
-                cls._initialization_status = "failed"
-                print(f"[ERROR] OCR模块导入失败: {e}")
-                return False
-            except Exception as e:
-                cls._initialization_status = "failed"
-                print(f"[ERROR] 全局OCR引擎初始化失败: {e}")
-                print(f"错误类型: {type(e).__name__}")
-                import traceback
-                print(f"详细错误信息:\n{traceback.format_exc()}")
-                return False
+                engine = PaddleOCR(use_angle_cls=precision_mode == '高精', lang='ch',
+                                   text_recognition_batch_size=rec_batch_size)
+            except (TypeError, ValueError):
+                engine = PaddleOCR(use_angle_cls=precision_mode == '高精', lang='ch')
+            log.info("[SUCCESS] 全局PaddleOCR引擎初始化成功")
+            return engine
+                    
+        except ImportError as e:
+            log.error("[ERROR] OCR模块导入失败: %s", e)
+            return None
+        except Exception as e:
+            log.error("[ERROR] 全局OCR引擎初始化失败: %s\n错误类型: %s", e, type(e).__name__, exc_info=True)
+            return None
     
     @property
     def ocr_engine(self):
         """获取共享的OCR引擎实例"""
         return self.__class__._shared_ocr_engine
     
+    @classmethod
+    def get_refine_engine(cls):
+        """复核用的高精引擎：全局引擎已是高精模式时直接使用，否则首次调用时创建，创建失败后不再尝试"""
+        if cls._shared_engine_mode == '高精':
+            return cls._shared_ocr_engine
+        with cls._refine_lock:
+            if cls._refine_engine is None and not cls._refine_engine_failed:
+                log.info("创建高精OCR引擎，用于复核低置信度页面...")
+                cls._refine_engine = cls._create_engine('高精')
+                cls._refine_engine_failed = cls._refine_engine is None
+            return cls._refine_engine
+    
+    @classmethod
+    def preload_refine_engine(cls):
+        """按 "refine" 节预先创建复核用的高精引擎（fork 工作进程前、守护进程预热时调用），未启用复核时不创建"""
+        if load_refine_config().get("enabled", True):
+            return cls.get_refine_engine()
+        return None
+    
+    @classmethod
+    def release_engine(cls):
+        """释放全局OCR引擎及其模型内存（正在初始化时不释放），下次使用时重新初始化"""
+        with cls._initialization_lock:
+            if cls._initialization_status == "loading":
+                return False
+            cls._shared_ocr_engine = None
+            cls._shared_engine_mode = None
+            cls._initialization_status = "pending"
+        with cls._refine_lock:
+            cls._refine_engine = None
+            cls._refine_engine_failed = False
+        gc.collect()
+        log.info("OCR引擎已释放")
+        return True
+    
+    @classmethod
+    def get_engine_mode(cls):
+        """全局引擎的精度模式（未初始化时为 None）"""
+        return cls._shared_engine_mode
+    
     @classmethod
     def get_initialization_status(cls):
         """获取初始化状态"""
@@ -213,343 +319,247 @@ class OfflineOCRInvoice:
     
     def initialize_ocr(self):
         """旧版初始化方法 - 现在委托给全局初始化"""
-        print("调用旧版initialize_ocr，委托给全局初始化...")
+        log.debug("调用旧版initialize_ocr，委托给全局初始化...")
         return self.__class__._shared_ocr_engine is not None
     
     def set_precision_mode(self, mode):
         """设置精度模式 - 需要重新全局初始化"""
         if mode in ['快速', '高精']:
             self.precision_mode = mode
-            print(f"精度模式设置为: {mode}")
-            print("注意: 精度模式更改需要重新调用 global_initialize_ocr() 才能生效")
+            log.info("精度模式设置为: %s\n注意: 精度模式更改需要重新调用 global_initialize_ocr() 才能生效", mode)
             return True
         else:
-            print("无效的精度模式，支持的模式: '快速', '高精'")
+            log.warning("无效的精度模式，支持的模式: '快速', '高精'")
             return False
     
+    @staticmethod
+    def _empty_result(image_path):
+        """未识别出内容的结果行：与正常结果相同的7个字段，票据类型为空"""
+        return [image_path, '', '', '', '', '', '']
+    
     def run_ocr(self, image_path):
-        """执行OCR识别"""
+        """执行OCR识别
+        Returns:
+            list: [文件路径, 开票公司名称, 发票号码, 日期, 金额, 项目名称, 票据类型]，识别成功的页面末尾另附
+                  {"confidence": {字段: 置信度}, "refined": 是否经高精复核}
+        """
+        return self.run_ocr_batch([image_path], max_batch=1)[0]
+    
+    def run_ocr_batch(self, image_paths, max_batch=None, cancel_token=None):
+        """批量执行OCR识别 - 多页图片按批次送入检测和识别模型
+        Args:
+            image_paths: 图片路径列表
+            max_batch: 单批最大页数（默认取配置 batch.max_batch_size）
+            cancel_token: CancellationToken（可选），取消时抛出 OperationCancelled
+        Returns:
+            list: 与 image_paths 一一对应，每项格式同 run_ocr
+        """
+        image_paths = list(image_paths)
+        
         # 检查全局OCR引擎是否可用
         if self.ocr_engine is None:
-            print("ERROR: 全局OCR引擎未初始化，请先调用 OfflineOCRInvoice.global_initialize_ocr()")
-            return [image_path, '', '', '', '', '']
+            log.error("ERROR: 全局OCR引擎未初始化，请先调用 OfflineOCRInvoice.global_initialize_ocr()")
+            return [self._empty_result(path) for path in image_paths]
         
-        try:
-            print(f"开始处理图片: {os.path.basename(image_path)}")
-            
-            # 读取图片
-            try:
-                # 方法1: 使用cv2直接读取
-                with open(image_path, 'rb') as f:
-                    image_data = f.read()
-                nparr = np.frombuffer(image_data, np.uint8)
-                img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-                if img is None:
-                    raise Exception("图像解码失败")
-            except:
-                # 方法2: 使用PIL作为后备方案
-                from PIL import Image
-                pil_image = Image.open(image_path)
-                img = cv2.cvtColor(np.array(pil_image), cv2.COLOR_RGB2BGR)
-            
-            # 执行OCR识别（PaddleOCR）
-            result = self.ocr_engine.ocr(img)
-            texts = self._extract_texts_from_result(result)
-            
-            if not texts:
-                print("OCR未识别到任何文本")
-                return [image_path, '', '', '', '', '']
-            
-            # 检查是否识别到发票内容
-            combined_text = '【' + '】【'.join(texts) + '】'
-            
-            if not self._contains_invoice_keywords(combined_text):
-                print("未检测到发票关键词，尝试旋转图片...")
-                img_rotated = cv2.rotate(img, cv2.ROTATE_180)
-                
-                # 旋转后再次OCR识别（PaddleOCR）
-                result = self.ocr_engine.ocr(img_rotated)
-                texts = self._extract_texts_from_result(result)
-                combined_text = '【' + '】【'.join(texts) + '】'
-            
-            # 提取发票信息
-            invoice_info = self._extract_invoice_info(combined_text, image_path)
-            print(f"识别完成: {os.path.basename(image_path)}")
-            return invoice_info
-            
-        except Exception as e:
-            print(f"OCR处理出错: {e}")
-            return [image_path, '', '', '', '', '']
-    
-    def _extract_texts_from_result(self, result):
-        """从OCR结果中提取文本"""
-        texts = []
-        try:
-            if result and len(result) > 0:
-                # 检查新格式的结果（PaddleX/PaddleOCR新版本）
-                if isinstance(result[0], dict) and 'rec_texts' in result[0]:
-                    # 新版本格式：结果包含rec_texts字段
-                    texts = result[0]['rec_texts']
-                    print("使用新格式提取文本，共{}条".format(len(texts)))
-                elif result[0]:
-                    # 旧版本格式
-                    ocr_result = result[0]
-                    for line in ocr_result:
-                        if line and len(line) > 1 and line[1]:
-                            if isinstance(line[1], tuple) and len(line[1]) > 0:
-                                text = line[1][0].strip()
-                            elif isinstance(line[1], str):
-                                text = line[1].strip()
-                            else:
-                                continue
-                            
-                            if text:
-                                texts.append(text)
-                    print("使用旧格式提取文本，共{}条".format(len(texts)))
-        except (IndexError, TypeError) as e:
-            print(f"文本提取出错: {e}")
-        return texts
-    
-    # 已移除 EasyOCR 解析路径，仅保留 PaddleOCR
+        if max_batch is None:
+            max_batch = self.batch_config.get("max_batch_size", 1)
+        max_batch = max(1, int(max_batch))
+        
+        results = []
+        for start in range(0, len(image_paths), max_batch):
+            results.extend(self._run_ocr_chunk(image_paths[start:start + max_batch], cancel_token))
+        return results
     
-    def _contains_invoice_keywords(self, text):
-        """检查文本是否包含发票关键词"""
-        keywords = ['发票', '增值税', '专用发票', '普通发票', '发票号码', '发票代码']
-        return any(keyword in text for keyword in keywords)
-    
-    def _extract_invoice_info(self, text, image_path):
-        """从文本中提取发票信息"""
-        company_name = ''
-        invoice_number = ''
-        invoice_date = ''
-        invoice_amount = ''
-        project_name = ''  # 新增项目名称字段
+    def _run_ocr_chunk(self, image_paths, cancel_token=None):
+        """识别一个批次的图片"""
+        results = [self._empty_result(path) for path in image_paths]
+        
+        # 读取图片，读取失败的页保留空结果
+        loaded = []
+        for index, image_path in enumerate(image_paths):
+            if cancel_token is not None:
+                cancel_token.raise_if_cancelled()
+            log.debug("开始处理图片: %s", image_path)
+            try:
+                loaded.append((index, self._load_image(image_path)))
+            except Exception as e:
+                log.warning("图片读取失败: %s - %s", os.path.basename(image_path), e, extra={"page": image_path})
         
-        print(f"提取信息的文本: {text}")
+        if not loaded:
+            return results
         
         try:
-            # 提取开票公司名称 - 更灵活的匹配方式
-            company_patterns = [
-                r'销售方名称[：:]\s*([^\n\r【】]{2,100}?)(?=\s*【|$)',
-                r'销售方[：:]\s*([^\n\r【】]{2,100}?)(?=\s*【|$)',
-                r'开票方名称[：:]\s*([^\n\r【】]{2,100}?)(?=\s*【|$)',
-                r'开票方[：:]\s*([^\n\r【】]{2,100}?)(?=\s*【|$)',
-                r'销售单位[：:]\s*([^\n\r【】]{2,100}?)(?=\s*【|$)',
-                r'收款单位[：:]\s*([^\n\r【】]{2,100}?)(?=\s*【|$)',
-            ]
+            # 执行OCR识别（PaddleOCR）
+            layouts = self._ocr_images([img for _, img in loaded], cancel_token)
             
-            for pattern in company_patterns:
-                company_matches = re.findall(pattern, text)
-                if company_matches:
-                    for match in company_matches:
-                        match = match.strip()
-                        # 清理可能的前缀
-                        match = re.sub(r'^[销售开票收款]方[名称单位]*[：:]', '', match).strip()
-                        # 更宽松的验证条件
-                        if (len(match) >= 2 and not match[0].isdigit() and 
-                            not any(word in match for word in ['发票', '号码', '日期', '金额', '项目'])):
-                            company_name = match
-                            print(f"提取到开票公司名称: {company_name}")
-                            break
-                    if company_name:
-                        break
+            page_layouts = {}
+            need_rotate = []
+            for (index, img), layout in zip(loaded, layouts):
+                if not len(layout):
+                    log.info("OCR未识别到任何文本: %s", os.path.basename(image_paths[index]), extra={"page": image_paths[index]})
+                    continue
+                
+                # 检查是否识别到发票内容（layout.text 为拼接文本【行1】【行2】…）
+                page_layouts[index] = layout
+                if not self._contains_invoice_keywords(layout.text):
+                    need_rotate.append((index, img))
             
-            # 如果上述模式未匹配到，尝试更宽松的模式
-            if not company_name:
-                # 尝试匹配包含"公司"、"厂"、"店"等关键词的文本
-                company_loose_pattern = r'([^\n\r【】]{1,50}(?:公司|厂|店|中心|集团|企业)[^\n\r【】]{0,30})'
-                company_loose_matches = re.findall(company_loose_pattern, text)
-                for match in company_loose_matches:
-                    match = match.strip()
-                    # 过滤掉明显不是公司名称的内容
-                    if (len(match) >= 3 and not match[0].isdigit() and 
-                        not any(word in match for word in ['发票', '号码', '日期', '金额', '项目', '购买方', '买方'])):
-                        company_name = match
-                        print(f"通过宽松模式提取到开票公司名称: {company_name}")
-                        break
+            if need_rotate:
+                log.info("%d 张图片未检测到发票关键词，尝试旋转图片...", len(need_rotate))
+                rotated_images = [cv2.rotate(img, cv2.ROTATE_180) for _, img in need_rotate]
+                
+                # 旋转后再次批量OCR识别（PaddleOCR）
+                for (index, _), layout in zip(need_rotate, self._ocr_images(rotated_images, cancel_token)):
+                    page_layouts[index] = layout
+        except OperationCancelled:
+            raise
         except Exception as e:
-            print(f"开票公司名称提取失败: {e}")
+            log.error("OCR处理出错: %s", e, exc_info=True)
+            return results
         
-        # 最终清理开票公司名称中的"名称："前缀
-        if company_name and company_name.startswith("名称："):
-            company_name = company_name[3:].strip()  # 去掉"名称："前缀
-            print(f"清理前缀后的开票公司名称: {company_name}")
+        # 提取发票信息（附带各字段置信度）
+        extracted = {}
+        for index, layout in page_layouts.items():
+            image_path = image_paths[index]
+            try:
+                extracted[index] = extract_page_fields(layout, image_path)
+                log.debug("识别完成: %s", image_path)
+            except Exception as e:
+                log.error("OCR处理出错: %s - %s", os.path.basename(image_path), e, extra={"page": image_path})
         
-        try:
-            # 提取发票号码
-            number_patterns = [
-                r'发票号码[：:]】?【?([0-9]{6,20})',  # 处理【发票号码：】【数字】的格式
-                r'发票号码[：:]\s*([0-9]{6,20})',
-                r'发票号[：:]?\s*([0-9]{6,20})',
-                r'号码[：:]\s*([0-9]{6,20})',
-                r'No[：:.]?\s*([0-9]{6,20})',
-                r'【([0-9]{15,20})】',  # 直接匹配长数字（发票号码通常很长）
-            ]
-            
-            for pattern in number_patterns:
-                number_matches = re.findall(pattern, text)
-                if number_matches:
-                    invoice_number = number_matches[0]
-                    print(f"提取到发票号码: {invoice_number}")
-                    break
-        except Exception as e:
-            print(f"发票号码提取失败: {e}")
+        refined = self._refine_low_confidence(
+            [(index, img, page_layouts[index]) for index, img in loaded if index in extracted],
+            image_paths, extracted, cancel_token)
+        for index, (result, confidences) in extracted.items():
+            results[index] = result + [{"confidence": confidences, "refined": index in refined}]
+        return results
+    
+    def _refine_low_confidence(self, pages, image_paths, extracted, cancel_token=None):
+        """关键字段置信度低的发票页面用高精引擎重新识别，逐字段取置信度较高的结果
+        pages: [(下标, 图片, PageLayout)]；extracted: {下标: (结果行, 置信度)}，原地更新
+        Returns: 已复核的页面下标集合
+        """
+        config = self.refine_config
+        if not config.get("enabled", True):
+            return set()
+        # 没有发票关键词（旋转后仍没有）的页面不是发票，不复核
+        targets = [(index, img) for index, img, layout in pages
+                   if self._contains_invoice_keywords(layout.text)
+                   and low_confidence_fields(extracted[index][1], config)]
+        if not targets:
+            return set()
+        engine = self.get_refine_engine()
+        if engine is None or (engine is self.ocr_engine and float(config.get("zoom", 1.0) or 1.0) <= 1.0):
+            return set()  # 已是高精模式且不放大时，重新识别不会有不同结果
         
+        log.info("%d 页关键字段置信度低，使用高精引擎复核...", len(targets))
+        images = [self._zoom_for_refine(img, config) for _, img in targets]
         try:
-            # 提取发票日期 - 支持多种格式，修复日期错误提取金额的问题
-            date_patterns = [
-                r'发票日期[：:]\s*([0-9]{4})年([0-9]{1,2})月([0-9]{1,2})日',  # YYYY年MM月DD日
-                r'开票日期[：:]\s*([0-9]{4})年([0-9]{1,2})月([0-9]{1,2})日',  # 开票日期
-                r'日期[：:]\s*([0-9]{4})年([0-9]{1,2})月([0-9]{1,2})日',      # 日期
-                r'([0-9]{4})年([0-9]{1,2})月([0-9]{1,2})日',                 # 直接日期格式
-                r'发票日期[：:]\s*([0-9]{4})[.-]([0-9]{1,2})[.-]([0-9]{1,2})', # YYYY-MM-DD或YYYY.MM.DD
-                r'开票日期[：:]\s*([0-9]{4})[.-]([0-9]{1,2})[.-]([0-9]{1,2})', # 开票日期YYYY-MM-DD
-                r'([0-9]{4})[.-]([0-9]{1,2})[.-]([0-9]{1,2})',               # 直接YYYY-MM-DD格式
-            ]
-            
-            for pattern in date_patterns:
-                date_matches = re.findall(pattern, text)
-                if date_matches:
-                    match = date_matches[0]
-                    if isinstance(match, tuple) and len(match) >= 3:
-                        year, month, day = match[0], match[1], match[2]
-                    else:
-                        # 如果是字符串格式，尝试分割
-                        date_str = match if isinstance(match, str) else str(match)
-                        parts = re.split(r'[-年月日.]', date_str)
-                        if len(parts) >= 3:
-                            year, month, day = parts[0], parts[1], parts[2]
-                        else:
-                            continue
-                    
-                    # 确保是有效的日期格式
-                    try:
-                        year, month, day = int(year), int(month), int(day)
-                        if 2000 <= year <= 2030 and 1 <= month <= 12 and 1 <= day <= 31:
-                            invoice_date = f"{year}{month:02d}{day:02d}"
-                            print(f"提取到发票日期: {invoice_date}")
-                            break
-                    except (ValueError, TypeError):
-                        continue
+            layouts = self._ocr_images(images, cancel_token, engine=engine)
+        except OperationCancelled:
+            raise
         except Exception as e:
-            print(f"发票日期提取失败: {e}")
+            log.warning("高精复核失败，保留原结果: %s", e)
+            return set()
         
+        refined = set()
+        for (index, _), layout in zip(targets, layouts):
+            if not len(layout):
+                continue
+            try:
+                second = extract_page_fields(layout, image_paths[index])
+            except Exception as e:
+                log.warning("高精复核提取失败: %s - %s", os.path.basename(image_paths[index]), e)
+                continue
+            extracted[index] = merge_fields(extracted[index], second)
+            refined.add(index)
+            remaining = low_confidence_fields(extracted[index][1], config)
+            log.debug("高精复核完成: %s%s", image_paths[index],
+                      f"（仍为低置信度: {'、'.join(remaining)}）" if remaining else "", extra={"page": image_paths[index]})
+        return refined
+    
+    @staticmethod
+    def _zoom_for_refine(img, config):
+        """复核前放大图片（小字号文本放大后识别更准），最长边不超过 max_side"""
+        zoom = float(config.get("zoom", 1.0) or 1.0)
+        longest = max(img.shape[:2])
+        zoom = min(zoom, float(config.get("max_side", 4000)) / max(1, longest))
+        if zoom <= 1.01:
+            return img
+        return cv2.resize(img, None, fx=zoom, fy=zoom, interpolation=cv2.INTER_CUBIC)
+    
+    def _load_image(self, image_path):
+        """读取图片为BGR数组"""
         try:
-            # 提取发票金额 - 优先提取价税合计/实付金额
-            invoice_amount = ""
-            
-            # 第一优先级：价税合计相关
-            priority_patterns = [
-                r'价税合计[：:][^￥¥\d]*[￥¥]?\s*([0-9]+\.?[0-9]*)',  # 价税合计：123.45
-                r'价税合计[：:][^￥¥\d]*([0-9]+\.?[0-9]*)\s*[￥¥]?',  # 价税合计：￥123.45
-                r'实付金额[：:][^￥¥\d]*[￥¥]?\s*([0-9]+\.?[0-9]*)',  # 实付金额：123.45
-                r'实付[：:][^￥¥\d]*[￥¥]?\s*([0-9]+\.?[0-9]*)',     # 实付：123.45
-                r'应付金额[：:][^￥¥\d]*[￥¥]?\s*([0-9]+\.?[0-9]*)', # 应付金额：123.45
-                r'总计[：:][^￥¥\d]*[￥¥]?\s*([0-9]+\.?[0-9]*)',     # 总计：123.45
-                r'总金额[：:][^￥¥\d]*[￥¥]?\s*([0-9]+\.?[0-9]*)',   # 总金额：123.45
-            ]
-            
-            # 尝试第一优先级模式
-            for pattern in priority_patterns:
-                amount_matches = re.findall(pattern, text)
-                if amount_matches:
-                    valid_amounts = []
-                    for amount_str in amount_matches:
-                        try:
-                            amount = float(amount_str)
-                            # 过滤掉可能的错误匹配（比如日期数字）
-                            if amount >= 0.01 and amount <= 999999999:  # 限制合理范围
-                                valid_amounts.append(amount)
-                        except ValueError:
-                            continue
-                    
-                    if valid_amounts:
-                        invoice_amount = max(valid_amounts)  # 取最大的金额作为发票总额
-                        print(f"通过优先模式提取到发票金额: {invoice_amount} (模式: {pattern})")
-                        break
-            
-            # 第二优先级：如果没有找到价税合计，尝试其他模式
-            if not invoice_amount:
-                secondary_patterns = [
-                    r'合计[：:][^￥¥\d]*[￥¥]?\s*([0-9]+\.?[0-9]*)',     # 合计：123.45
-                    r'小写[：:][^￥¥\d]*[￥¥]?\s*([0-9]+\.?[0-9]*)',     # 小写：123.45
-                    r'金额[（\(]含税[）\)][：:][^￥¥\d]*[￥¥]?\s*([0-9]+\.?[0-9]*)', # 金额（含税）：123.45
-                ]
-                
-                for pattern in secondary_patterns:
-                    amount_matches = re.findall(pattern, text)
-                    if amount_matches:
-                        valid_amounts = []
-                        for amount_str in amount_matches:
-                            try:
-                                amount = float(amount_str)
-                                if amount >= 0.01 and amount <= 999999999:
-                                    valid_amounts.append(amount)
-                            except ValueError:
-                                continue
-                        
-                        if valid_amounts:
-                            invoice_amount = max(valid_amounts)
-                            print(f"通过次要模式提取到发票金额: {invoice_amount} (模式: {pattern})")
-                            break
-            
-            # 第三优先级：通用金额模式（最后备用）
-            if not invoice_amount:
-                fallback_patterns = [
-                    r'[￥¥]\s*([0-9]+\.?[0-9]*)',  # ￥123.45
-                ]
-                
-                for pattern in fallback_patterns:
-                    amount_matches = re.findall(pattern, text)
-                    if amount_matches:
-                        # 对于通用模式，取最后一个（通常是价税合计）
-                        try:
-                            amount = float(amount_matches[-1])  # 取最后一个金额
-                            if amount >= 0.01 and amount <= 999999999:
-                                invoice_amount = amount
-                                print(f"通过备用模式提取到发票金额: {invoice_amount} (最后一个金额)")
-                                break
-                        except ValueError:
-                            continue
-        except Exception as e:
-            print(f"发票金额提取失败: {e}")
-        
+            # 方法1: 使用cv2直接读取
+            with open(image_path, 'rb') as f:
+                image_data = f.read()
+            nparr = np.frombuffer(image_data, np.uint8)
+            img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+            if img is None:
+                raise Exception("图像解码失败")
+        except:
+            # 方法2: 使用PIL作为后备方案
+            from PIL import Image
+            pil_image = Image.open(image_path)
+            img = cv2.cvtColor(np.array(pil_image.convert('RGB')), cv2.COLOR_RGB2BGR)
+        return img
+    
+    def _ocr_images(self, images, cancel_token=None, engine=None):
+        """对多张图片执行OCR，返回每张图片的 PageLayout（文本行、文本框、置信度）
+        engine: 使用的OCR引擎（默认全局引擎；复核时为高精引擎）
+        cancel_token: 检测/识别分离流水线在每页与每个识别批次前检查；
+            PaddleOCR 整批 predict 无法中途打断，在批次前检查
+        """
+        engine = engine or self.ocr_engine
+        if cancel_token is not None:
+            cancel_token.raise_if_cancelled()
+        # PaddleOCR 3.x 的 predict 支持列表输入，一次调用完成整批检测与识别
+        if len(images) > 1 and hasattr(engine, 'predict'):
+            if getattr(engine, 'supports_cancellation', False):
+                raw_results = list(engine.predict(images, cancel_token=cancel_token))
+            else:
+                raw_results = list(engine.predict(images))
+            return [self._extract_layout_from_result([item]) for item in raw_results]
+        # 旧版本仅支持单张输入
+        layouts = []
+        for img in images:
+            if cancel_token is not None:
+                cancel_token.raise_if_cancelled()
+            layouts.append(self._extract_layout_from_result(engine.ocr(img)))
+        return layouts
+    
+    def _extract_layout_from_result(self, result):
+        """从OCR结果中提取文本行及其文本框、置信度（见 PageLayout）"""
         try:
-            # 提取项目名称 - 根据用户描述格式【*体育用品*Keep动感单车】
-            # 匹配包含*的项目名称格式
-            project_patterns = [
-                r'【\*([^\*】]+)\*([^\*】]+)】',  # 格式如【*体育用品*Keep动感单车】
-                r'项目名称[：:]\s*([^\n\r【】]+?)(?=\s*【|$)',
-                r'项目[：:]\s*([^\n\r【】]+?)(?=\s*【|$)',
-                r'商品名称[：:]\s*([^\n\r【】]+?)(?=\s*【|$)',
-                r'名称[：:]\s*([^\n\r【】]+?)(?=\s*【|$)',
-                r'服务名称[：:]\s*([^\n\r【】]+?)(?=\s*【|$)',
-                r'费用名称[：:]\s*([^\n\r【】]+?)(?=\s*【|$)',
-            ]
-            
-            for pattern in project_patterns:
-                project_matches = re.findall(pattern, text)
-                print(f"项目名称模式 '{pattern}' 匹配结果: {project_matches}")
-                if project_matches:
-                    if isinstance(project_matches[0], tuple) and len(project_matches[0]) >= 2:
-                        # 对于【*体育用品*Keep动感单车】格式，取第二部分作为项目名称
-                        project_name = project_matches[0][1].strip()
-                    else:
-                        project_name = project_matches[0].strip() if isinstance(project_matches[0], str) else str(project_matches[0]).strip()
-                    
-                    # 清理项目名称
-                    project_name = re.sub(r'[【】\*]', '', project_name).strip()
-                    if project_name and len(project_name) > 1:
-                        print(f"提取到项目名称: {project_name}")
-                        break
-                    else:
-                        project_name = ''
-        except Exception as e:
-            print(f"项目名称提取失败: {e}")
-        
-        result = [image_path, company_name, invoice_number, invoice_date, invoice_amount, project_name]
-        print(f"最终提取结果: {result}")
-        return result
+            layout = PageLayout.from_result(result)
+        except (IndexError, TypeError, ValueError) as e:
+            log.warning("文本提取出错: %s", e)
+            return PageLayout([])
+        if len(layout) and log.isEnabledFor(logging.DEBUG):
+            # 新版本格式（PaddleX/PaddleOCR新版本）结果包含rec_texts字段
+            new_format = isinstance(result[0], dict) and 'rec_texts' in result[0]
+            log.debug("使用%s格式提取文本，共%d条", "新" if new_format else "旧", len(layout))
+        return layout
+    
+    def _extract_texts_from_result(self, result):
+        """从OCR结果中提取文本"""
+        return self._extract_layout_from_result(result).texts
+    
+    # 已移除 EasyOCR 解析路径，仅保留 PaddleOCR
+    
+    def _contains_invoice_keywords(self, text):
+        """检查文本是否包含发票关键词"""
+        return contains_invoice_keywords(text)
+    
+    def _extract_invoice_info(self, text, image_path, layout=None):
+        """从文本中提取发票信息
+        有文本框位置时先识别票据类型并按模板取值（见 InvoiceTemplates），再按标签与取值的相对位置配对（见 PageLayout），
+        其余字段用预编译的正则规则（见 FieldExtractor）。结果末尾都是票据类型，没有文本框位置时无法判断，为空
+        """
+        if layout is None:
+            return extract_invoice_fields(text, image_path) + ['']
+        return extract_page_fields(layout, image_path)[0]
 
     def get_model_info(self):
         """获取当前使用的模型信息"""
@@ -570,6 +580,112 @@ class OfflineOCRInvoice:
         
         return info
 
+class OCRMicroBatcher:
+    """OCR微批处理器 - 汇集多个调用方逐张提交的图片，凑满批次或等待超时后统一识别
+
+    OCR引擎只在后台线程中调用，提交方可以来自多个线程。
+    """
+    
+    def __init__(self, ocr=None, max_batch=None, max_latency_ms=None):
+        # ocr 可以是 OfflineOCRInvoice，也可以是提供 run_ocr_batch/submit_batch 的工作池
+        self.ocr = ocr or OfflineOCRInvoice()
+        batch_config = self.ocr.batch_config
+        self.max_batch = max(1, int(max_batch or batch_config.get("max_batch_size", 1)))
+        if max_latency_ms is None:
+            max_latency_ms = batch_config.get("max_latency_ms", 50)
+        self.max_latency = max(0.0, float(max_latency_ms) / 1000.0)
+        
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._closed = False
+        self._worker = threading.Thread(target=self._run, name="OCRMicroBatcher", daemon=True)
+        self._worker.start()
+    
+    def submit(self, image_path):
+        """提交一张图片，返回 Future，结果格式同 run_ocr（尚未开始识别时可调用 future.cancel() 取消）"""
+        future = Future()
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("OCRMicroBatcher 已关闭")
+            self._queue.put((image_path, future))
+        return future
+    
+    def close(self):
+        """处理完已提交的图片后停止后台线程"""
+        with self._lock:
+            if not self._closed:
+                self._closed = True
+                self._queue.put(None)
+        self._worker.join()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+    
+    def _run(self):
+        """后台线程：收集一批后送入 run_ocr_batch"""
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            if item is None:
+                break
+            
+            batch = [item] if item[1].set_running_or_notify_cancel() else []
+            deadline = time.monotonic() + self.max_latency
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                try:
+                    item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                # 调用方已取消的图片不再识别
+                if item[1].set_running_or_notify_cancel():
+                    batch.append(item)
+            
+            if batch:
+                self._process(batch)
+    
+    def _process(self, batch):
+        image_paths = [image_path for image_path, _ in batch]
+        
+        # 后端支持异步提交（如多进程工作池）时不等待结果，继续收集下一批
+        if hasattr(self.ocr, 'submit_batch'):
+            try:
+                batch_future = self.ocr.submit_batch(image_paths)
+            except Exception as e:  # 工作池已关闭等：本批以异常结束，后台线程继续运行
+                for _, future in batch:
+                    future.set_exception(e)
+                return
+            batch_future.add_done_callback(lambda f: self._resolve(batch, f))
+            return
+        
+        try:
+            results = self.ocr.run_ocr_batch(image_paths, max_batch=len(image_paths))
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        for (_, future), result in zip(batch, results):
+            future.set_result(result)
+    
+    @staticmethod
+    def _resolve(batch, batch_future):
+        """把整批结果分发给各张图片的 Future（各图片已进入识别，整批被撤回时也以异常结束）"""
+        if batch_future.cancelled():
+            error = RuntimeError("OCR识别批次已被撤回")
+        else:
+            error = batch_future.exception()
+        for index, (_, future) in enumerate(batch):
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(batch_future.result()[index])
+
 # 保持向后兼容性
 OCRInvoice = OfflineOCRInvoice
 
@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+检测/识别分离的OCR流水线 - 跨页面合并文本行识别批次
+检测在缩小后的页面上运行，文本框映射回原图裁剪；多页的文本行进入同一识别队列，
+按宽度分桶后整批识别，减少补齐(padding)带来的无效计算。
+"""
+
+from pathlib import Path
+import numpy as np
+import cv2
+
+# 分离流水线默认参数（可在 offline_config.json 的 "stages" 节覆盖）
+DEFAULT_STAGE_CONFIG = {
+    "enabled": True,
+    "det_max_side": 1280,                    # 检测输入的最长边（像素），超过则等比缩小
+    "rec_image_height": 48,                  # 识别模型输入高度，用于估算缩放后宽度
+    "width_buckets": [80, 160, 320, 640],    # 识别输入宽度分桶边界
+}
+
+
+class DecoupledOCREngine:
+    """检测/识别分离的OCR引擎
+
+    与 PaddleOCR 流水线保持相同的调用方式：predict(images) 返回每页一个结果字典，
+    ocr(image) 返回单元素列表，字典中包含 rec_texts / rec_scores / rec_polys。
+    predict 支持 cancel_token，在每页检测与每个识别批次前检查。
+    """
+    supports_cancellation = True
+
+    def __init__(self, detector, recognizer, rec_batch_size=16, stage_config=None):
+        self.detector = detector
+        self.recognizer = recognizer
+        self.rec_batch_size = max(1, int(rec_batch_size))
+        config = dict(DEFAULT_STAGE_CONFIG)
+        config.update(stage_config or {})
+        self.det_max_side = int(config["det_max_side"])
+        self.rec_image_height = int(config["rec_image_height"])
+        self.width_buckets = sorted(int(w) for w in config["width_buckets"])
+
+    @classmethod
+    def from_config(cls, models, stage_config=None, rec_batch_size=16):
+        """根据离线配置中的模型目录创建检测/识别模块"""
+        # 延迟导入 - PaddleOCR 3.x 提供独立的检测/识别模块
+        from paddleocr import TextDetection, TextRecognition
+
+        det_dir = models["det_model_dir"]
+        rec_dir = models["rec_model_dir"]
+        detector = TextDetection(model_name=Path(det_dir).name, model_dir=det_dir)
+        recognizer = TextRecognition(model_name=Path(rec_dir).name, model_dir=rec_dir)
+        return cls(detector, recognizer, rec_batch_size, stage_config)
+
+    def ocr(self, image):
+        """单张图片识别，返回格式与 PaddleOCR.ocr 一致"""
+        return self.predict([image])
+
+    def predict(self, images, cancel_token=None):
+        """多张图片识别：逐页检测后，所有页面的文本行合并识别"""
+        images = list(images)
+        page_polys = []
+        for img in images:
+            if cancel_token is not None:
+                cancel_token.raise_if_cancelled()
+            page_polys.append(self.detect(img))
+
+        # 所有页面的文本行进入同一识别队列
+        crops = []
+        owners = []
+        for page_index, (img, polys) in enumerate(zip(images, page_polys)):
+            for line_index, poly in enumerate(polys):
+                crops.append(crop_text_line(img, poly))
+                owners.append((page_index, line_index))
+
+        texts = [''] * len(crops)
+        scores = [0.0] * len(crops)
+        for batch in self._rec_batches(crops):
+            if cancel_token is not None:
+                cancel_token.raise_if_cancelled()
+            for crop_index, (text, score) in zip(batch, self.recognize([crops[i] for i in batch])):
+                texts[crop_index] = text
+                scores[crop_index] = score
+
+        results = [{"rec_texts": [], "rec_scores": [], "rec_polys": []} for _ in images]
+        for (page_index, line_index), text, score in zip(owners, texts, scores):
+            if not text:
+                continue
+            page = results[page_index]
+            page["rec_texts"].append(text)
+            page["rec_scores"].append(score)
+            page["rec_polys"].append(page_polys[page_index][line_index])
+        return results
+
+    def detect(self, image):
+        """在缩小后的页面上检测文本框，返回映射回原图坐标、按阅读顺序排列的四边形"""
+        height, width = image.shape[:2]
+        scale = min(1.0, self.det_max_side / float(max(height, width)))
+        det_input = image
+        if scale < 1.0:
+            det_input = cv2.resize(image, (max(1, int(width * scale)), max(1, int(height * scale))),
+                                   interpolation=cv2.INTER_AREA)
+
+        polys = []
+        for res in self.detector.predict(det_input):
+            polys.extend(res.get("dt_polys", []))
+        polys = [np.asarray(poly, dtype=np.float32).reshape(4, 2) / scale for poly in polys]
+        return sort_reading_order(polys)
+
+    def recognize(self, crops):
+        """整批识别文本行，返回 [(text, score), ...]"""
+        if not crops:
+            return []
+        outputs = []
+        for res in self.recognizer.predict(crops, batch_size=len(crops)):
+            outputs.append((str(res.get("rec_text", "")).strip(), float(res.get("rec_score", 0.0))))
+        return outputs
+
+    def _rec_batches(self, crops):
+        """按缩放后的宽度分桶，桶内按宽度排序后切成整批"""
+        buckets = {}
+        widths = []
+        for index, crop in enumerate(crops):
+            h, w = crop.shape[:2]
+            width = int(round(w * self.rec_image_height / float(max(h, 1))))
+            widths.append(width)
+            bucket = next((i for i, edge in enumerate(self.width_buckets) if width <= edge),
+                          len(self.width_buckets))
+            buckets.setdefault(bucket, []).append(index)
+
+        batches = []
+        for bucket in sorted(buckets):
+            indices = sorted(buckets[bucket], key=lambda i: widths[i])
+            for start in range(0, len(indices), self.rec_batch_size):
+                batches.append(indices[start:start + self.rec_batch_size])
+        return batches
+
+
+def crop_text_line(image, poly):
+    """按四边形透视裁剪文本行，竖排文本旋转为横排"""
+    pts = np.asarray(poly, dtype=np.float32)
+    crop_w = int(max(np.linalg.norm(pts[0] - pts[1]), np.linalg.norm(pts[2] - pts[3])))
+    crop_h = int(max(np.linalg.norm(pts[0] - pts[3]), np.linalg.norm(pts[1] - pts[2])))
+    crop_w, crop_h = max(crop_w, 1), max(crop_h, 1)
+    dst = np.float32([[0, 0], [crop_w, 0], [crop_w, crop_h], [0, crop_h]])
+    matrix = cv2.getPerspectiveTransform(pts, dst)
+    crop = cv2.warpPerspective(image, matrix, (crop_w, crop_h),
+                               borderMode=cv2.BORDER_REPLICATE, flags=cv2.INTER_CUBIC)
+    if crop_h / float(crop_w) >= 1.5:
+        crop = np.rot90(crop)
+    return crop
+
+
+def sort_reading_order(polys, line_tolerance=10):
+    """按从上到下、从左到右排序文本框（同一行内纵坐标差小于阈值视为同行）"""
+    ordered = sorted(polys, key=lambda p: (p[0][1], p[0][0]))
+    for i in range(len(ordered) - 1):
+        for j in range(i, -1, -1):
+            if (abs(ordered[j + 1][0][1] - ordered[j][0][1]) < line_tolerance
+                    and ordered[j + 1][0][0] < ordered[j][0][0]):
+                ordered[j], ordered[j + 1] = ordered[j + 1], ordered[j]
+            else:
+                break
+    return ordered
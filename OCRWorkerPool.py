@@ -0,0 +1,356 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+多进程OCR工作池 - Linux 下的 fork-server 模式
+独立的服务进程只导入一次 Paddle 并加载一次模型权重，再 fork 出工作进程；
+工作进程以写时复制(copy-on-write)方式共享这些内存页，
+因此内存占用和启动时间几乎不随工作进程数增长。
+"""
+
+import sys
+import gc
+import time
+import queue
+import threading
+import itertools
+import multiprocessing
+from collections import deque
+from concurrent.futures import Future, InvalidStateError
+
+from OCRInvoice import OfflineOCRInvoice, DEFAULT_BATCH_CONFIG
+from Cancellation import OperationCancelled
+from StructuredLog import get_logger
+
+log = get_logger("OCRWorkerPool")
+
+# 工作池默认参数（可在 offline_config.json 的 "workers" 节覆盖）
+DEFAULT_WORKER_CONFIG = {
+    "mode": "inprocess",    # inprocess: 在当前进程内识别；forkserver: 使用多进程工作池
+    "count": 2,             # 工作进程数
+    "startup_timeout": 300, # 等待服务进程加载模型的最长秒数
+}
+
+_READY = "__ready__"
+_WATCH_INTERVAL = 1.0  # 有批次在识别时，每隔多少秒检查一次服务进程与工作进程是否仍在运行
+
+
+def _read_smaps_rollup(pid):
+    """读取 /proc/<pid>/smaps_rollup，返回 {字段: 字节数}"""
+    values = {}
+    with open(f"/proc/{pid}/smaps_rollup", "r") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) >= 3 and parts[2] == "kB":
+                values[parts[0].rstrip(":")] = int(parts[1]) * 1024
+    return values
+
+
+def process_alive(pid):
+    """进程是否仍在运行（已退出但尚未被回收的僵尸进程算已退出）"""
+    try:
+        with open(f"/proc/{pid}/stat", "r") as f:
+            state = f.read().rpartition(")")[2].split()[0]
+    except (OSError, IndexError):
+        return False
+    return state not in ("Z", "X")
+
+
+def process_memory(pid):
+    """进程内存统计：USS（独占）、PSS（按共享比例分摊）、RSS（常驻）"""
+    try:
+        values = _read_smaps_rollup(pid)
+    except OSError:
+        return None
+    return {
+        "uss": values.get("Private_Clean", 0) + values.get("Private_Dirty", 0),
+        "pss": values.get("Pss", 0),
+        "rss": values.get("Rss", 0),
+    }
+
+
+def _worker_main(task_queue, result_queue):
+    """工作进程：复用 fork 前已加载好的全局OCR引擎"""
+    ocr = OfflineOCRInvoice()
+    while True:
+        task = task_queue.get()
+        if task is None:
+            break
+        task_id, image_paths = task
+        try:
+            results = ocr.run_ocr_batch(image_paths, max_batch=len(image_paths))
+            result_queue.put((task_id, True, results))
+        except Exception as e:
+            result_queue.put((task_id, False, str(e)))
+
+
+def _fork_server_main(precision_mode, workers, task_queue, result_queue):
+    """服务进程：预加载 Paddle 与模型权重后 fork 工作进程"""
+    if not OfflineOCRInvoice.global_initialize_ocr(precision_mode):
+        result_queue.put((_READY, False, "OCR引擎初始化失败"))
+        return
+    # 复核用的高精引擎也在 fork 前创建，工作进程共享同一份权重；否则每个工作进程复核时各自加载一份
+    OfflineOCRInvoice.preload_refine_engine()
+
+    # 冻结已有对象，避免垃圾回收改写引用计数所在页面而破坏写时复制
+    gc.collect()
+    gc.freeze()
+
+    fork_context = multiprocessing.get_context("fork")
+    processes = []
+    for _ in range(workers):
+        process = fork_context.Process(target=_worker_main, args=(task_queue, result_queue), daemon=True)
+        process.start()
+        processes.append(process)
+
+    result_queue.put((_READY, True, [process.pid for process in processes]))
+    for process in processes:
+        process.join()
+
+
+class OCRWorkerPool:
+    """fork-server 模式的OCR工作池，接口与 OfflineOCRInvoice.run_ocr_batch 一致"""
+
+    def __init__(self, workers=None, precision_mode='快速'):
+        self.offline_config = OfflineOCRInvoice._load_offline_config()
+        worker_config = dict(DEFAULT_WORKER_CONFIG)
+        worker_config.update(self.offline_config.get("workers") or {})
+        self.worker_config = worker_config
+        self.workers = max(1, int(workers or worker_config["count"]))
+        self.precision_mode = precision_mode
+
+        self.server_pid = None
+        self.worker_pids = []
+        self.startup_seconds = None
+
+        self._server = None
+        self._task_queue = None
+        self._result_queue = None
+        self._collector = None
+        self._pending = {}
+        self._backlog = deque()  # 尚未发给工作进程的批次，每个工作进程同时最多持有一批
+        self._in_flight = 0
+        self._pending_lock = threading.Lock()
+        self._task_ids = itertools.count()
+        self._broken = None  # 工作进程意外退出的原因；之后不再接收新批次，由 get_shared_pool 重建
+
+    @staticmethod
+    def is_supported():
+        """fork-server 模式依赖 fork 与 /proc，仅支持 Linux"""
+        return sys.platform.startswith("linux")
+
+    @property
+    def batch_config(self):
+        """获取批处理配置"""
+        return self.offline_config.get("batch") or dict(DEFAULT_BATCH_CONFIG)
+
+    @property
+    def is_running(self):
+        return self._server is not None and self._server.is_alive() and self._broken is None
+
+    def start(self):
+        """启动服务进程并等待工作进程就绪"""
+        if not self.is_supported():
+            raise RuntimeError("fork-server 工作池仅支持 Linux")
+        if self.is_running:
+            return self
+        if self._server is not None:
+            self.close()
+        self._broken = None
+
+        # 服务进程用 spawn 启动：不继承GUI进程的线程与Qt状态，是干净的 fork 起点
+        spawn_context = multiprocessing.get_context("spawn")
+        self._task_queue = spawn_context.Queue()
+        self._result_queue = spawn_context.Queue()
+        self._server = spawn_context.Process(
+            target=_fork_server_main,
+            args=(self.precision_mode, self.workers, self._task_queue, self._result_queue),
+            name="OCRForkServer",
+        )
+
+        started = time.monotonic()
+        self._server.start()
+        self.server_pid = self._server.pid
+        try:
+            tag, ok, payload = self._result_queue.get(timeout=self.worker_config["startup_timeout"])
+        except Exception:
+            self.close()
+            raise RuntimeError("等待OCR工作池就绪超时")
+        if tag != _READY or not ok:
+            self.close()
+            raise RuntimeError(f"OCR工作池启动失败: {payload}")
+
+        self.worker_pids = list(payload)
+        self.startup_seconds = time.monotonic() - started
+        log.info("OCR工作池就绪: %d 个工作进程，耗时 %.1f秒", self.workers, self.startup_seconds)
+
+        self._collector = threading.Thread(target=self._collect, name="OCRWorkerPoolCollector", daemon=True)
+        self._collector.start()
+        return self
+
+    def submit_batch(self, image_paths):
+        """提交一批图片，返回 Future，结果为与 image_paths 对应的识别结果列表
+        尚未发给工作进程的批次可通过 future.cancel() 撤回
+        """
+        if not self.is_running:
+            raise RuntimeError("OCR工作池未启动")
+        future = Future()
+        task_id = next(self._task_ids)
+        with self._pending_lock:
+            self._pending[task_id] = future
+            self._backlog.append((task_id, list(image_paths)))
+            self._feed()
+        return future
+
+    def run_ocr_batch(self, image_paths, max_batch=None, cancel_token=None):
+        """按批次分发到各工作进程并行识别，结果顺序与输入一致
+        cancel_token: CancellationToken（可选），取消时撤回未开始的批次并抛出 OperationCancelled
+        """
+        image_paths = list(image_paths)
+        if max_batch is None:
+            max_batch = self.batch_config.get("max_batch_size", 1)
+        max_batch = max(1, int(max_batch))
+        futures = [self.submit_batch(image_paths[start:start + max_batch])
+                   for start in range(0, len(image_paths), max_batch)]
+        unregister = cancel_token.on_cancel(lambda: [f.cancel() for f in futures]) if cancel_token else None
+        try:
+            results = []
+            for future in futures:
+                if future.cancelled():
+                    raise OperationCancelled()
+                results.extend(future.result())
+            return results
+        finally:
+            if unregister is not None:
+                unregister()
+
+    def memory_report(self):
+        """各进程内存统计 {pid: {"role", "uss", "pss", "rss"}}，单位字节"""
+        report = {}
+        if self.server_pid:
+            report[self.server_pid] = dict(process_memory(self.server_pid) or {}, role="server")
+        for pid in self.worker_pids:
+            report[pid] = dict(process_memory(pid) or {}, role="worker")
+        return report
+
+    def close(self):
+        """停止工作进程与服务进程，未完成的任务以异常结束"""
+        if self._server is not None:
+            if self._server.is_alive():
+                for _ in range(self.workers):
+                    self._task_queue.put(None)
+                self._server.join(10)
+                if self._server.is_alive():
+                    self._server.terminate()
+                    self._server.join(1)
+            self._server = None
+
+        if self._result_queue is not None and self._collector is not None:
+            self._result_queue.put(None)
+            self._collector.join(5)
+        self._collector = None
+
+        self._fail_pending(RuntimeError("OCR工作池已关闭"))
+        self.worker_pids = []
+
+    def _fail_pending(self, error):
+        """未完成的批次（含尚未发出的）都以 error 结束
+        不用 cancel()：调用方（如 OCRMicroBatcher）在批次结束时才结束各图片的 Future，撤回的批次同样要通知到
+        """
+        with self._pending_lock:
+            pending, self._pending = self._pending, {}
+            self._backlog.clear()
+            self._in_flight = 0
+        for future in pending.values():
+            try:
+                future.set_exception(error)
+            except InvalidStateError:  # 已完成或已被调用方取消
+                pass
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def _feed(self):
+        """把等待中的批次发给空闲的工作进程，已取消的直接丢弃（调用方持有 _pending_lock）"""
+        while self._backlog and self._in_flight < self.workers:
+            task_id, image_paths = self._backlog.popleft()
+            future = self._pending.get(task_id)
+            if future is None or not future.set_running_or_notify_cancel():
+                self._pending.pop(task_id, None)
+                continue
+            self._task_queue.put((task_id, image_paths))
+            self._in_flight += 1
+
+    def _dead_processes(self):
+        """已退出的服务进程/工作进程说明"""
+        if self._server is None or not self._server.is_alive():
+            return ["服务进程"]
+        return [f"工作进程 {pid}" for pid in self.worker_pids if not process_alive(pid)]
+
+    def _collect(self):
+        """收集线程：把工作进程返回的结果分发给对应的 Future
+        有批次在识别时定期检查进程：有进程意外退出（如 Paddle 崩溃、内存不足被杀）时，
+        无法确定哪些批次丢失，全部未完成的批次以异常结束，工作池不再接收新批次
+        """
+        while True:
+            try:
+                message = self._result_queue.get(timeout=_WATCH_INTERVAL)
+            except queue.Empty:
+                with self._pending_lock:
+                    busy = self._in_flight > 0
+                dead = self._dead_processes() if busy else []
+                if dead:
+                    self._broken = f"{'、'.join(dead)}意外退出"
+                    log.error("OCR工作池%s，未完成的批次以失败结束", self._broken)
+                    self._fail_pending(RuntimeError(f"OCR{self._broken}"))
+                    break
+                continue
+            if message is None:
+                break
+            task_id, ok, payload = message
+            with self._pending_lock:
+                future = self._pending.pop(task_id, None)
+                self._in_flight = max(0, self._in_flight - 1)
+                self._feed()
+            if future is None or future.done():
+                continue
+            if ok:
+                future.set_result(payload)
+            else:
+                future.set_exception(RuntimeError(payload))
+
+
+_shared_pool = None
+_shared_pool_lock = threading.Lock()
+
+
+def get_shared_pool(precision_mode='快速'):
+    """按配置返回共享的工作池；未启用 forkserver 模式或平台不支持时返回 None"""
+    global _shared_pool
+    config = OfflineOCRInvoice._load_offline_config().get("workers") or {}
+    if config.get("mode", DEFAULT_WORKER_CONFIG["mode"]) != "forkserver" or not OCRWorkerPool.is_supported():
+        return None
+
+    with _shared_pool_lock:
+        if _shared_pool is not None and (_shared_pool.precision_mode != precision_mode
+                                         or not _shared_pool.is_running):
+            _shared_pool.close()
+            _shared_pool = None
+        if _shared_pool is None:
+            try:
+                _shared_pool = OCRWorkerPool(precision_mode=precision_mode).start()
+            except Exception as e:
+                log.warning("OCR工作池启动失败，使用进程内识别: %s", e)
+                _shared_pool = None
+        return _shared_pool
+
+
+def shutdown_shared_pool():
+    """关闭共享工作池（程序退出时调用）"""
+    global _shared_pool
+    with _shared_pool_lock:
+        if _shared_pool is not None:
+            _shared_pool.close()
+            _shared_pool = None
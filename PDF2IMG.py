@@ -4,9 +4,54 @@ import datetime
 import os
 from pathlib import Path
 
+from Cancellation import OperationCancelled
+from StructuredLog import get_logger
+
+log = get_logger("PDF2IMG")
+
+PARTIAL_SUFFIX = '.part'  # 写入中的临时文件后缀，完成后原子重命名为 .png
+
+
+def _pixmap_png_bytes(pix):
+    """Pixmap 编码为 PNG 字节"""
+    try:
+        return pix.tobytes("png")
+    except AttributeError:
+        # 兼容旧版本API
+        return pix.getPNGData()
+
+
+def _write_atomic(output_file, data):
+    """先写临时文件再重命名，中途退出也不会留下半张图片"""
+    partial_file = output_file + PARTIAL_SUFFIX
+    with open(partial_file, 'wb') as f:
+        f.write(data)
+    os.replace(partial_file, output_file)
+
+
+def _remove_partial_files(image_dir):
+    """清理中断时残留的临时文件"""
+    if not path.isdir(image_dir):
+        return
+    for name in os.listdir(image_dir):
+        if name.endswith(PARTIAL_SUFFIX):
+            try:
+                os.remove(os.path.join(image_dir, name))
+            except OSError:
+                pass
+
+
 class pdf2img:
-    def pyMuPDF_fitz(self, pdfPath, output_dir=None):
+    def pyMuPDF_fitz(self, pdfPath, output_dir=None, cancel_token=None, skip_pages=None):
+        """PDF逐页渲染为PNG
+        cancel_token: CancellationToken（可选），每页渲染前检查，取消时抛出 OperationCancelled，
+            已写完的页面保留为完整的PNG
+        skip_pages: 不需要渲染的页下标（可选），如预检时已确认重复的发票页
+        """
         self.imagePath = ''
+        self.imageFiles = []   # 本次渲染生成的图片路径（按页序）
+        self.pageIndices = []  # 与 imageFiles 对应的页下标
+        skip_pages = set(skip_pages or ())
         startTime_pdf2img = datetime.datetime.now()  # 开始时间
         
         # 修正路径分隔符处理，避免中文路径问题
@@ -44,14 +89,21 @@ class pdf2img:
             base_dir = base_dir / 'IMG'
         self.imagePath = str(base_dir / clean_filename)
         
+        pdfDoc = None
         try:
             pdfDoc = fitz.open(pdfPath)
             # 修复API变化：pageCount -> page_count
             page_count = pdfDoc.page_count
             
-            print(f"PDF页数: {page_count}")
+            log.debug("PDF页数: %d", page_count)
             
             for pg in range(page_count):
+                if cancel_token is not None and cancel_token.cancelled:
+                    log.info("PDF转换已取消: 已完成 %d/%d 页", pg, page_count)
+                    raise OperationCancelled()
+                if pg in skip_pages:
+                    log.debug("跳过页面 %d/%d（重复发票）", pg + 1, page_count)
+                    continue
                 page = pdfDoc[pg]
                 rotate = int(0)
                 # 每个尺寸的缩放系数为2，生成高分辨率图像
@@ -74,24 +126,26 @@ class pdf2img:
                 if not path.exists(self.imagePath):  # 判断存放图片的文件夹是否存在
                     makedirs(self.imagePath)  # 若图片文件夹不存在就创建
 
-                # 修复API变化：writePNG -> save (在新版本中)
                 output_file = os.path.join(self.imagePath, f'images_{pg:03d}.png')
-                try:
-                    pix.save(output_file)
-                except AttributeError:
-                    # 兼容旧版本API
-                    pix.writePNG(output_file)
+                _write_atomic(output_file, _pixmap_png_bytes(pix))
+                pix = None  # 及时释放像素缓冲
+                self.imageFiles.append(output_file)
+                self.pageIndices.append(pg)
                     
-                print(f"转换页面 {pg+1}/{page_count}: {output_file}")
-
-            pdfDoc.close()
+                log.debug("转换页面 %d/%d: %s", pg + 1, page_count, output_file)
             
+        except OperationCancelled:
+            raise
         except Exception as e:
-            print(f"PDF处理出错: {e}")
+            log.error("PDF处理出错: %s", e)
             raise
+        finally:
+            if pdfDoc is not None:
+                pdfDoc.close()
+            _remove_partial_files(self.imagePath)
             
         endTime_pdf2img = datetime.datetime.now()  # 结束时间
-        print(f'PDF转图片耗时: {(endTime_pdf2img - startTime_pdf2img).seconds}秒')
+        log.debug("PDF转图片耗时: %d秒", (endTime_pdf2img - startTime_pdf2img).seconds)
         return self.imagePath
 
 
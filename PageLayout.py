@@ -0,0 +1,298 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+页面版面 - 保留OCR文本行的位置与识别置信度，按标签与取值的相对位置提取字段
+文本行按阅读顺序保存；文本框 (x0, y0, x1, y1)、识别置信度、行在拼接文本（【行1】【行2】…）中的偏移
+都存为 NumPy 数组。每个字段先找标签行（如“开票日期”），再在所有文本行中一次性计算
+标签右侧同一行 / 下方相邻行的距离，取最近且格式有效的取值。
+只有标签与取值分成两个文本框时才需要位置信息；同一文本框内的“标签：取值”直接取冒号之后的部分。
+版面中找不到的字段仍由 FieldExtractor 的正则规则从拼接文本中提取。
+"""
+
+import re
+import numpy as np
+
+from FieldExtractor import (FIELD_AMOUNT, FIELD_COMPANY, FIELD_DATE, FIELD_INDEX, FIELD_NUMBER, FIELD_PROJECT,
+                            MAX_AMOUNT, MIN_AMOUNT, RULE_WEIGHT_FIRST, RULE_WEIGHT_LAST, load_extract_config)
+
+# 字段: (标签（按优先级）, 取值方向)；right 为标签右侧同一行，below 为标签下方相邻行
+# 金额不用“合计”：全电发票“合计”一行是不含税金额，交给正则规则按原优先级处理
+LABELS = {
+    FIELD_COMPANY: (('销售方名称', '销售方', '开票方名称', '开票方', '销售单位', '收款单位'), ('right', 'below')),
+    FIELD_NUMBER: (('发票号码', '发票号', 'No', '号码'), ('right', 'below')),
+    FIELD_DATE: (('开票日期', '发票日期', '日期'), ('right', 'below')),
+    FIELD_AMOUNT: (('价税合计', '小写', '实付金额', '应付金额', '总金额', '总计'), ('right', 'below')),
+    FIELD_PROJECT: (('项目名称', '货物或应税劳务、服务名称', '商品名称', '服务名称', '费用名称'), ('below',)),
+}
+
+# 标签之后到取值之前允许出现的字符（括号说明、冒号、空白）
+_LABEL_TAIL = re.compile(r'^(?:[（(][^）)]{0,6}[）)])?[：:.\s]*')
+_NUMBER_VALUE = re.compile(r'^[：:.\s]*([0-9]{6,20})$')
+_DATE_VALUE = re.compile(r'^[：:\s]*([0-9]{4})\s*[年.\-/]\s*([0-9]{1,2})\s*[月.\-/]\s*([0-9]{1,2})\s*日?$')
+_AMOUNT_VALUE = re.compile(r'^(?:[（(]?小写[）)]?)?[：:\s]*[￥¥]?\s*([0-9]+(?:\.[0-9]+)?)\s*元?$')
+_PROJECT_VALUE = re.compile(r'^\*([^*]+)\*(.+)$')
+_COMPANY_LABEL = re.compile(r'^([^：:]{0,8})[：:]\s*(.*)$')
+_COMPANY_NAME_LABELS = ('', '名称', '销售方名称', '开票方名称', '销售方', '开票方', '销售单位', '收款单位')
+_COMPANY_REJECT = re.compile('发票|号码|日期|金额|项目|信息|购买方|纳税人|代码|地址|电话|开户行|账号')
+_TABLE_HEADERS = re.compile('^(?:规格型号|单位|数量|单价|金额|税率|税率/征收率|税额|备注)$')
+
+# 取值候选：按距离取最近的若干个文本行逐个校验
+MAX_CANDIDATES = 6
+# 下方取值与标签的最大间距（标签行高的倍数）
+BELOW_MAX_GAP = 3.0
+
+
+def _boxes_from_polys(polys, count):
+    """四边形/多边形顶点 -> (count, 4) 的外接矩形；顶点数一致时整体向量化计算"""
+    try:
+        points = np.asarray(polys, dtype=np.float32).reshape(count, -1, 2)
+        return np.concatenate([points.min(axis=1), points.max(axis=1)], axis=1)
+    except (ValueError, TypeError):
+        boxes = np.zeros((count, 4), dtype=np.float32)
+        for i, poly in enumerate(polys):
+            points = np.asarray(poly, dtype=np.float32).reshape(-1, 2)
+            boxes[i] = (*points.min(axis=0), *points.max(axis=0))
+        return boxes
+
+
+class PageLayout:
+    """一页的OCR文本行（阅读顺序）
+
+    texts: 文本列表
+    text: 拼接文本 【行1】【行2】…（与正则提取使用的文本一致）
+    boxes: (N, 4) float32 外接矩形 x0, y0, x1, y1；没有位置信息时为 None
+    scores: (N,) float32 识别置信度；没有时全为 1
+    offsets: (N + 1,) int64，第 i 行为 text[offsets[i] + 1:offsets[i + 1] - 1]
+    """
+    __slots__ = ("texts", "text", "boxes", "scores", "offsets")
+
+    def __init__(self, texts, boxes=None, scores=None):
+        self.texts = list(texts)
+        count = len(self.texts)
+        self.text = '【' + '】【'.join(self.texts) + '】' if self.texts else ''
+        lengths = np.fromiter((len(text) + 2 for text in self.texts), dtype=np.int64, count=count)
+        self.offsets = np.zeros(count + 1, dtype=np.int64)
+        np.cumsum(lengths, out=self.offsets[1:])
+        self.boxes = None
+        if boxes is not None and len(boxes) == count and count:
+            self.boxes = np.asarray(boxes, dtype=np.float32).reshape(count, 4)
+        if scores is not None and len(scores) == count:
+            self.scores = np.asarray(scores, dtype=np.float32)
+        else:
+            self.scores = np.ones(count, dtype=np.float32)
+
+    def __len__(self):
+        return len(self.texts)
+
+    @property
+    def has_boxes(self):
+        return self.boxes is not None
+
+    def line_at(self, position):
+        """拼接文本中的位置 -> 所在文本行下标（正则匹配位置映射回文本行）"""
+        return int(np.searchsorted(self.offsets, position, side='right')) - 1
+
+    @classmethod
+    def from_result(cls, result):
+        """PaddleOCR 结果 -> PageLayout
+        新格式：[{'rec_texts', 'rec_scores', 'rec_polys' / 'rec_boxes'}]（含检测/识别分离流水线）
+        旧格式：[[[顶点, (文本, 置信度)], ...]]
+        """
+        if not result or not result[0]:
+            return cls([])
+        page = result[0]
+        if isinstance(page, dict) and 'rec_texts' in page:
+            texts = list(page['rec_texts'])
+            scores = page.get('rec_scores')
+            boxes = page.get('rec_boxes')
+            if boxes is None or len(boxes) != len(texts):
+                polys = page.get('rec_polys')
+                boxes = (_boxes_from_polys(polys, len(texts))
+                         if polys is not None and len(polys) == len(texts) and texts else None)
+            return cls(texts, boxes, None if scores is None else list(scores))
+
+        texts, polys, scores = [], [], []
+        for line in page:
+            if not line or len(line) < 2 or not line[1]:
+                continue
+            if isinstance(line[1], tuple) and len(line[1]) > 0:
+                text = line[1][0].strip()
+                score = line[1][1] if len(line[1]) > 1 else 1.0
+            elif isinstance(line[1], str):
+                text, score = line[1].strip(), 1.0
+            else:
+                continue
+            if text:
+                texts.append(text)
+                polys.append(line[0])
+                scores.append(score)
+        boxes = _boxes_from_polys(polys, len(texts)) if texts else None
+        return cls(texts, boxes, scores)
+
+
+def _valid_company(text):
+    match = _COMPANY_LABEL.match(text)
+    if match:
+        if match.group(1).strip() not in _COMPANY_NAME_LABELS:
+            return None  # 其他标签的“标签：取值”（如纳税人识别号）
+        text = match.group(2)
+    value = text.strip()
+    if len(value) < 2 or value[0].isdigit() or _COMPANY_REJECT.search(value):
+        return None
+    return value
+
+
+def _valid_number(text):
+    match = _NUMBER_VALUE.match(text)
+    return match.group(1) if match else None
+
+
+def _valid_date(text):
+    match = _DATE_VALUE.match(text)
+    if not match:
+        return None
+    year, month, day = (int(part) for part in match.groups())
+    if 2000 <= year <= 2030 and 1 <= month <= 12 and 1 <= day <= 31:
+        return f"{year}{month:02d}{day:02d}"
+    return None
+
+
+def _valid_amount(text):
+    match = _AMOUNT_VALUE.match(text.strip())
+    if not match:
+        return None
+    amount = float(match.group(1))
+    return amount if MIN_AMOUNT <= amount <= MAX_AMOUNT else None
+
+
+def _valid_project(text):
+    value = text.strip()
+    if not value or '：' in value or ':' in value or _TABLE_HEADERS.match(value):
+        return None
+    match = _PROJECT_VALUE.match(value)
+    if match:
+        value = match.group(2).strip()
+    if len(value) <= 1 or _valid_amount(value) is not None or value.rstrip('%').isdigit():
+        return None
+    return value
+
+
+VALIDATORS = {
+    FIELD_COMPANY: _valid_company,
+    FIELD_NUMBER: _valid_number,
+    FIELD_DATE: _valid_date,
+    FIELD_AMOUNT: _valid_amount,
+    FIELD_PROJECT: _valid_project,
+}
+
+
+class SpatialFieldExtractor:
+    """按标签与取值的相对位置提取字段（无状态，可在多个线程间共享）"""
+
+    def __init__(self, labels=None):
+        self.labels = labels or LABELS
+
+    def _label_hits(self, texts):
+        """[(字段, 标签优先级, 行下标, 标签之后的同行文本)]，按字段、标签优先级、阅读顺序排列"""
+        hits = []
+        for field, (keywords, _) in self.labels.items():
+            for rank, keyword in enumerate(keywords):
+                for line, text in enumerate(texts):
+                    stripped = text.lstrip()
+                    if stripped.startswith(keyword):
+                        tail = stripped[len(keyword):]
+                        hits.append((field, rank, line, tail[_LABEL_TAIL.match(tail).end():]))
+        return hits
+
+    @staticmethod
+    def _neighbour_costs(boxes, label_lines, allow_right, allow_below):
+        """所有标签行 × 所有文本行的距离矩阵 (L, N)；不在标签右侧/下方的为 inf"""
+        labels = boxes[label_lines]
+        lx0, ly0, lx1, ly1 = (labels[:, i, None] for i in range(4))
+        cx0, cy0, cx1, cy1 = (boxes[None, :, i] for i in range(4))
+        label_height = np.maximum(ly1 - ly0, 1.0)
+        line_height = np.maximum(cy1 - cy0, 1.0)
+
+        vertical_overlap = np.minimum(ly1, cy1) - np.maximum(ly0, cy0)
+        horizontal_overlap = np.minimum(lx1, cx1) - np.maximum(lx0, cx0)
+        gap_x = cx0 - lx1
+        gap_y = cy0 - ly1
+
+        # 右侧：与标签在同一行（竖直方向重叠过半），从标签右边开始；竖排的高标签取最上面的一行
+        right = (allow_right[:, None] & (vertical_overlap > 0.5 * np.minimum(label_height, line_height))
+                 & (gap_x > -0.5 * label_height))
+        right_cost = np.maximum(gap_x, 0) + np.abs(cy0 - ly0)
+        # 下方：与标签水平方向有重叠，间距不超过若干行高
+        below = (allow_below[:, None] & (horizontal_overlap > 0)
+                 & (gap_y > -0.5 * label_height) & (gap_y < BELOW_MAX_GAP * label_height))
+        below_cost = 2 * np.maximum(gap_y, 0) + 0.25 * np.abs(cx0 - lx0) + label_height
+
+        costs = np.full(right.shape, np.inf, dtype=np.float32)
+        np.copyto(costs, right_cost, where=right)
+        np.copyto(costs, np.minimum(costs, below_cost), where=below)
+        costs[np.arange(len(label_lines)), label_lines] = np.inf
+        return costs
+
+    def extract(self, layout):
+        """返回 {字段: (取值, 标签行下标, 取值行下标, 标签权重)}；没有位置信息时只处理同一文本框内的“标签：取值”
+        取值在标签行内时两个下标相同；标签权重按标签优先级从 1.0 递减（与正则规则的权重一致）
+        """
+        hits = self._label_hits(layout.texts)
+        if not hits:
+            return {}
+        found = {}
+        costs = order = None
+        if layout.has_boxes:
+            label_lines = np.fromiter((line for _, _, line, _ in hits), dtype=np.int64, count=len(hits))
+            allow_right = np.array(['right' in self.labels[field][1] for field, _, _, _ in hits])
+            allow_below = np.array(['below' in self.labels[field][1] for field, _, _, _ in hits])
+            costs = self._neighbour_costs(layout.boxes, label_lines, allow_right, allow_below)
+            count = min(MAX_CANDIDATES, costs.shape[1])
+            nearest = np.argpartition(costs, count - 1, axis=1)[:, :count]
+            order = np.take_along_axis(nearest, np.argsort(np.take_along_axis(costs, nearest, axis=1), axis=1),
+                                       axis=1)
+
+        for hit_index, (field, rank, line, tail) in enumerate(hits):
+            if field in found:
+                continue
+            keywords = self.labels[field][0]
+            weight = RULE_WEIGHT_FIRST - (RULE_WEIGHT_FIRST - RULE_WEIGHT_LAST) * rank / max(1, len(keywords) - 1)
+            validate = VALIDATORS[field]
+            value = validate(tail) if tail else None
+            if value is not None:
+                found[field] = (value, line, line, weight)
+                continue
+            if order is None:
+                continue
+            for candidate in order[hit_index]:
+                if not np.isfinite(costs[hit_index, candidate]):
+                    break
+                value = validate(layout.texts[candidate])
+                if value is not None:
+                    found[field] = (value, line, int(candidate), weight)
+                    break
+        return found
+
+
+_shared_spatial = None
+
+
+def get_spatial_extractor():
+    """按配置返回共享的版面提取器；"extract" 节 spatial 为 false 时返回 None"""
+    global _shared_spatial
+    if _shared_spatial is None:
+        _shared_spatial = SpatialFieldExtractor() if load_extract_config().get("spatial", True) else False
+    return _shared_spatial or None
+
+
+def extract_layout_fields(layout):
+    """版面字段 {字段: (取值, 标签行下标, 取值行下标, 标签权重)}；未启用或没有文本框位置时为空（全部交给正则规则）"""
+    extractor = get_spatial_extractor() if layout is not None and layout.has_boxes else None
+    if extractor is None:
+        return {}
+    return extractor.extract(layout)
+
+
+def known_fields(found):
+    """版面字段 -> {结果下标: 取值}（传给 FieldExtractor，这些字段不再用正则提取）"""
+    return {FIELD_INDEX[field]: item[0] for field, item in found.items()}
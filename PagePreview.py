@@ -0,0 +1,326 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+页面预览 - 结果表选中行时显示来源页面，并框出识别到的字段
+PDF 页面按预览区宽度从原始 PDF 渲染（不读取 IMG 目录中的高分辨率图片），
+渲染在后台线程进行，结果以 QPixmap 放入 LRU 缓存，并预取相邻行的页面。
+字段框取自 PDF 文本层（电子发票）；扫描件/图片没有文本层时只显示页面。
+"""
+
+import os
+import re
+import threading
+from collections import OrderedDict, deque
+
+from PyQt5.QtCore import Qt, QThread, QTimer, QRectF, pyqtSignal
+from PyQt5.QtGui import QColor, QImage, QPainter, QPen, QPixmap
+from PyQt5.QtWidgets import QLabel, QScrollArea, QVBoxLayout, QWidget
+
+from resource_utils import load_config_section
+
+# 预览默认参数（可在 offline_config.json 的 "preview" 节覆盖）
+DEFAULT_PREVIEW_CONFIG = {
+    "cache_pages": 64,      # LRU 缓存的页面数
+    "prefetch_rows": 2,     # 选中行前后各预取的行数
+    "max_zoom": 3.0,        # PDF 渲染的最大缩放（相对 72dpi）
+    "open_documents": 4,    # 渲染线程保持打开的 PDF 数
+}
+
+# 字段框：(结果字段下标, 名称, 颜色)
+# 结果格式: [文件路径, 开票公司名称, 发票号码, 发票日期, 金额（价税合计）, 项目名称]
+FIELD_STYLES = [
+    (1, "开票公司", "#e74c3c"),
+    (2, "发票号码", "#3498db"),
+    (3, "日期", "#27ae60"),
+    (4, "金额", "#f39c12"),
+    (5, "项目", "#8e44ad"),
+]
+
+
+def load_preview_config():
+    """读取预览配置"""
+    return load_config_section("preview", DEFAULT_PREVIEW_CONFIG)
+
+
+def field_search_terms(result):
+    """结果行 -> [(字段下标, 在页面文本中查找的字符串候选)]"""
+    terms = []
+    if not isinstance(result, (list, tuple)):
+        return terms
+    for field, _, _ in FIELD_STYLES:
+        if field >= len(result) or not result[field]:
+            continue
+        value = str(result[field]).strip()
+        candidates = [value]
+        if field == 1 and value.startswith("名称："):
+            candidates = [value[3:]]
+        elif field == 3:
+            # 日期保存为 YYYYMMDD，页面上通常是 YYYY年MM月DD日
+            match = re.fullmatch(r"(\d{4})(\d{2})(\d{2})", value)
+            if match:
+                year, month, day = match.groups()
+                candidates = [f"{year}年{month}月{day}日", f"{year}-{month}-{day}", value]
+        elif field == 4:
+            try:
+                candidates = [f"{float(value):.2f}", value]
+            except ValueError:
+                pass
+        terms.append((field, candidates))
+    return terms
+
+
+class PixmapCache:
+    """QPixmap 的 LRU 缓存（仅在主线程使用）"""
+
+    def __init__(self, capacity):
+        self.capacity = max(1, int(capacity))
+        self._items = OrderedDict()
+
+    def get(self, key):
+        item = self._items.get(key)
+        if item is not None:
+            self._items.move_to_end(key)
+        return item
+
+    def put(self, key, item):
+        self._items[key] = item
+        self._items.move_to_end(key)
+        while len(self._items) > self.capacity:
+            self._items.popitem(last=False)
+
+    def __contains__(self, key):
+        return key in self._items
+
+    def clear(self):
+        self._items.clear()
+
+
+class PreviewRenderer(QThread):
+    """后台渲染线程：最新的请求优先，预取请求在当前页之后处理"""
+    rendered = pyqtSignal(object, QImage, list)  # key, 页面图像, [(字段下标, QRectF)]
+
+    def __init__(self, config, parent=None):
+        super().__init__(parent)
+        self.config = config
+        self._requests = deque()
+        self._queued = set()
+        self._condition = threading.Condition()
+        self._stopping = False
+        self._documents = OrderedDict()  # PDF 路径 -> fitz.Document
+
+    def request(self, key, source, width, terms, prefetch=False):
+        """请求渲染；key 已在队列中时只调整先后"""
+        with self._condition:
+            if key in self._queued:
+                self._requests = deque(item for item in self._requests if item[0] != key)
+            item = (key, source, width, terms)
+            if prefetch:
+                self._requests.append(item)
+            else:
+                self._requests.appendleft(item)
+            self._queued.add(key)
+            # 快速滚动时只保留最近的请求
+            while len(self._requests) > self.config["cache_pages"]:
+                self._queued.discard(self._requests.pop()[0])
+            self._condition.notify()
+
+    def stop(self):
+        with self._condition:
+            self._stopping = True
+            self._requests.clear()
+            self._queued.clear()
+            self._condition.notify()
+        self.wait()
+
+    def run(self):
+        while True:
+            with self._condition:
+                while not self._requests and not self._stopping:
+                    self._condition.wait()
+                if self._stopping:
+                    break
+                key, source, width, terms = self._requests.popleft()
+                self._queued.discard(key)
+            try:
+                image, boxes = self._render(source, width, terms)
+            except Exception as e:
+                print(f"页面预览渲染失败: {source} - {e}")
+                image, boxes = QImage(), []
+            self.rendered.emit(key, image, boxes)
+
+        for document in self._documents.values():
+            document.close()
+        self._documents.clear()
+
+    def _open_document(self, pdf_path):
+        import fitz  # 延迟导入
+        document = self._documents.get(pdf_path)
+        if document is None:
+            document = fitz.open(pdf_path)
+            self._documents[pdf_path] = document
+            while len(self._documents) > max(1, int(self.config["open_documents"])):
+                self._documents.popitem(last=False)[1].close()
+        self._documents.move_to_end(pdf_path)
+        return document
+
+    def _render(self, source, width, terms):
+        path, page_index = source
+        if page_index is None:
+            # 图片文件：按预览宽度缩放
+            image = QImage(path)
+            if not image.isNull() and image.width() > width:
+                image = image.scaledToWidth(width, Qt.SmoothTransformation)
+            return image, []
+
+        import fitz  # 延迟导入
+        page = self._open_document(path)[page_index]
+        zoom = min(float(self.config["max_zoom"]), width / max(1.0, page.rect.width))
+        pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), alpha=False)
+        image = QImage(pix.samples, pix.width, pix.height, pix.stride, QImage.Format_RGB888).copy()
+        pix = None
+
+        boxes = []
+        for field, candidates in terms:
+            for text in candidates:
+                rects = page.search_for(text)
+                if rects:
+                    boxes.extend((field, QRectF(r.x0 * zoom, r.y0 * zoom, r.width * zoom, r.height * zoom))
+                                 for r in rects)
+                    break
+        return image, boxes
+
+
+class PagePreviewPanel(QWidget):
+    """来源页面预览面板"""
+
+    def __init__(self, config=None, parent=None):
+        super().__init__(parent)
+        self.config = config or load_preview_config()
+        self.cache = PixmapCache(self.config["cache_pages"])
+        self.page_sources = {}   # 图片路径 -> (PDF路径, 页下标)
+        self._current = None     # (key, result)
+        self._render_width = 0
+
+        layout = QVBoxLayout(self)
+        layout.setContentsMargins(0, 0, 0, 0)
+        self.info_label = QLabel("选择结果行以预览来源页面")
+        self.info_label.setWordWrap(True)
+        self.page_label = QLabel()
+        self.page_label.setAlignment(Qt.AlignHCenter | Qt.AlignTop)
+        self.scroll = QScrollArea()
+        self.scroll.setWidget(self.page_label)
+        self.scroll.setWidgetResizable(True)
+        layout.addWidget(self.info_label)
+        layout.addWidget(self.scroll)
+
+        self.renderer = PreviewRenderer(self.config, self)
+        self.renderer.rendered.connect(self._on_rendered)
+        self.renderer.start()
+
+        # 调整大小结束后按新宽度重新渲染
+        self._resize_timer = QTimer(self)
+        self._resize_timer.setSingleShot(True)
+        self._resize_timer.setInterval(200)
+        self._resize_timer.timeout.connect(self._refresh)
+
+    def add_page_sources(self, sources):
+        """记录图片对应的原始 PDF 页面 {图片路径: (PDF路径, 页下标)}"""
+        for image_path, (pdf_path, page_index) in (sources or {}).items():
+            self.page_sources[image_path] = (pdf_path, int(page_index))
+
+    def source_for(self, result):
+        """结果行的渲染来源 (路径, 页下标或 None)"""
+        if not isinstance(result, (list, tuple)) or not result or not result[0]:
+            return None
+        image_path = str(result[0])
+        source = self.page_sources.get(image_path)
+        if source is not None and os.path.exists(source[0]):
+            return source
+        if os.path.exists(image_path):
+            return (image_path, None)
+        return None
+
+    def show_result(self, result, neighbours=()):
+        """显示结果行的来源页面，并预取相邻行"""
+        width = self._target_width()
+        source = self.source_for(result)
+        if source is None:
+            self._current = None
+            self.page_label.setPixmap(QPixmap())
+            self.info_label.setText("未找到来源页面" if result else "选择结果行以预览来源页面")
+            return
+
+        key = (source, width)
+        self._current = (key, result)
+        self.info_label.setText(self._describe(source))
+        cached = self.cache.get(key)
+        if cached is not None:
+            self._display(*cached)
+        else:
+            self.page_label.setText("加载中…")
+            self.renderer.request(key, source, width, field_search_terms(result))
+
+        for neighbour in neighbours:
+            neighbour_source = self.source_for(neighbour)
+            if neighbour_source is None:
+                continue
+            neighbour_key = (neighbour_source, width)
+            if neighbour_key not in self.cache:
+                self.renderer.request(neighbour_key, neighbour_source, width,
+                                      field_search_terms(neighbour), prefetch=True)
+
+    def clear(self):
+        self.cache.clear()
+        self.page_sources.clear()
+        self.show_result(None)
+
+    def shutdown(self):
+        self.renderer.stop()
+
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        if self._current is not None and self._target_width() != self._current[0][1]:
+            self._resize_timer.start()
+
+    def _refresh(self):
+        if self._current is not None:
+            self.show_result(self._current[1])
+
+    def _target_width(self):
+        """按预览区宽度（含高分屏缩放）渲染"""
+        ratio = self.devicePixelRatioF() if hasattr(self, 'devicePixelRatioF') else 1.0
+        width = max(200, self.scroll.viewport().width() - 4)
+        return int(width * ratio)
+
+    @staticmethod
+    def _describe(source):
+        path, page_index = source
+        if page_index is None:
+            return os.path.basename(path)
+        return f"{os.path.basename(path)} · 第 {page_index + 1} 页"
+
+    def _on_rendered(self, key, image, boxes):
+        if image.isNull():
+            if self._current is not None and self._current[0] == key:
+                self.page_label.setText("页面渲染失败")
+            return
+        item = (QPixmap.fromImage(image), boxes)
+        self.cache.put(key, item)
+        if self._current is not None and self._current[0] == key:
+            self._display(*item)
+
+    def _display(self, pixmap, boxes):
+        """在页面副本上绘制字段框（缓存中保留原始页面）"""
+        if boxes:
+            pixmap = pixmap.copy()
+            painter = QPainter(pixmap)
+            colors = {field: color for field, _, color in FIELD_STYLES}
+            for field, rect in boxes:
+                pen = QPen(QColor(colors.get(field, "#e74c3c")))
+                pen.setWidth(2)
+                painter.setPen(pen)
+                painter.drawRect(rect.adjusted(-2, -2, 2, 2))
+            painter.end()
+        ratio = self.devicePixelRatioF() if hasattr(self, 'devicePixelRatioF') else 1.0
+        pixmap.setDevicePixelRatio(ratio)
+        self.page_label.setPixmap(pixmap)
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+识别进度统计 - 工作线程只更新计数，界面按固定频率读取快照刷新
+页数在 PDF 转换完成后才知道，尚未展开的文件按已展开文件的平均页数估算。
+"""
+
+import time
+import threading
+
+
+def format_eta(seconds):
+    """剩余时间格式化为 时:分:秒 / 分:秒"""
+    if seconds is None:
+        return "--:--"
+    seconds = int(round(seconds))
+    hours, rest = divmod(seconds, 3600)
+    minutes, seconds = divmod(rest, 60)
+    if hours:
+        return f"{hours}:{minutes:02d}:{seconds:02d}"
+    return f"{minutes:02d}:{seconds:02d}"
+
+
+class ProgressTracker:
+    """线程安全的进度计数器（文件数、页数、预计剩余时间）"""
+
+    def __init__(self, total_files=0, parent=None):
+        self.parent = parent             # 上级计数器（如整个任务队列），计数同步累加
+        self._lock = threading.Lock()
+        self._started = time.monotonic()
+        self.total_files = total_files   # 文件总数
+        self.files_opened = 0            # 已展开为页面的文件数
+        self.files_done = 0              # 已完成的文件数
+        self.total_pages = 0             # 已知的页面总数
+        self.pages_done = 0              # 已识别的页面数
+
+    def add_files(self, count):
+        """增加待处理的文件数"""
+        with self._lock:
+            self.total_files += count
+        if self.parent is not None:
+            self.parent.add_files(count)
+
+    def add_pages(self, count, files=1):
+        """文件已展开为 count 个页面"""
+        with self._lock:
+            self.total_pages += count
+            self.files_opened += files
+        if self.parent is not None:
+            self.parent.add_pages(count, files)
+
+    def advance(self, pages=0, files=0):
+        """完成若干页面/文件"""
+        with self._lock:
+            self.pages_done += pages
+            self.files_done += files
+        if self.parent is not None:
+            self.parent.advance(pages, files)
+
+    def snapshot(self):
+        """当前进度快照"""
+        with self._lock:
+            elapsed = time.monotonic() - self._started
+            opened = max(self.files_opened, self.files_done)
+            unopened = max(0, self.total_files - opened)
+            average = self.total_pages / float(self.files_opened) if self.files_opened else 1.0
+            estimated_pages = max(self.total_pages + unopened * average, self.pages_done)
+
+            if self.total_files and self.files_done >= self.total_files:
+                fraction = 1.0
+            elif estimated_pages:
+                fraction = self.pages_done / estimated_pages
+            else:
+                fraction = 0.0
+
+            eta = None
+            if self.pages_done and fraction < 1.0:
+                eta = elapsed / self.pages_done * (estimated_pages - self.pages_done)
+
+            return {
+                "files_done": self.files_done,
+                "total_files": self.total_files,
+                "pages_done": self.pages_done,
+                "total_pages": self.total_pages,
+                "estimated_pages": int(round(estimated_pages)),
+                "fraction": min(1.0, fraction),
+                "elapsed": elapsed,
+                "eta": eta,
+            }
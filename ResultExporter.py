@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+识别结果导出 - 在后台线程中流式写出 Excel / CSV / Parquet
+结果按块转换、逐块写入文件，不再先整体构造 DataFrame；
+支持“边识别边导出”：导出线程保持打开，新结果到达时追加。
+"""
+
+import os
+import csv
+import queue
+
+from PyQt5.QtCore import QThread, pyqtSignal
+
+from Cancellation import CancellationToken
+from resource_utils import load_config_section
+
+# 导出默认参数（可在 offline_config.json 的 "export" 节覆盖）
+DEFAULT_EXPORT_CONFIG = {
+    "chunk_rows": 1000,           # 每次转换、写入并报告进度的行数
+    "parquet_row_group": 10000,   # Parquet 每个行组的行数
+}
+
+EXPORT_COLUMNS = ["开票公司名称", "发票号码", "发票日期", "项目名称", "金额（价税合计）", "发票类型"]
+
+# 扩展名 -> 文件对话框过滤器
+EXPORT_FORMATS = {
+    ".xlsx": "Excel文件 (*.xlsx)",
+    ".csv": "CSV文件 (*.csv)",
+    ".parquet": "Parquet文件 (*.parquet)",
+}
+EXPORT_FILTER = ";;".join(EXPORT_FORMATS.values())
+
+
+def load_export_config():
+    """读取导出配置"""
+    return load_config_section("export", DEFAULT_EXPORT_CONFIG)
+
+
+def resolve_export_path(file_path, selected_filter=""):
+    """按对话框选择的格式补全扩展名；未知扩展名按 Excel 导出"""
+    suffix = os.path.splitext(file_path)[1].lower()
+    if suffix in EXPORT_FORMATS:
+        return file_path
+    for extension, name in EXPORT_FORMATS.items():
+        if name == selected_filter:
+            return file_path + extension
+    return file_path + ".xlsx"
+
+
+def summary_path(file_path, name):
+    """CSV / Parquet 的汇总表写入同目录的单独文件: <文件名>_<汇总表名>.<扩展名>"""
+    base, extension = os.path.splitext(file_path)
+    return f"{base}_{name}{extension}"
+
+
+def export_row(result):
+    """识别结果行 -> 导出行（按 EXPORT_COLUMNS 顺序），无效行返回 None"""
+    if not isinstance(result, (list, tuple)) or len(result) < 5:
+        return None
+    company_name = str(result[1]) if result[1] else ""
+    # 清理开票公司名称的前缀
+    if company_name.startswith("名称："):
+        company_name = company_name[3:]
+    item_name = str(result[5]) if len(result) >= 6 and result[5] else ""  # 旧格式（5个字段）没有项目名称
+    invoice_type = str(result[6]) if len(result) >= 7 and result[6] else ""  # 6个字段的旧格式没有发票类型
+    return (
+        company_name,
+        str(result[2]) if result[2] else "",
+        str(result[3]) if result[3] else "",
+        item_name,
+        str(result[4]) if result[4] else "",
+        invoice_type,
+    )
+
+
+class _CsvWriter:
+    """CSV：逐块写入并刷新，导出过程中即可查看（UTF-8 BOM，Excel 可直接打开）"""
+
+    def __init__(self, file_path, config):
+        self._file = open(file_path, 'w', encoding='utf-8-sig', newline='')
+        self._writer = csv.writer(self._file)
+        self._writer.writerow(EXPORT_COLUMNS)
+
+    def write_rows(self, rows):
+        self._writer.writerows(rows)
+        self._file.flush()
+
+    def write_summary(self, tables):
+        for name, table in tables.items():
+            table.to_csv(summary_path(self._file.name, name), index=False, encoding='utf-8-sig')
+
+    def close(self):
+        self._file.close()
+
+
+class _XlsxWriter:
+    """Excel：openpyxl 只写模式，行数据写入临时文件，内存占用与行数无关"""
+
+    def __init__(self, file_path, config):
+        from openpyxl import Workbook  # 延迟导入
+        self._file_path = file_path
+        self._workbook = Workbook(write_only=True)
+        self._sheet = self._workbook.create_sheet("发票识别结果")
+        self._sheet.append(EXPORT_COLUMNS)
+
+    def write_rows(self, rows):
+        for row in rows:
+            self._sheet.append(row)
+
+    def write_summary(self, tables):
+        """汇总表写为同一工作簿中的附加工作表"""
+        for name, table in tables.items():
+            sheet = self._workbook.create_sheet(name)
+            sheet.append(list(table.columns))
+            values = table.astype(object).where(table.notna(), None)
+            for row in values.itertuples(index=False):
+                sheet.append(list(row))
+
+    def close(self):
+        self._workbook.save(self._file_path)
+
+
+class _ParquetWriter:
+    """Parquet：按行组写入（需要 pyarrow）"""
+
+    def __init__(self, file_path, config):
+        try:
+            import pyarrow  # 延迟导入
+            import pyarrow.parquet
+        except ImportError:
+            raise RuntimeError("导出 Parquet 需要安装 pyarrow（pip install pyarrow）")
+        self._pa = pyarrow
+        self._file_path = file_path
+        self._schema = pyarrow.schema([(name, pyarrow.string()) for name in EXPORT_COLUMNS])
+        self._writer = pyarrow.parquet.ParquetWriter(file_path, self._schema)
+        self._row_group = max(1, int(config["parquet_row_group"]))
+        self._buffer = []
+
+    def write_rows(self, rows):
+        self._buffer.extend(rows)
+        if len(self._buffer) >= self._row_group:
+            self._flush()
+
+    def write_summary(self, tables):
+        for name, table in tables.items():
+            table.to_parquet(summary_path(self._file_path, name), index=False)
+
+    def _flush(self):
+        if not self._buffer:
+            return
+        columns = list(zip(*self._buffer))
+        arrays = [self._pa.array(column, type=self._pa.string()) for column in columns]
+        self._writer.write_table(self._pa.Table.from_arrays(arrays, schema=self._schema))
+        self._buffer = []
+
+    def close(self):
+        self._flush()
+        self._writer.close()
+
+
+_WRITERS = {
+    ".xlsx": _XlsxWriter,
+    ".csv": _CsvWriter,
+    ".parquet": _ParquetWriter,
+}
+
+
+def open_export_writer(file_path, config=None):
+    """按扩展名创建流式写入器（write_rows / write_summary / close）"""
+    config = config or load_export_config()
+    suffix = os.path.splitext(file_path)[1].lower()
+    writer_class = _WRITERS.get(suffix)
+    if writer_class is None:
+        raise ValueError(f"不支持的导出格式: {suffix or file_path}")
+    return writer_class(file_path, config)
+
+
+class ExportThread(QThread):
+    """后台导出线程
+
+    一次性导出：构造时传入结果行，线程写完即结束。
+    持续导出（continuous=True）：线程保持打开，append() 追加新结果，finish() 后写完并关闭文件。
+    summary=True 时在写完结果后附加汇总表（见 ResultSummary）。
+    """
+    progress = pyqtSignal(int, int)     # 已处理行数, 已提交行数
+    done = pyqtSignal(bool, str, int)   # 是否成功, 文件路径或错误信息, 写入行数
+
+    def __init__(self, file_path, rows=None, continuous=False, summary=False, config=None, parent=None):
+        super().__init__(parent)
+        self.file_path = file_path
+        self.continuous = continuous
+        self.summary = summary
+        self._summary_rows = []  # 汇总需要全部结果，只保留行引用
+        self.config = config or load_export_config()
+        self.chunk_rows = max(1, int(self.config["chunk_rows"]))
+        self.submitted = 0   # 已提交的结果行数（主线程更新）
+        self.consumed = 0    # 已处理的结果行数
+        self.written = 0     # 实际写入的行数（跳过无效行）
+        self.token = CancellationToken()
+        self._queue = queue.Queue()
+        if rows:
+            self.append(rows)
+        if not continuous:
+            self.finish()
+
+    def append(self, rows):
+        """追加结果行（只保存行引用，转换与写入在导出线程进行）"""
+        rows = list(rows)
+        if rows:
+            self.submitted += len(rows)
+            self._queue.put(rows)
+
+    def finish(self):
+        """不再有新结果，写完后关闭文件"""
+        self._queue.put(None)
+
+    def cancel(self):
+        """取消导出并删除未完成的文件"""
+        self.token.cancel()
+        self._queue.put(None)
+
+    def run(self):
+        try:
+            writer = open_export_writer(self.file_path, self.config)
+        except Exception as e:
+            self.done.emit(False, str(e), 0)
+            return
+
+        ok, message = True, self.file_path
+        try:
+            while not self.token.cancelled:
+                batch = self._queue.get()
+                if batch is None:
+                    break
+                for start in range(0, len(batch), self.chunk_rows):
+                    if self.token.cancelled:
+                        break
+                    chunk = batch[start:start + self.chunk_rows]
+                    rows = [row for row in map(export_row, chunk) if row is not None]
+                    writer.write_rows(rows)
+                    self.written += len(rows)
+                    self.consumed += len(chunk)
+                    if self.summary:
+                        self._summary_rows.extend(chunk)
+                    self.progress.emit(self.consumed, self.submitted)
+            if self.summary and not self.token.cancelled:
+                from ResultSummary import summary_tables
+                writer.write_summary(summary_tables(self._summary_rows))
+                self._summary_rows = []
+        except Exception as e:
+            ok, message = False, f"导出失败: {e}"
+        finally:
+            try:
+                writer.close()
+            except Exception as e:
+                if ok:
+                    ok, message = False, f"导出失败: {e}"
+
+        if self.token.cancelled:
+            ok, message = False, "导出已取消"
+        if not ok and not self.continuous:  # 持续导出保留已写入的部分
+            try:
+                os.remove(self.file_path)
+            except OSError:
+                pass
+        self.done.emit(ok, message, self.written)
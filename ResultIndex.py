@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+识别结果索引 - 在结果存储之上维护内存索引，筛选时不再逐行扫描
+发票号码用哈希索引；开票公司、项目名称按不同取值建 n-gram 索引（同名的行共用一个取值）；
+金额与日期用有序数组二分查找区间。新结果到达时增量加入，排序数组在查询时才合并。
+"""
+
+import re
+from bisect import bisect_left, bisect_right
+
+# 结果格式: [文件路径, 开票公司名称, 发票号码, 发票日期, 金额（价税合计）, 项目名称, 发票类型]
+SELLER_FIELD = 1
+NUMBER_FIELD = 2
+DATE_FIELD = 3
+AMOUNT_FIELD = 4
+ITEM_FIELD = 5
+
+_DATE_PATTERN = re.compile(r"(\d{4})\D?(\d{1,2})\D?(\d{1,2})")
+_AMOUNT_NOISE = re.compile(r"[¥￥,，元\s]")
+
+
+def _field(result, field):
+    if not isinstance(result, (list, tuple)) or field >= len(result) or not result[field]:
+        return ""
+    return str(result[field]).strip()
+
+
+def normalize_seller(value):
+    return value[3:] if value.startswith("名称：") else value
+
+
+def parse_amount(value):
+    """金额文本 -> float，无法解析时返回 None"""
+    if value is None or value == "":
+        return None
+    try:
+        return float(_AMOUNT_NOISE.sub("", str(value)))
+    except ValueError:
+        return None
+
+
+def parse_date(value):
+    """日期文本（YYYYMMDD / YYYY-MM-DD / YYYY年MM月DD日）-> 整数 YYYYMMDD，无法解析时返回 None"""
+    match = _DATE_PATTERN.search(str(value or ""))
+    if not match:
+        return None
+    year, month, day = (int(part) for part in match.groups())
+    if not (1 <= month <= 12 and 1 <= day <= 31):
+        return None
+    return year * 10000 + month * 100 + day
+
+
+def parse_date_bound(text, end=False):
+    """查询用日期边界：支持 YYYY、YYYY-MM、YYYY-MM-DD（及无分隔符写法），end=True 时补到该年/月末"""
+    digits = re.findall(r"\d+", text or "")
+    if len(digits) == 1 and len(digits[0]) in (6, 8):
+        value = digits[0]
+        digits = [value[:4], value[4:6]] + ([value[6:8]] if len(value) == 8 else [])
+    if not digits or len(digits[0]) != 4:
+        return None
+    year = int(digits[0])
+    month = int(digits[1]) if len(digits) > 1 else (12 if end else 1)
+    day = int(digits[2]) if len(digits) > 2 else (31 if end else 1)
+    return year * 10000 + month * 100 + day
+
+
+def _grams(text, size):
+    return {text[i:i + size] for i in range(len(text) - size + 1)}
+
+
+class _TextIndex:
+    """按不同取值建立的 n-gram 索引：子串查询先找到匹配的取值，再合并这些取值的行"""
+
+    GRAM = 2
+
+    def __init__(self):
+        self.rows = {}    # 取值 -> [结果下标]
+        self.grams = {}   # 单字/双字 -> {取值}
+
+    def add(self, value, store_index):
+        rows = self.rows.get(value)
+        if rows is None:
+            rows = self.rows[value] = []
+            for size in (1, self.GRAM):
+                for gram in _grams(value, size):
+                    self.grams.setdefault(gram, set()).add(value)
+        rows.append(store_index)
+
+    def values_containing(self, text):
+        """包含 text 的所有取值"""
+        size = 1 if len(text) < self.GRAM else self.GRAM
+        candidates = None
+        for gram in sorted(_grams(text, size), key=lambda g: len(self.grams.get(g, ()))):
+            values = self.grams.get(gram)
+            if not values:
+                return set()
+            candidates = set(values) if candidates is None else candidates & values
+            if not candidates:
+                return set()
+        # n-gram 只保证片段都出现，仍需确认是连续子串
+        return {value for value in candidates or () if text in value}
+
+    def search(self, text):
+        matched = set()
+        for value in self.values_containing(text):
+            matched.update(self.rows[value])
+        return matched
+
+
+class _SortedIndex:
+    """有序数组：新值先追加到待合并区，查询时一次排序（已有序部分 timsort 近似线性）"""
+
+    def __init__(self):
+        self.keys = []
+        self.rows = []
+        self._pending = []
+
+    def add(self, key, store_index):
+        self._pending.append((key, store_index))
+
+    def _merge(self):
+        if not self._pending:
+            return
+        keys = self.keys + [key for key, _ in self._pending]
+        rows = self.rows + [row for _, row in self._pending]
+        self._pending = []
+        # 按键对下标排序（稳定排序，已有序的前段只需线性比较）
+        order = sorted(range(len(keys)), key=keys.__getitem__)
+        self.keys = [keys[i] for i in order]
+        self.rows = [rows[i] for i in order]
+
+    def range(self, low=None, high=None):
+        """low <= key <= high 的结果下标"""
+        self._merge()
+        start = 0 if low is None else bisect_left(self.keys, low)
+        stop = len(self.keys) if high is None else bisect_right(self.keys, high)
+        return set(self.rows[start:stop])
+
+
+class ResultQuery:
+    """筛选条件；各条件之间为“且”"""
+
+    def __init__(self, number="", seller="", item="", min_amount=None, max_amount=None,
+                 date_from=None, date_to=None):
+        self.number = (number or "").strip()
+        self.seller = (seller or "").strip()
+        self.item = (item or "").strip()
+        self.min_amount = min_amount
+        self.max_amount = max_amount
+        self.date_from = date_from
+        self.date_to = date_to
+
+    @property
+    def is_empty(self):
+        return not (self.number or self.seller or self.item) and all(
+            bound is None for bound in (self.min_amount, self.max_amount, self.date_from, self.date_to))
+
+    def matches(self, result):
+        """逐行判断（用于查询之后新到达的结果）"""
+        if self.number and _field(result, NUMBER_FIELD) != self.number:
+            return False
+        if self.seller and self.seller not in normalize_seller(_field(result, SELLER_FIELD)):
+            return False
+        if self.item and self.item not in _field(result, ITEM_FIELD):
+            return False
+        if self.min_amount is not None or self.max_amount is not None:
+            amount = parse_amount(_field(result, AMOUNT_FIELD))
+            if amount is None or not _within(amount, self.min_amount, self.max_amount):
+                return False
+        if self.date_from is not None or self.date_to is not None:
+            date = parse_date(_field(result, DATE_FIELD))
+            if date is None or not _within(date, self.date_from, self.date_to):
+                return False
+        return True
+
+
+def _within(value, low, high):
+    return (low is None or value >= low) and (high is None or value <= high)
+
+
+class ResultIndex:
+    """结果存储的内存索引（与 InvoiceResultModel 共享同一结果列表，按下标引用）"""
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self.count = 0
+        self._numbers = {}               # 发票号码 -> [结果下标]
+        self._sellers = _TextIndex()
+        self._items = _TextIndex()
+        self._amounts = _SortedIndex()
+        self._dates = _SortedIndex()
+
+    def add_rows(self, rows, start=None):
+        """索引新追加的结果，start 为第一行在结果存储中的下标（默认接在已索引的行之后）"""
+        index = self.count if start is None else start
+        for result in rows:
+            number = _field(result, NUMBER_FIELD)
+            if number:
+                self._numbers.setdefault(number, []).append(index)
+            seller = normalize_seller(_field(result, SELLER_FIELD))
+            if seller:
+                self._sellers.add(seller, index)
+            item = _field(result, ITEM_FIELD)
+            if item:
+                self._items.add(item, index)
+            amount = parse_amount(_field(result, AMOUNT_FIELD))
+            if amount is not None:
+                self._amounts.add(amount, index)
+            date = parse_date(_field(result, DATE_FIELD))
+            if date is not None:
+                self._dates.add(date, index)
+            index += 1
+        self.count = max(self.count, index)
+
+    def search(self, query):
+        """返回满足条件的结果下标集合；空条件返回 None（表示全部）"""
+        if query.is_empty:
+            return None
+        lookups = []
+        if query.number:
+            lookups.append(lambda: set(self._numbers.get(query.number, ())))
+        if query.seller:
+            lookups.append(lambda: self._sellers.search(query.seller))
+        if query.item:
+            lookups.append(lambda: self._items.search(query.item))
+        if query.min_amount is not None or query.max_amount is not None:
+            lookups.append(lambda: self._amounts.range(query.min_amount, query.max_amount))
+        if query.date_from is not None or query.date_to is not None:
+            lookups.append(lambda: self._dates.range(query.date_from, query.date_to))
+
+        matched = None
+        for lookup in lookups:  # 号码、文本条件通常最具选择性，先算
+            found = lookup()
+            matched = found if matched is None else matched & found
+            if not matched:
+                return set()
+        return matched
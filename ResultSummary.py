@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+识别结果汇总 - 用 pandas 向量化分组统计生成汇总表
+按开票公司、开票月份、项目名称、发票类型统计张数与金额合计，并列出重复的发票号码；
+十万行结果在一秒内完成，由导出线程调用（pandas 在此时才导入）。
+"""
+
+# 结果格式: [文件路径, 开票公司名称, 发票号码, 发票日期, 金额（价税合计）, 项目名称, 发票类型]
+RESULT_FIELDS = ["文件路径", "开票公司名称", "发票号码", "发票日期", "金额（价税合计）", "项目名称", "发票类型"]
+
+# 汇总表名称（Excel 工作表名 / CSV、Parquet 文件名后缀）
+SUMMARY_BY_SELLER = "按开票公司汇总"
+SUMMARY_BY_MONTH = "按月份汇总"
+SUMMARY_BY_ITEM = "按项目汇总"
+SUMMARY_BY_TYPE = "按发票类型汇总"
+SUMMARY_DUPLICATES = "重复发票号码"
+
+_AMOUNT_NOISE = r"[¥￥,，元\s]"
+_MONTH_PATTERN = r"(\d{4})\s*[年\-/.]\s*(\d{1,2})"
+
+
+def _map_unique(series, func):
+    """对去重后的取值做一次字符串解析再映射回各行（日期、金额重复度高，比逐行解析快得多）"""
+    import pandas as pd  # 延迟导入
+    codes, uniques = pd.factorize(series)
+    parsed = func(pd.Series(uniques, dtype=object))
+    return parsed.iloc[codes].reset_index(drop=True).set_axis(series.index)
+
+
+def _parse_amounts(values):
+    import pandas as pd  # 延迟导入
+    return pd.to_numeric(values.str.replace(_AMOUNT_NOISE, "", regex=True), errors="coerce")
+
+
+def _parse_months(values):
+    parts = values.str.extract(_MONTH_PATTERN)
+    return (parts[0] + "-" + parts[1].str.zfill(2)).fillna("")
+
+
+def build_result_frame(rows):
+    """结果行 -> DataFrame（兼容5字段旧格式，清理"名称："前缀，解析金额与月份）"""
+    import pandas as pd  # 延迟导入
+
+    rows = [row for row in rows if isinstance(row, (list, tuple)) and len(row) >= 5]
+    # 旧格式缺少的项目名称、发票类型列补为空
+    frame = pd.DataFrame(rows).reindex(columns=range(len(RESULT_FIELDS)))
+    frame.columns = RESULT_FIELDS
+    frame = frame.fillna("").astype(str)
+    frame["开票公司名称"] = _map_unique(frame["开票公司名称"], lambda v: v.str.replace(r"^名称：", "", regex=True))
+    frame["金额"] = _map_unique(frame["金额（价税合计）"], _parse_amounts).astype(float)
+    frame["月份"] = _map_unique(frame["发票日期"], _parse_months)
+    return frame
+
+
+def _group_totals(frame, key):
+    """按 key 分组统计张数、金额合计（空值归为"(未识别)"），按金额合计降序"""
+    keys = frame[key].where(frame[key] != "", "(未识别)")
+    grouped = frame.groupby(keys, sort=False)["金额"].agg(["size", "count", "sum"])
+    grouped.columns = ["张数", "有金额张数", "金额合计"]
+    grouped["金额合计"] = grouped["金额合计"].round(2)
+    grouped.index.name = key
+    return grouped.sort_values(["金额合计", "张数"], ascending=False).reset_index()
+
+
+def summary_tables(rows):
+    """生成汇总表 {表名: DataFrame}"""
+    frame = build_result_frame(rows)
+
+    # 月份按时间顺序，未识别的排在最后
+    by_month = _group_totals(frame, "月份")
+    by_month = by_month.sort_values("月份", key=lambda months: months.replace("(未识别)", "~"),
+                                    kind="stable").reset_index(drop=True)
+
+    numbers = frame["发票号码"]
+    duplicated = frame[(numbers != "") & numbers.duplicated(keep=False)]
+    duplicates = duplicated[["发票号码", "开票公司名称", "发票日期", "金额（价税合计）", "项目名称", "文件路径"]]
+    duplicates = duplicates.assign(重复次数=duplicated.groupby("发票号码")["发票号码"].transform("size"))
+    duplicates = duplicates.sort_values("发票号码", kind="stable").reset_index(drop=True)
+
+    return {
+        SUMMARY_BY_SELLER: _group_totals(frame, "开票公司名称"),
+        SUMMARY_BY_MONTH: by_month,
+        SUMMARY_BY_ITEM: _group_totals(frame, "项目名称"),
+        SUMMARY_BY_TYPE: _group_totals(frame, "发票类型"),
+        SUMMARY_DUPLICATES: duplicates,
+    }
@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+识别结果表格模型 - 基于 QAbstractTableModel 的虚拟化结果表
+数据直接取自结果存储（主窗口的 accumulated_results），视图只按需读取可见单元格；
+新结果只插入新增行，排序与筛选在模型内对行下标操作，十万行以上仍保持流畅。
+"""
+
+from bisect import bisect_right
+
+from PyQt5.QtCore import Qt, QAbstractTableModel, QModelIndex, QVariant
+from PyQt5.QtGui import QColor
+
+from FieldExtractor import FIELD_INDEX
+from ResultIndex import ResultIndex
+
+# 表格列：(表头, 结果列表中的字段下标)
+# 结果格式: [文件路径, 开票公司名称, 发票号码, 发票日期, 金额（价税合计）, 项目名称, 发票类型]
+RESULT_COLUMNS = [
+    ("开票公司名称", 1),
+    ("发票号码", 2),
+    ("发票日期", 3),
+    ("项目名称", 5),
+    ("金额（价税合计）", 4),
+    ("发票类型", 6),
+]
+AMOUNT_FIELD = 4
+FIELD_NAMES = {index: name for name, index in FIELD_INDEX.items()}  # 字段下标 -> 置信度中的字段名称
+LOW_CONFIDENCE_COLOR = QColor(255, 243, 205)
+
+
+def format_result_field(result, field):
+    """结果字段转显示文本（兼容5字段旧格式，清理开票公司名称的"名称："前缀）"""
+    if not isinstance(result, (list, tuple)) or len(result) < 5 or field >= len(result):
+        return ""
+    value = result[field]
+    text = str(value) if value else ""
+    if field == 1 and text.startswith("名称："):
+        text = text[3:]  # 去掉"名称："前缀
+    return text
+
+
+def _sort_key(result, field):
+    """排序键：金额按数值排序，其余按文本排序"""
+    if field == AMOUNT_FIELD:
+        try:
+            return (0, float(result[field]))
+        except (TypeError, ValueError, IndexError):
+            return (1, 0.0)  # 无金额排在最后
+    return format_result_field(result, field)
+
+
+def _insert_position(keys, key, descending=False):
+    """在已排序的键列表中二分查找插入位置（相同键插在末尾，保持稳定）"""
+    if not descending:
+        return bisect_right(keys, key)
+    low, high = 0, len(keys)
+    while low < high:
+        mid = (low + high) // 2
+        if key > keys[mid]:
+            high = mid
+        else:
+            low = mid + 1
+    return low
+
+
+class InvoiceResultModel(QAbstractTableModel):
+    """发票识别结果表格模型"""
+
+    def __init__(self, rows=None, parent=None):
+        super().__init__(parent)
+        self._rows = rows if rows is not None else []   # 结果存储（与主窗口共享同一列表）
+        self._view = list(range(len(self._rows)))      # 可见行 -> 结果存储下标
+        self._view_keys = None                          # 排序时与 _view 对应的排序键
+        self._sort_column = None
+        self._sort_order = Qt.AscendingOrder
+        self._filter = None                             # 行筛选函数 result -> bool
+        self.result_index = ResultIndex()               # 筛选用的内存索引
+        self.result_index.add_rows(self._rows)
+        self._confidence = {}                           # 图片路径 -> {字段名称: 置信度}
+        self.confidence_threshold = None                # 低于该值的非空单元格以底色标出（None 不标）
+
+    # ---------- Qt 模型接口 ----------
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._view)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(RESULT_COLUMNS)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return QVariant()
+        result = self._rows[self._view[index.row()]]
+        field = RESULT_COLUMNS[index.column()][1]
+        if role == Qt.DisplayRole:
+            return format_result_field(result, field)
+        if role == Qt.ToolTipRole and result:
+            confidence = self._field_confidence(result, field)
+            tip = f"识别置信度: {confidence:.2f}" if confidence is not None else ""
+            if index.column() == 0:
+                return "\n".join(filter(None, [str(result[0]), tip]))  # 工具提示显示完整路径
+            return tip or QVariant()
+        if role == Qt.BackgroundRole and self.confidence_threshold is not None:
+            confidence = self._field_confidence(result, field)
+            if (confidence is not None and confidence < self.confidence_threshold
+                    and format_result_field(result, field)):
+                return LOW_CONFIDENCE_COLOR
+        if role == Qt.TextAlignmentRole and field == AMOUNT_FIELD:
+            return int(Qt.AlignRight | Qt.AlignVCenter)
+        return QVariant()
+
+    def _field_confidence(self, result, field):
+        confidences = self._confidence.get(result[0]) if self._confidence else None
+        return confidences.get(FIELD_NAMES.get(field)) if confidences else None
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return RESULT_COLUMNS[section][0]
+        return QVariant()
+
+    def sort(self, column, order=Qt.AscendingOrder):
+        """按列排序（只重排行下标，不复制数据）"""
+        self.layoutAboutToBeChanged.emit()
+        persistent = self.persistentIndexList()
+        tracked = [self._view[index.row()] for index in persistent]
+        self._sort_column = column if column >= 0 else None
+        self._sort_order = order
+        if self._sort_column is None:
+            self._view.sort()  # 恢复识别顺序
+        self._apply_sort()
+        if persistent:
+            # 选中行等持久索引跟随数据移动
+            positions = {store_index: row for row, store_index in enumerate(self._view)}
+            self.changePersistentIndexList(
+                persistent,
+                [self.index(positions[store_index], index.column())
+                 for index, store_index in zip(persistent, tracked)])
+        self.layoutChanged.emit()
+
+    # ---------- 结果存储操作 ----------
+
+    @property
+    def rows(self):
+        return self._rows
+
+    def result_at(self, row):
+        """可见行对应的原始结果"""
+        return self._rows[self._view[row]]
+
+    def add_field_confidence(self, confidences):
+        """记录字段置信度 {图片路径: {字段名称: 置信度}}（在追加对应结果行之前调用）"""
+        if confidences:
+            self._confidence.update(confidences)
+
+    def append_rows(self, results):
+        """追加结果，只插入新增的行"""
+        results = list(results)
+        if not results:
+            return
+        start = len(self._rows)
+        self._rows.extend(results)
+        self.result_index.add_rows(results, start)
+        new_indices = range(start, len(self._rows))
+        if self._filter is not None:
+            new_indices = [i for i in new_indices if self._filter(self._rows[i])]
+        else:
+            new_indices = list(new_indices)
+        if not new_indices:
+            return
+
+        if self._view_keys is None:
+            first = len(self._view)
+            self.beginInsertRows(QModelIndex(), first, first + len(new_indices) - 1)
+            self._view.extend(new_indices)
+            self.endInsertRows()
+            return
+
+        # 已排序：二分查找插入位置，保持顺序
+        field = RESULT_COLUMNS[self._sort_column][1]
+        descending = self._sort_order == Qt.DescendingOrder
+        for store_index in new_indices:
+            key = _sort_key(self._rows[store_index], field)
+            position = _insert_position(self._view_keys, key, descending)
+            self.beginInsertRows(QModelIndex(), position, position)
+            self._view.insert(position, store_index)
+            self._view_keys.insert(position, key)
+            self.endInsertRows()
+
+    def clear(self):
+        """清空结果存储"""
+        self.beginResetModel()
+        self._rows.clear()
+        self.result_index.clear()
+        self._confidence.clear()
+        self._view = []
+        self._view_keys = [] if self._sort_column is not None else None
+        self.endResetModel()
+
+    def set_filter(self, predicate, indices=None):
+        """设置行筛选函数（None 表示显示全部）
+        indices: 已由索引查出的匹配下标（可选），提供时不再逐行判断；之后新增的行仍用 predicate 判断
+        """
+        self.beginResetModel()
+        self._filter = predicate
+        if predicate is None:
+            self._view = list(range(len(self._rows)))
+        elif indices is not None:
+            self._view = sorted(indices)
+        else:
+            self._view = [i for i, result in enumerate(self._rows) if predicate(result)]
+        self._apply_sort()
+        self.endResetModel()
+
+    def set_filter_text(self, text):
+        """按关键字筛选（任一列包含关键字即显示）"""
+        text = (text or "").strip()
+        if not text:
+            self.set_filter(None)
+            return
+        fields = [field for _, field in RESULT_COLUMNS]
+        self.set_filter(lambda result: any(text in format_result_field(result, f) for f in fields))
+
+    def apply_query(self, query):
+        """按 ResultQuery 筛选（通过索引查找，不扫描结果存储）"""
+        if query is None or query.is_empty:
+            self.set_filter(None)
+        else:
+            self.set_filter(query.matches, self.result_index.search(query))
+
+    def _apply_sort(self):
+        if self._sort_column is None:
+            self._view_keys = None
+            return
+        field = RESULT_COLUMNS[self._sort_column][1]
+        keyed = sorted(((_sort_key(self._rows[i], field), i) for i in self._view),
+                       key=lambda item: item[0],
+                       reverse=self._sort_order == Qt.DescendingOrder)
+        self._view = [i for _, i in keyed]
+        self._view_keys = [key for key, _ in keyed]
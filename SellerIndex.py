@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+已知销售方名录 - 把识别出的开票公司名称校正为名录中最接近的名称
+名录从 CSV / XLSX 读取（可选，offline_config.json 的 "sellers" 节 file）；按二元组（相邻两字）建倒排索引。
+每处编辑最多破坏查询串的 2 个二元组，编辑距离不超过 d 的名称至少含查询串 |G|-2d 个不同的二元组：
+查询时用倒排表一次计数（numpy.bincount）筛出候选，按相同二元组数从多到少用位并行算法计算编辑距离，
+剩余候选的距离下界已超过当前最优时停止。完全相同的名称直接查哈希表（约 1 微秒），
+十万条名录的近似查询为数十至数百微秒。
+
+用法：
+  python SellerIndex.py <名录文件> <名称> [<名称> ...]   # 输出每个名称的校正结果与耗时
+"""
+
+import re
+import csv
+import sys
+import time
+import threading
+from pathlib import Path
+
+import numpy as np
+
+from resource_utils import load_config_section
+from StructuredLog import get_logger
+
+log = get_logger("SellerIndex")
+
+# 名录默认参数（可在 offline_config.json 的 "sellers" 节覆盖）
+DEFAULT_SELLER_CONFIG = {
+    "file": "",               # 名录文件（.csv / .xlsx），为空时不校正
+    "max_distance": 2,        # 允许的最大编辑距离（错字、漏字、多字各算 1）
+    "min_similarity": 0.8,    # 相似度 = 1 - 编辑距离 / 较长名称的字数，低于该值不校正
+}
+
+# 名录中表示名称列的表头（找不到时取第一列）
+NAME_COLUMNS = ("开票公司名称", "开票公司", "销售方名称", "销售方", "供应商名称", "供应商", "公司名称", "名称")
+
+_LABEL_PREFIX = re.compile(r'^(?:销售方|开票方|销售|收款)?(?:名称|单位)?[：:]')
+_IGNORED_CHARS = re.compile(r'[\s·•.,，。、"“”\'‘’]')
+_FULL_WIDTH = str.maketrans("（）", "()")
+
+
+def normalize_name(value):
+    """比较用的名称：去掉“名称：”等标签前缀、空白与标点，全角括号转半角"""
+    text = _LABEL_PREFIX.sub("", str(value or "").strip())
+    return _IGNORED_CHARS.sub("", text).translate(_FULL_WIDTH)
+
+
+_EMPTY = np.zeros(0, dtype=np.int32)
+
+
+def _bigrams(key):
+    return [key[i:i + 2] for i in range(len(key) - 1)]
+
+
+def edit_distance(pattern, text, peq=None):
+    """Levenshtein 编辑距离（Myers/Hyyrö 位并行算法，每个字符 O(1) 次整数运算）
+    peq: pattern 中各字符出现位置的位掩码（同一 pattern 多次比较时可预先计算）
+    """
+    m = len(pattern)
+    if not m:
+        return len(text)
+    if peq is None:
+        peq = _pattern_masks(pattern)
+    mask = (1 << m) - 1
+    high = 1 << (m - 1)
+    pv, mv, score = mask, 0, m
+    for char in text:
+        eq = peq.get(char, 0)
+        xv = eq | mv
+        xh = (((eq & pv) + pv) ^ pv) | eq
+        ph = mv | ~(xh | pv)
+        mh = pv & xh
+        if ph & high:
+            score += 1
+        elif mh & high:
+            score -= 1
+        ph = (ph << 1) | 1
+        pv = ((mh << 1) | ~(xv | ph)) & mask
+        mv = ph & xv & mask
+    return score
+
+
+def _pattern_masks(pattern):
+    peq = {}
+    for position, char in enumerate(pattern):
+        peq[char] = peq.get(char, 0) | (1 << position)
+    return peq
+
+
+class SellerIndex:
+    """销售方名录的近似查找索引（创建后只读，可在多个线程间共享）"""
+
+    def __init__(self, names, max_distance=2, min_similarity=0.8):
+        self.max_distance = max(0, int(max_distance))
+        self.min_similarity = min(1.0, max(0.01, float(min_similarity)))
+        entries = {}
+        for name in names:
+            name = str(name or "").strip()
+            key = normalize_name(name)
+            if len(key) >= 2:
+                entries.setdefault(key, name)
+        # 按名称长度编号：长度相近的名称下标连续，长度筛选只需在倒排表上二分取一段
+        keys = sorted(entries, key=len)
+        self.keys = keys                                      # 比较用的名称
+        self.names = [entries[key] for key in keys]           # 名录中的原始名称
+        self.exact = {key: number for number, key in enumerate(keys)}
+        lengths = np.asarray([len(key) for key in keys], dtype=np.int64)
+        self._length_starts = np.searchsorted(lengths, np.arange(int(lengths.max(initial=0)) + 2))  # 长度 -> 首个下标
+        postings = {}
+        for number, key in enumerate(keys):
+            for gram in set(_bigrams(key)):
+                postings.setdefault(gram, []).append(number)
+        self.postings = {gram: np.asarray(numbers, dtype=np.int32) for gram, numbers in postings.items()}  # 二元组 -> 下标
+
+    def __len__(self):
+        return len(self.keys)
+
+    def distance_limit(self, length):
+        """长度为 length 的名称允许的最大编辑距离（相似度阈值对短名称更严格）"""
+        similarity = self.min_similarity
+        # 1 - d / max(length, length + d) >= similarity  =>  d <= (1 - similarity) * length / similarity
+        return min(self.max_distance, int((1.0 - similarity) * length / similarity + 1e-9))
+
+    def lookup(self, value):
+        """最接近的名录名称，返回 (名称, 相似度)；没有满足阈值的名称时返回 None"""
+        key = normalize_name(value)
+        if len(key) < 2:
+            return None
+        number = self.exact.get(key)
+        if number is not None:
+            return self.names[number], 1.0
+        length = len(key)
+        limit = self.distance_limit(length)
+        grams = set(_bigrams(key))
+        if not limit:
+            return None
+        lists = sorted((self.postings.get(gram, _EMPTY) for gram in grams), key=len)  # 名录中没有的二元组为空表
+
+        # 二元组计数筛选：至少 required 个相同二元组的名称必出现在最短的 len(grams) - required + 1 个倒排表中，
+        # 先取这些倒排表的并集作为候选，其余倒排表只对候选二分查找计数
+        required = max(1, len(grams) - 2 * limit)  # 名称过短时计数无法筛选，只要求至少有一个相同的二元组
+        prefix = len(grams) - required + 1
+        candidates = np.concatenate(lists[:prefix])
+        # 长度相差超过 limit 的名称不可能满足，其下标在按长度编号的范围之外
+        starts = self._length_starts
+        low = starts[min(max(length - limit, 0), len(starts) - 1)]
+        high = starts[min(length + limit + 1, len(starts) - 1)]
+        candidates, counts = np.unique(candidates[(candidates >= low) & (candidates < high)], return_counts=True)
+        for numbers in lists[prefix:]:
+            if not len(candidates):
+                break
+            positions = np.minimum(numbers.searchsorted(candidates), len(numbers) - 1)
+            counts += numbers[positions] == candidates
+        kept = counts >= required
+        if not kept.any():
+            return None
+        order = np.argsort(-counts[kept], kind="stable")
+        candidates, counts = candidates[kept][order], counts[kept][order]
+
+        peq = _pattern_masks(key)
+        best, best_distance = None, limit + 1
+        for number, shared in zip(candidates.tolist(), counts.tolist()):
+            if (len(grams) - shared) / 2 >= best_distance:
+                break  # 剩余候选的相同二元组更少，距离不可能更小（距离相同时取先找到的）
+            other = self.keys[number]
+            distance = edit_distance(key, other, peq)
+            if distance < best_distance:
+                best, best_distance = (number, 1.0 - distance / max(length, len(other))), distance
+        if best is None or best[1] < self.min_similarity:
+            return None
+        return self.names[best[0]], round(best[1], 4)
+
+    def find_in_lines(self, lines):
+        """在文本行中找最接近名录名称的一行，返回 (名称, 相似度, 行下标)；都不满足阈值时返回 None"""
+        best = None
+        for line, text in enumerate(lines):
+            match = self.lookup(text)
+            if match is not None and (best is None or match[1] > best[1]):
+                best = (match[0], match[1], line)
+                if match[1] == 1.0:
+                    break
+        return best
+
+
+def read_seller_names(path):
+    """读取名录文件中的名称列（.xlsx 需要 openpyxl；CSV 依次尝试 UTF-8 与 GBK 编码）"""
+    path = Path(path)
+    if path.suffix.lower() in (".xlsx", ".xlsm"):
+        from openpyxl import load_workbook  # 延迟导入
+        workbook = load_workbook(path, read_only=True, data_only=True)
+        try:
+            rows = [list(row) for row in workbook.worksheets[0].iter_rows(values_only=True)]
+        finally:
+            workbook.close()
+    else:
+        rows = None
+        for encoding in ("utf-8-sig", "gbk"):
+            try:
+                with open(path, "r", encoding=encoding, newline="") as f:
+                    rows = list(csv.reader(f))
+                break
+            except UnicodeDecodeError:
+                continue
+        if rows is None:
+            raise ValueError(f"无法识别名录文件编码: {path}")
+    if not rows:
+        return []
+
+    header = [str(cell or "").strip() for cell in rows[0]]
+    column = next((header.index(name) for name in NAME_COLUMNS if name in header), None)
+    if column is None:
+        column = 0  # 没有可识别的表头：取第一列，第一行也是名称
+    else:
+        rows = rows[1:]
+    return [str(row[column]).strip() for row in rows if len(row) > column and row[column] not in (None, "")]
+
+
+def load_seller_config():
+    """读取名录配置"""
+    return load_config_section("sellers", DEFAULT_SELLER_CONFIG)
+
+
+def create_seller_index(config=None):
+    """按配置读取名录并建索引；未配置名录文件时返回 None"""
+    config = config or load_seller_config()
+    if not config.get("file"):
+        return None
+    started = time.perf_counter()
+    index = SellerIndex(read_seller_names(config["file"]), config.get("max_distance", 2),
+                        config.get("min_similarity", 0.8))
+    log.info("已加载销售方名录: %d 个名称，耗时 %.2f 秒", len(index), time.perf_counter() - started)
+    return index
+
+
+_shared_index = None
+_shared_index_lock = threading.Lock()
+
+
+def get_seller_index():
+    """按配置返回共享的名录索引；未配置或读取失败时返回 None（只尝试一次）"""
+    global _shared_index
+    with _shared_index_lock:
+        if _shared_index is None:
+            try:
+                _shared_index = create_seller_index() or False
+            except Exception as e:
+                log.warning("销售方名录读取失败，不校正开票公司名称: %s", e)
+                _shared_index = False
+        return _shared_index or None
+
+
+def correct_seller(value, lines=()):
+    """开票公司名称校正为名录名称，返回 (名称, 相似度)；未配置名录或找不到时返回 None
+    提取值不在名录中时（常见于宽松规则取到了购买方），在页面各文本行中找已知的销售方
+    """
+    index = get_seller_index()
+    if index is None:
+        return None
+    match = index.lookup(value) if value else None
+    if match is None and lines:
+        found = index.find_in_lines(lines)
+        if found is not None:
+            match = found[:2]
+    return match
+
+
+def main(argv=None):
+    argv = list(sys.argv[1:] if argv is None else argv)
+    if len(argv) < 2:
+        print(__doc__)
+        return 1
+    config = load_seller_config()
+    config["file"] = argv[0]
+    index = create_seller_index(config)
+    for value in argv[1:]:
+        started = time.perf_counter()
+        match = index.lookup(value)
+        elapsed = (time.perf_counter() - started) * 1e6
+        print(f"{value} -> {match[0] if match else '(无匹配)'}"
+              f"{f'  相似度 {match[1]:.2f}' if match else ''}  {elapsed:.0f} µs")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
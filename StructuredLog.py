@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+结构化日志 - 替代识别与字段提取热路径中的 print：分级别、按模块开关、延迟格式化，可另写 JSON 行日志
+各模块用 get_logger("模块名") 取日志器，消息用 % 参数（log.debug("文本: %s", text)），
+只有该级别启用时才格式化；参数本身构造开销大的调试输出先判断 log.isEnabledFor(logging.DEBUG)。
+关闭的级别只做一次整数比较，不格式化、不写控制台。
+
+配置在 offline_config.json 的 "logging" 节（与日志视图的 "log" 节分开，两者的滚动参数互不影响）：
+  level        全局级别（默认 INFO；逐页的处理过程为 DEBUG）
+  modules      按模块的级别，如 {"FieldExtractor": "DEBUG", "MainAction": "WARNING"}
+  console      是否输出到控制台（默认 true，只输出消息本身，与原 print 相同）
+  json_file    JSON 行日志文件（为空不写），每行 {"time", "level", "module", "message", 附加字段}；
+               按 max_bytes / backup_count 滚动。附加字段用 extra 传入：log.info("...", extra={"page": path})
+"""
+
+import sys
+import json
+import logging
+import threading
+from datetime import datetime
+from logging.handlers import RotatingFileHandler
+from pathlib import Path
+
+# 结构化日志默认参数（可在 offline_config.json 的 "logging" 节覆盖）
+DEFAULT_LOGGING_CONFIG = {
+    "level": "INFO",
+    "modules": {},
+    "console": True,
+    "json_file": "",
+    "max_bytes": 5 * 1024 * 1024,
+    "backup_count": 5,
+}
+
+# 所有模块日志器的上级（与日志视图的 InvoiceVision.* 文件日志器分开）
+ROOT_LOGGER = "invoice"
+
+# LogRecord 自带的属性；其余属性为 extra 传入的附加字段
+_RECORD_ATTRIBUTES = set(logging.makeLogRecord({}).__dict__) | {"message", "asctime"}
+
+_configured = False
+_configure_lock = threading.Lock()
+
+
+def load_logging_config():
+    """读取结构化日志配置"""
+    from resource_utils import load_config_section  # 延迟导入（resource_utils 导入本模块）
+    return load_config_section("logging", DEFAULT_LOGGING_CONFIG)
+
+
+def _level(name, default=logging.INFO):
+    level = logging.getLevelName(str(name).upper())
+    return level if isinstance(level, int) else default
+
+
+class JsonFormatter(logging.Formatter):
+    """一条日志一行 JSON（时间、级别、模块、消息，以及 extra 传入的附加字段）"""
+
+    def format(self, record):
+        entry = {
+            "time": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "module": record.name.rpartition(".")[2],
+            "message": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRIBUTES:
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class _ConsoleHandler(logging.StreamHandler):
+    """输出到当前的 sys.stdout（与 print 相同：重定向后随之改变，打包的窗口程序没有控制台时不输出）"""
+
+    def __init__(self):
+        super().__init__(sys.stdout)
+
+    @property
+    def stream(self):
+        return sys.stdout
+
+    @stream.setter
+    def stream(self, value):
+        pass
+
+    def emit(self, record):
+        if sys.stdout is not None:
+            super().emit(record)
+
+
+def configure_logging(config=None):
+    """按配置设置级别与输出（重复调用时替换之前的设置）"""
+    global _configured
+    config = config or load_logging_config()
+    root = logging.getLogger(ROOT_LOGGER)
+    root.propagate = False
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+        handler.close()
+    root.setLevel(_level(config.get("level", "INFO")))
+    for module, level in (config.get("modules") or {}).items():
+        logging.getLogger(f"{ROOT_LOGGER}.{module}").setLevel(_level(level))
+
+    if config.get("console", True):
+        console = _ConsoleHandler()
+        console.setFormatter(logging.Formatter("%(message)s"))
+        root.addHandler(console)
+    if config.get("json_file"):
+        try:
+            path = Path(config["json_file"]).expanduser()
+            path.parent.mkdir(parents=True, exist_ok=True)
+            handler = RotatingFileHandler(path, maxBytes=int(config.get("max_bytes", 0)),
+                                          backupCount=int(config.get("backup_count", 0)),
+                                          encoding='utf-8', delay=True)
+            handler.setFormatter(JsonFormatter())
+            root.addHandler(handler)
+        except OSError as e:
+            print(f"JSON 日志文件不可用: {e}")
+    if not root.handlers:
+        root.addHandler(logging.NullHandler())
+    _configured = True
+
+
+def get_logger(module):
+    """模块的日志器（首次调用时按配置设置级别与输出）"""
+    if not _configured:
+        with _configure_lock:
+            if not _configured:
+                configure_logging()
+    return logging.getLogger(f"{ROOT_LOGGER}.{module}")
+
+
+def set_module_level(module, level):
+    """运行时调整某个模块的级别（如 "extract" 节 debug 打开字段提取的调试输出）"""
+    get_logger(module).setLevel(_level(level))
@@ -0,0 +1,402 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+字段提取微基准 - 对比原逐条 findall 实现与 FieldExtractor 的吞吐（条/秒），并逐条核对结果一致；
+--bulk 1 时另对比整列批量提取（BulkExtractor，需要 pandas）与逐页提取
+
+语料按常见票面生成：全电发票、增值税专用/普通发票（旧版）、收据类票据，以及少量无发票关键词的文本；
+文本格式与 OCRInvoice 拼接的【行1】【行2】…一致。原实现的打印输出重定向到空设备（模拟界面日志之外的开销）。
+
+用法：
+  python bench_extract.py [--count 2000] [--repeat 3] [--seed 7] [--engine re|re2|auto] [--profile 1] [--bulk 1]
+      --profile 1 时另输出每条规则的耗时与命中率
+"""
+
+import os
+import re
+import sys
+import time
+import random
+import contextlib
+
+from FieldExtractor import InvoiceFieldExtractor, load_regex_engine, profile_corpus
+
+SELLERS = ["深圳市腾飞科技有限公司", "北京京东世纪贸易有限公司", "上海盒马网络科技有限公司", "广州市白云区好味餐饮店",
+           "杭州西湖物业管理中心", "成都天府软件园集团", "武汉光谷建材厂", "南京市玄武区便民超市"]
+BUYERS = ["某某信息技术有限公司", "华南设计研究院", "个人"]
+ITEMS = [("体育用品", "Keep动感单车"), ("餐饮服务", "餐费"), ("信息技术服务", "软件服务费"),
+         ("办公用品", "A4打印纸"), ("运输服务", "客运服务费"), ("电子计算机", "笔记本电脑")]
+NOISE = ["统一社会信用代码/纳税人识别号：91440300MA5F{:05d}", "开户行及账号：招商银行{:08d}",
+         "规格型号", "单位", "数量", "单价", "税率/征收率", "税额", "备注", "复核：", "开票人：张{:d}"]
+
+
+def _noise(rng):
+    return rng.choice(NOISE).format(rng.randint(0, 99999))
+
+
+def _full_digital(rng, seller, amount, date):
+    """全电发票"""
+    item = rng.choice(ITEMS)
+    tax = round(amount * 0.13 / 1.13, 2)
+    lines = ["电子发票（普通发票）", f"发票号码：{rng.randint(10 ** 19, 10 ** 20 - 1)}",
+             f"开票日期：{date[0]}年{date[1]:02d}月{date[2]:02d}日", "购买方信息", f"名称：{rng.choice(BUYERS)}",
+             _noise(rng), "销售方信息", f"名称：{seller}", _noise(rng), "项目名称", "规格型号", "金额",
+             f"*{item[0]}*{item[1]}", f"{amount - tax:.2f}", "13%", f"{tax:.2f}", "合计",
+             f"¥{amount - tax:.2f}", f"¥{tax:.2f}", "价税合计（大写）", "壹仟圆整", f"（小写）¥{amount:.2f}",
+             _noise(rng), _noise(rng)]
+    return lines
+
+
+def _legacy_vat(rng, seller, amount, date):
+    """增值税专用/普通发票（旧版，带发票代码，OCR 常把标签与值拆成两行）"""
+    item = rng.choice(ITEMS)
+    number = f"{rng.randint(10 ** 7, 10 ** 8 - 1)}"
+    number_line = rng.choice([f"No {number}", f"发票号码：{number}", "发票号码：", number])
+    lines = [rng.choice(["增值税专用发票", "增值税普通发票", "增值税电子普通发票"]),
+             f"发票代码：0440019{rng.randint(10000, 99999)}", number_line,
+             number if number_line == "发票号码：" else _noise(rng),
+             f"开票日期：{date[0]}-{date[1]:02d}-{date[2]:02d}" if rng.random() < 0.5
+             else f"开票日期：{date[0]}年{date[1]}月{date[2]}日",
+             f"购买方名称：{rng.choice(BUYERS)}", _noise(rng), f"货物或应税劳务、服务名称：{item[1]}",
+             f"销售方名称：{seller}" if rng.random() < 0.7 else f"销售方：{seller}",
+             _noise(rng), f"价税合计：¥{amount:.2f}" if rng.random() < 0.6 else f"合计：¥{amount:.2f}",
+             _noise(rng)]
+    return lines
+
+
+def _receipt(rng, seller, amount, date):
+    """收据、定额票等非标准票据"""
+    lines = [rng.choice(["收款收据", "定额发票", "通用机打发票"]), f"收款单位：{seller}",
+             f"项目：{rng.choice(ITEMS)[1]}", f"实付金额：{amount:.2f}元" if rng.random() < 0.5
+             else f"总金额：￥{amount:.2f}", f"日期：{date[0]}年{date[1]}月{date[2]}日", _noise(rng)]
+    return lines
+
+
+def _unreadable(rng, seller, amount, date):
+    """倒置页面等识别效果差的文本（无发票关键词）"""
+    return [_noise(rng) for _ in range(rng.randint(3, 12))] + [f"{rng.randint(0, 99999)}", f"¥{amount:.2f}"]
+
+
+TEMPLATES = [(_full_digital, 0.5), (_legacy_vat, 0.3), (_receipt, 0.15), (_unreadable, 0.05)]
+
+
+def build_corpus(count, seed=7):
+    """生成 count 条OCR拼接文本"""
+    rng = random.Random(seed)
+    builders = [builder for builder, _ in TEMPLATES]
+    weights = [weight for _, weight in TEMPLATES]
+    corpus = []
+    for _ in range(count):
+        builder = rng.choices(builders, weights)[0]
+        date = (rng.randint(2019, 2025), rng.randint(1, 12), rng.randint(1, 28))
+        lines = builder(rng, rng.choice(SELLERS), round(rng.uniform(1, 20000), 2), date)
+        corpus.append('【' + '】【'.join(lines) + '】')
+    return corpus
+
+
+def legacy_extract_invoice_info(text, image_path):
+    """原实现（逐条 re.findall 并打印匹配过程），作为对照基线"""
+    company_name = ''
+    invoice_number = ''
+    invoice_date = ''
+    invoice_amount = ''
+    project_name = ''  # 新增项目名称字段
+    
+    print(f"提取信息的文本: {text}")
+    
+    try:
+        # 提取开票公司名称 - 更灵活的匹配方式
+        company_patterns = [
+            r'销售方名称[：:]\s*([^\n\r【】]{2,100}?)(?=\s*【|$)',
+            r'销售方[：:]\s*([^\n\r【】]{2,100}?)(?=\s*【|$)',
+            r'开票方名称[：:]\s*([^\n\r【】]{2,100}?)(?=\s*【|$)',
+            r'开票方[：:]\s*([^\n\r【】]{2,100}?)(?=\s*【|$)',
+            r'销售单位[：:]\s*([^\n\r【】]{2,100}?)(?=\s*【|$)',
+            r'收款单位[：:]\s*([^\n\r【】]{2,100}?)(?=\s*【|$)',
+        ]
+        
+        for pattern in company_patterns:
+            company_matches = re.findall(pattern, text)
+            if company_matches:
+                for match in company_matches:
+                    match = match.strip()
+                    # 清理可能的前缀
+                    match = re.sub(r'^[销售开票收款]方[名称单位]*[：:]', '', match).strip()
+                    # 更宽松的验证条件
+                    if (len(match) >= 2 and not match[0].isdigit() and 
+                        not any(word in match for word in ['发票', '号码', '日期', '金额', '项目'])):
+                        company_name = match
+                        print(f"提取到开票公司名称: {company_name}")
+                        break
+                if company_name:
+                    break
+        
+        # 如果上述模式未匹配到，尝试更宽松的模式
+        if not company_name:
+            # 尝试匹配包含"公司"、"厂"、"店"等关键词的文本
+            company_loose_pattern = r'([^\n\r【】]{1,50}(?:公司|厂|店|中心|集团|企业)[^\n\r【】]{0,30})'
+            company_loose_matches = re.findall(company_loose_pattern, text)
+            for match in company_loose_matches:
+                match = match.strip()
+                # 过滤掉明显不是公司名称的内容
+                if (len(match) >= 3 and not match[0].isdigit() and 
+                    not any(word in match for word in ['发票', '号码', '日期', '金额', '项目', '购买方', '买方'])):
+                    company_name = match
+                    print(f"通过宽松模式提取到开票公司名称: {company_name}")
+                    break
+    except Exception as e:
+        print(f"开票公司名称提取失败: {e}")
+    
+    # 最终清理开票公司名称中的"名称："前缀
+    if company_name and company_name.startswith("名称："):
+        company_name = company_name[3:].strip()  # 去掉"名称："前缀
+        print(f"清理前缀后的开票公司名称: {company_name}")
+    
+    try:
+        # 提取发票号码
+        number_patterns = [
+            r'发票号码[：:]】?【?([0-9]{6,20})',  # 处理【发票号码：】【数字】的格式
+            r'发票号码[：:]\s*([0-9]{6,20})',
+            r'发票号[：:]?\s*([0-9]{6,20})',
+            r'号码[：:]\s*([0-9]{6,20})',
+            r'No[：:.]?\s*([0-9]{6,20})',
+            r'【([0-9]{15,20})】',  # 直接匹配长数字（发票号码通常很长）
+        ]
+        
+        for pattern in number_patterns:
+            number_matches = re.findall(pattern, text)
+            if number_matches:
+                invoice_number = number_matches[0]
+                print(f"提取到发票号码: {invoice_number}")
+                break
+    except Exception as e:
+        print(f"发票号码提取失败: {e}")
+    
+    try:
+        # 提取发票日期 - 支持多种格式，修复日期错误提取金额的问题
+        date_patterns = [
+            r'发票日期[：:]\s*([0-9]{4})年([0-9]{1,2})月([0-9]{1,2})日',  # YYYY年MM月DD日
+            r'开票日期[：:]\s*([0-9]{4})年([0-9]{1,2})月([0-9]{1,2})日',  # 开票日期
+            r'日期[：:]\s*([0-9]{4})年([0-9]{1,2})月([0-9]{1,2})日',      # 日期
+            r'([0-9]{4})年([0-9]{1,2})月([0-9]{1,2})日',                 # 直接日期格式
+            r'发票日期[：:]\s*([0-9]{4})[.-]([0-9]{1,2})[.-]([0-9]{1,2})', # YYYY-MM-DD或YYYY.MM.DD
+            r'开票日期[：:]\s*([0-9]{4})[.-]([0-9]{1,2})[.-]([0-9]{1,2})', # 开票日期YYYY-MM-DD
+            r'([0-9]{4})[.-]([0-9]{1,2})[.-]([0-9]{1,2})',               # 直接YYYY-MM-DD格式
+        ]
+        
+        for pattern in date_patterns:
+            date_matches = re.findall(pattern, text)
+            if date_matches:
+                match = date_matches[0]
+                if isinstance(match, tuple) and len(match) >= 3:
+                    year, month, day = match[0], match[1], match[2]
+                else:
+                    # 如果是字符串格式，尝试分割
+                    date_str = match if isinstance(match, str) else str(match)
+                    parts = re.split(r'[-年月日.]', date_str)
+                    if len(parts) >= 3:
+                        year, month, day = parts[0], parts[1], parts[2]
+                    else:
+                        continue
+                
+                # 确保是有效的日期格式
+                try:
+                    year, month, day = int(year), int(month), int(day)
+                    if 2000 <= year <= 2030 and 1 <= month <= 12 and 1 <= day <= 31:
+                        invoice_date = f"{year}{month:02d}{day:02d}"
+                        print(f"提取到发票日期: {invoice_date}")
+                        break
+                except (ValueError, TypeError):
+                    continue
+    except Exception as e:
+        print(f"发票日期提取失败: {e}")
+    
+    try:
+        # 提取发票金额 - 优先提取价税合计/实付金额
+        invoice_amount = ""
+        
+        # 第一优先级：价税合计相关
+        priority_patterns = [
+            r'价税合计[：:][^￥¥\d]*[￥¥]?\s*([0-9]+\.?[0-9]*)',  # 价税合计：123.45
+            r'价税合计[：:][^￥¥\d]*([0-9]+\.?[0-9]*)\s*[￥¥]?',  # 价税合计：￥123.45
+            r'实付金额[：:][^￥¥\d]*[￥¥]?\s*([0-9]+\.?[0-9]*)',  # 实付金额：123.45
+            r'实付[：:][^￥¥\d]*[￥¥]?\s*([0-9]+\.?[0-9]*)',     # 实付：123.45
+            r'应付金额[：:][^￥¥\d]*[￥¥]?\s*([0-9]+\.?[0-9]*)', # 应付金额：123.45
+            r'总计[：:][^￥¥\d]*[￥¥]?\s*([0-9]+\.?[0-9]*)',     # 总计：123.45
+            r'总金额[：:][^￥¥\d]*[￥¥]?\s*([0-9]+\.?[0-9]*)',   # 总金额：123.45
+        ]
+        
+        # 尝试第一优先级模式
+        for pattern in priority_patterns:
+            amount_matches = re.findall(pattern, text)
+            if amount_matches:
+                valid_amounts = []
+                for amount_str in amount_matches:
+                    try:
+                        amount = float(amount_str)
+                        # 过滤掉可能的错误匹配（比如日期数字）
+                        if amount >= 0.01 and amount <= 999999999:  # 限制合理范围
+                            valid_amounts.append(amount)
+                    except ValueError:
+                        continue
+                
+                if valid_amounts:
+                    invoice_amount = max(valid_amounts)  # 取最大的金额作为发票总额
+                    print(f"通过优先模式提取到发票金额: {invoice_amount} (模式: {pattern})")
+                    break
+        
+        # 第二优先级：如果没有找到价税合计，尝试其他模式
+        if not invoice_amount:
+            secondary_patterns = [
+                r'合计[：:][^￥¥\d]*[￥¥]?\s*([0-9]+\.?[0-9]*)',     # 合计：123.45
+                r'小写[：:][^￥¥\d]*[￥¥]?\s*([0-9]+\.?[0-9]*)',     # 小写：123.45
+                r'金额[（\(]含税[）\)][：:][^￥¥\d]*[￥¥]?\s*([0-9]+\.?[0-9]*)', # 金额（含税）：123.45
+            ]
+            
+            for pattern in secondary_patterns:
+                amount_matches = re.findall(pattern, text)
+                if amount_matches:
+                    valid_amounts = []
+                    for amount_str in amount_matches:
+                        try:
+                            amount = float(amount_str)
+                            if amount >= 0.01 and amount <= 999999999:
+                                valid_amounts.append(amount)
+                        except ValueError:
+                            continue
+                    
+                    if valid_amounts:
+                        invoice_amount = max(valid_amounts)
+                        print(f"通过次要模式提取到发票金额: {invoice_amount} (模式: {pattern})")
+                        break
+        
+        # 第三优先级：通用金额模式（最后备用）
+        if not invoice_amount:
+            fallback_patterns = [
+                r'[￥¥]\s*([0-9]+\.?[0-9]*)',  # ￥123.45
+            ]
+            
+            for pattern in fallback_patterns:
+                amount_matches = re.findall(pattern, text)
+                if amount_matches:
+                    # 对于通用模式，取最后一个（通常是价税合计）
+                    try:
+                        amount = float(amount_matches[-1])  # 取最后一个金额
+                        if amount >= 0.01 and amount <= 999999999:
+                            invoice_amount = amount
+                            print(f"通过备用模式提取到发票金额: {invoice_amount} (最后一个金额)")
+                            break
+                    except ValueError:
+                        continue
+    except Exception as e:
+        print(f"发票金额提取失败: {e}")
+    
+    try:
+        # 提取项目名称 - 根据用户描述格式【*体育用品*Keep动感单车】
+        # 匹配包含*的项目名称格式
+        project_patterns = [
+            r'【\*([^\*】]+)\*([^\*】]+)】',  # 格式如【*体育用品*Keep动感单车】
+            r'项目名称[：:]\s*([^\n\r【】]+?)(?=\s*【|$)',
+            r'项目[：:]\s*([^\n\r【】]+?)(?=\s*【|$)',
+            r'商品名称[：:]\s*([^\n\r【】]+?)(?=\s*【|$)',
+            r'名称[：:]\s*([^\n\r【】]+?)(?=\s*【|$)',
+            r'服务名称[：:]\s*([^\n\r【】]+?)(?=\s*【|$)',
+            r'费用名称[：:]\s*([^\n\r【】]+?)(?=\s*【|$)',
+        ]
+        
+        for pattern in project_patterns:
+            project_matches = re.findall(pattern, text)
+            print(f"项目名称模式 '{pattern}' 匹配结果: {project_matches}")
+            if project_matches:
+                if isinstance(project_matches[0], tuple) and len(project_matches[0]) >= 2:
+                    # 对于【*体育用品*Keep动感单车】格式，取第二部分作为项目名称
+                    project_name = project_matches[0][1].strip()
+                else:
+                    project_name = project_matches[0].strip() if isinstance(project_matches[0], str) else str(project_matches[0]).strip()
+                
+                # 清理项目名称
+                project_name = re.sub(r'[【】\*]', '', project_name).strip()
+                if project_name and len(project_name) > 1:
+                    print(f"提取到项目名称: {project_name}")
+                    break
+                else:
+                    project_name = ''
+    except Exception as e:
+        print(f"项目名称提取失败: {e}")
+    
+    result = [image_path, company_name, invoice_number, invoice_date, invoice_amount, project_name]
+    print(f"最终提取结果: {result}")
+    return result
+
+
+def _throughput(extract, corpus, repeat):
+    """取多轮中最快的一轮，返回 条/秒"""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for index, text in enumerate(corpus):
+            extract(text, f"page_{index}.png")
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return len(corpus) / best
+
+
+def _bulk_check(extractor, corpus, repeat):
+    """整列批量提取与逐页提取逐条核对，返回 (条/秒, 不一致的 [(文本, 逐页, 批量)])"""
+    from BulkExtractor import bulk_results, extract_bulk  # 延迟导入（需要 pandas）
+    paths = ["p"] * len(corpus)
+    extract_bulk(corpus[:100])  # 预热：导入 pandas
+    best, frame = None, None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        frame = extract_bulk(corpus)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    mismatches = [(text, expected, actual) for text, expected, actual in
+                  zip(corpus, (extractor.extract(text, "p") for text in corpus), bulk_results(frame, paths))
+                  if expected != actual]
+    return len(corpus) / best, mismatches
+
+
+def main(argv=None):
+    argv = list(sys.argv[1:] if argv is None else argv)
+    options = {name.lstrip("-"): value for name, value in zip(argv[::2], argv[1::2])}
+    count = int(options.get("count", 2000))
+    repeat = int(options.get("repeat", 3))
+    corpus = build_corpus(count, int(options.get("seed", 7)))
+    engine = options.get("engine", "re")
+    extractor = InvoiceFieldExtractor(debug=False, engine=load_regex_engine(engine))
+
+    with open(os.devnull, "w", encoding="utf-8") as devnull, contextlib.redirect_stdout(devnull):
+        mismatches = [(text, expected, actual) for text, expected, actual in
+                      ((text, legacy_extract_invoice_info(text, "p"), extractor.extract(text, "p"))
+                       for text in corpus) if expected != actual]
+        before = _throughput(legacy_extract_invoice_info, corpus, repeat)
+    after = _throughput(extractor.extract, corpus, repeat)
+
+    print(f"语料: {count} 条，平均 {sum(map(len, corpus)) / max(1, count):.0f} 字符")
+    print(f"原实现:   {before:10.0f} 条/秒")
+    print(f"提取引擎: {after:10.0f} 条/秒  (x{after / before:.1f}，{extractor.engine_name})")
+    if options.get("profile", "0") not in ("0", ""):
+        profiled, profiler = profile_corpus(corpus, {"engine": engine, "time_budget_ms": 0})
+        print(profiler.report(profiled.all_rules))
+    if mismatches:
+        print(f"结果不一致: {len(mismatches)} 条")
+        for text, expected, actual in mismatches[:5]:
+            print(f"  {text}\n    原实现: {expected}\n    引擎:   {actual}")
+        return 1
+    print("结果一致")
+    if options.get("bulk", "0") not in ("0", ""):
+        bulk, bulk_mismatches = _bulk_check(extractor, corpus, repeat)
+        print(f"批量提取: {bulk:10.0f} 条/秒  (x{bulk / after:.1f}，对比逐页提取)")
+        if bulk_mismatches:
+            print(f"批量提取结果不一致: {len(bulk_mismatches)} 条")
+            for text, expected, actual in bulk_mismatches[:5]:
+                print(f"  {text}\n    逐页: {expected}\n    批量: {actual}")
+            return 1
+        print("批量提取结果一致")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -6,13 +6,23 @@
 用法：
   python diagnose.py            # 基础检查（依赖/模型）
   python diagnose.py --ocr      # 额外：尝试初始化 OCR 引擎
+  python diagnose.py --workers  # 额外：启动 fork-server 工作池，识别会触发高精复核的页面，报告各进程独占内存（USS，仅 Linux）
+  python diagnose.py --startup  # 启动导入耗时预算检查（-X importtime），超出预算时返回非零退出码
+  python diagnose.py --dedup    # 重复发票预检核对：多页发票的续页不被当作重复页跳过
 """
 
 import sys
 import json
 import platform
+import subprocess
 from pathlib import Path
 
+# 启动导入预算：GUI 主模块导入时不得加载的重量级依赖，以及导入总耗时上限
+STARTUP_HEAVY_MODULES = ("paddle", "paddleocr", "paddlex", "pandas", "numpy", "cv2", "fitz")
+STARTUP_IMPORT_BUDGET_MS = 1500
+# --workers：复核一页后工作进程独占内存的增长上限（超过说明工作进程各自加载了高精引擎）
+REFINE_USS_GROWTH_MB = 150
+
 
 def check_imports():
     status = {}
@@ -66,8 +76,118 @@ def try_initialize_ocr(mode: str = "快速"):
         return f"ERROR: {e}"
 
 
+def check_startup_imports(module: str = "InvoiceVision"):
+    """用 -X importtime 测量导入主模块的耗时，并检查是否提前加载了重量级依赖"""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True, cwd=str(Path(__file__).parent),
+    )
+    if proc.returncode != 0:
+        return False, {"error": proc.stderr.strip().splitlines()[-1:] or ["导入失败"]}
+
+    entries = []
+    for line in proc.stderr.splitlines():
+        # 格式: "import time:       self [us] |  cumulative | imported package"
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        parts = line[len("import time:"):].split("|")
+        if len(parts) != 3:
+            continue
+        name = parts[2].strip()
+        entries.append((name, int(parts[1].strip())))
+
+    total_us = next((cum for name, cum in entries if name == module), 0)
+    heavy = sorted({name.split(".")[0] for name, _ in entries
+                    if name.split(".")[0] in STARTUP_HEAVY_MODULES})
+    slowest = sorted(entries, key=lambda e: e[1], reverse=True)[:10]
+    report = {
+        "total_ms": round(total_us / 1000, 1),
+        "budget_ms": STARTUP_IMPORT_BUDGET_MS,
+        "heavy_modules": heavy,
+        "slowest": [(name, round(cum / 1000, 1)) for name, cum in slowest],
+    }
+    ok = not heavy and total_us / 1000 <= STARTUP_IMPORT_BUDGET_MS
+    return ok, report
+
+
+def _render_refine_page(folder):
+    """生成一页只有发票标题、没有号码/日期/金额的图片：关键字段为空，识别后会用高精引擎复核"""
+    import fitz  # 延迟导入
+    document = fitz.open()
+    page = document.new_page()
+    page.insert_text((72, 72), "电子发票（普通发票）", fontname="china-s", fontsize=20)
+    page.insert_text((72, 120), "购买方名称：自检测试", fontname="china-s", fontsize=14)
+    path = str(Path(folder) / "refine.png")
+    page.get_pixmap(matrix=fitz.Matrix(2, 2)).save(path)
+    document.close()
+    return path
+
+
+def try_worker_pool(mode: str = "快速"):
+    """启动工作池，每个工作进程识别一页触发复核的图片，返回复核前后的各进程内存"""
+    try:
+        import tempfile
+        from OCRWorkerPool import OCRWorkerPool
+        if not OCRWorkerPool.is_supported():
+            return "SKIP: 仅支持 Linux"
+        with tempfile.TemporaryDirectory() as folder, OCRWorkerPool(precision_mode=mode) as pool:
+            before = pool.memory_report()
+            results = pool.run_ocr_batch([_render_refine_page(folder)] * pool.workers, max_batch=1)
+            return {
+                "startup_seconds": round(pool.startup_seconds, 2),
+                "processes": before,
+                "after_refine": pool.memory_report(),
+                "refined": sum(1 for row in results if row and isinstance(row[-1], dict) and row[-1].get("refined")),
+            }
+    except Exception as e:
+        return f"ERROR: {e}"
+
+
+def check_dedup():
+    """重复发票预检核对：两页同号的发票整份识别；另一份同号的文件整份跳过"""
+    import tempfile
+    import fitz  # 延迟导入
+    from DuplicateProbe import DuplicateFilter
+
+    config = {"skip_identical_files": True, "probe_numbers": True, "probe_qr": False}
+    with tempfile.TemporaryDirectory() as folder:
+        paths = []
+        for name, pages in (("两页发票.pdf", ("第1页", "第2页 价税合计")), ("重复发票.pdf", ("另一份",))):
+            document = fitz.open()
+            for text in pages:
+                document.new_page().insert_text((72, 72), f"No: 12345678 {text}")
+            path = str(Path(folder) / name)
+            document.save(path)
+            document.close()
+            paths.append(path)
+        duplicates = DuplicateFilter(config=config)
+        first, second = duplicates.check_pdf(paths[0]), duplicates.check_pdf(paths[1])
+    problems = []
+    if first.skipped_pages:
+        problems.append(f"多页发票的续页被跳过: {first.skipped_pages}")
+    if sorted(second.skipped_pages) != [0]:
+        problems.append(f"同号的另一份文件未跳过: {second.skipped_pages}")
+    return not problems, problems
+
+
 def main():
     want_ocr = "--ocr" in sys.argv
+    want_workers = "--workers" in sys.argv
+
+    if "--startup" in sys.argv:
+        print("=== 启动导入预算检查 ===")
+        ok, report = check_startup_imports()
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+        print("通过" if ok else "未通过：启动时导入了重量级依赖或超出耗时预算")
+        sys.exit(0 if ok else 1)
+
+    if "--dedup" in sys.argv:
+        print("=== 重复发票预检核对 ===")
+        ok, problems = check_dedup()
+        for problem in problems:
+            print(f" - {problem}")
+        print("通过" if ok else "未通过")
+        sys.exit(0 if ok else 1)
 
     print("=== InvoiceVision 自检 ===")
     print(f"Python: {platform.python_version()} | {platform.platform()}")
@@ -88,6 +208,26 @@ def main():
     else:
         print("\n跳过 OCR 初始化（添加 --ocr 以尝试）")
 
+    if want_workers:
+        print("\n[附加] fork-server 工作池内存（快速模式）…")
+        res = try_worker_pool("快速")
+        if isinstance(res, dict):
+            print(f" - 启动耗时: {res['startup_seconds']} 秒")
+            print(f" - 高精复核: {res['refined']} 页")
+            grown = []
+            for pid, mem in res["processes"].items():
+                uss_mb = mem.get("uss", 0) / 1024 / 1024
+                pss_mb = mem.get("pss", 0) / 1024 / 1024
+                after_mb = res["after_refine"].get(pid, {}).get("uss", 0) / 1024 / 1024
+                print(f" - {mem['role']} {pid}: USS {uss_mb:.1f} MB -> 复核后 {after_mb:.1f} MB | PSS {pss_mb:.1f} MB")
+                if mem["role"] == "worker" and after_mb - uss_mb > REFINE_USS_GROWTH_MB:
+                    grown.append(pid)
+            if grown:
+                print(f" - 警告: 工作进程 {grown} 复核后独占内存增加超过 {REFINE_USS_GROWTH_MB} MB，"
+                      "复核引擎可能未在 fork 前创建")
+        else:
+            print(f" - {res}")
+
     print("\n完成。")
 
 
@@ -72,6 +72,28 @@ class InvoiceVisionPackager:
         core_files = [
             'InvoiceVision.py',
             'OCRInvoice.py', 
+            'FieldExtractor.py',
+            'BulkExtractor.py',
+            'PageLayout.py',
+            'InvoiceTemplates.py',
+            'FieldConfidence.py',
+            'SellerIndex.py',
+            'OCRStages.py',
+            'OCRWorkerPool.py',
+            'OCRDaemon.py',
+            'ResultTableModel.py',
+            'ResultIndex.py',
+            'InvoiceStore.py',
+            'DuplicateProbe.py',
+            'LogView.py',
+            'StructuredLog.py',
+            'ProgressTracker.py',
+            'JobQueue.py',
+            'IngestPipeline.py',
+            'Cancellation.py',
+            'ResultExporter.py',
+            'ResultSummary.py',
+            'PagePreview.py',
             'MainAction.py',
             'PDF2IMG.py',
             'ModelManager.py',
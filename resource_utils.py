@@ -6,8 +6,18 @@
 
 import os
 import sys
+import json
+import logging
 from pathlib import Path
 
+from StructuredLog import ROOT_LOGGER
+
+# 不经 get_logger：结构化日志本身也用本模块读取配置
+log = logging.getLogger(f"{ROOT_LOGGER}.resource_utils")
+
+# 支持识别的图片格式
+SUPPORTED_IMAGE_FORMATS = ('.jpg', '.jpeg', '.png', '.bmp', '.tiff', '.webp')
+
 def get_resource_path(relative_path):
     """获取资源文件的绝对路径，支持PyInstaller打包环境"""
     try:
@@ -56,6 +66,22 @@ def get_config_path():
         # 开发环境
         return get_resource_path("offline_config.json")
 
+def load_config_section(name, defaults):
+    """读取配置文件中的一节，覆盖默认参数（仅解析JSON，不导入OCR模块）；文件不存在或读取失败时用默认参数"""
+    config = dict(defaults)
+    config_file = Path(get_config_path())
+    if config_file.exists():
+        try:
+            with open(config_file, 'r', encoding='utf-8') as f:
+                config.update(json.load(f).get(name) or {})
+        except Exception as e:
+            log.warning("配置文件 \"%s\" 节读取失败，使用默认配置: %s", name, e)
+    return config
+
+def list_image_files(folder_path):
+    """列出文件夹中支持的图片文件名"""
+    return [f for f in os.listdir(folder_path) if f.lower().endswith(SUPPORTED_IMAGE_FORMATS)]
+
 def init_models_config():
     """初始化模型配置，适配打包环境"""
     models_path = get_models_path()